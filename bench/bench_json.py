@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+JSON encoding and response compression benchmark.
+
+Builds payloads shaped like DashBorg's largest responses (/api/jobs, /api/archives?limit=100
+and a job detail with its output log) and measures, per payload:
+
+    - encode CPU time with the stdlib encoder and with orjson (if installed)
+    - response size and compression CPU time for gzip and zstd (if installed)
+
+Usage:
+    pip install -r bench/requirements.txt
+    python bench/bench_json.py --output json_results.json
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "webapi"))
+
+from compression import GZIP_LEVEL, ZSTD_LEVEL  # noqa: E402
+from run_bench import git_version  # noqa: E402
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def output_log(lines: int) -> str:
+    return "\n".join(f"{'AMU'[i % 3]} /home/user/projects/dir{i // 500:04d}/file{i:07d}.txt" for i in range(lines))
+
+
+def job_payload(index: int, output_lines: int) -> dict:
+    created = datetime(2024, 1, 1) + timedelta(hours=index)
+    return {
+        "id": f"6f1c2d3e-0000-4000-8000-{index:012d}",
+        "type": "backup-create",
+        "command": "borgmatic create --config /etc/borgmatic/config.yaml --verbosity 1 --list --stats",
+        "config": "config.yaml",
+        "status": "completed",
+        "created_at": created.isoformat(),
+        "started_at": created.isoformat(),
+        "completed_at": (created + timedelta(minutes=7)).isoformat(),
+        "return_code": 0,
+        "output": output_log(output_lines),
+        "error": None,
+        "stats": {
+            "archive": {"name": f"host-{created:%Y-%m-%dT%H:%M:%S}", "stats": {"original_size": 123456789, "nfiles": output_lines}},
+            "repository": {"id": "a" * 64, "location": "ssh://backup@example.com/./repo"}
+        },
+        "progress_info": {"files_processed": output_lines, "current_file": None, "last_update": created.isoformat()}
+    }
+
+
+def archives_payload(count: int) -> dict:
+    return {
+        "total": 10000,
+        "limit": count,
+        "offset": 0,
+        "archives": [
+            {
+                "id": i,
+                "name": f"host-{datetime(2024, 1, 1) + timedelta(days=i):%Y-%m-%dT%H:%M:%S}",
+                "repository": "offsite",
+                "start": (datetime(2024, 1, 1) + timedelta(days=i)).isoformat(),
+                "duration": 421.5 + i,
+                "original_size": 52428800000 + i * 1048576,
+                "compressed_size": 31457280000 + i * 524288,
+                "deduplicated_size": 104857600 + i * 4096,
+                "nfiles": 250000 + i,
+                "hostname": "host"
+            }
+            for i in range(count)
+        ]
+    }
+
+
+def measure(function, repeat: int) -> tuple:
+    """Run function repeat times; returns (result, CPU seconds per call)."""
+    start = time.process_time()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.process_time() - start) / repeat
+
+
+def bench_payload(payload, repeat: int) -> dict:
+    results = {}
+    body, cpu = measure(lambda: json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), repeat)
+    results["encode"] = {"stdlib_ms": round(cpu * 1000, 3)}
+    if orjson is not None:
+        _, cpu = measure(lambda: orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS), repeat)
+        results["encode"]["orjson_ms"] = round(cpu * 1000, 3)
+        results["encode"]["speedup"] = round(results["encode"]["stdlib_ms"] / max(results["encode"]["orjson_ms"], 1e-6), 1)
+
+    results["bytes"] = {"identity": len(body)}
+    results["compress_ms"] = {}
+    compressors = {"gzip": lambda: gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)}
+    if zstandard is not None:
+        compressors["zstd"] = lambda: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    for encoding, compressor in compressors.items():
+        compressed, cpu = measure(compressor, repeat)
+        results["bytes"][encoding] = len(compressed)
+        results["compress_ms"][encoding] = round(cpu * 1000, 3)
+        results["bytes"][f"{encoding}_saved_pct"] = round(100 * (1 - len(compressed) / len(body)), 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=50, help="jobs in the /api/jobs payload")
+    parser.add_argument("--job-output-lines", type=int, default=1000, help="output lines per listed job")
+    parser.add_argument("--detail-output-lines", type=int, default=100000, help="output lines of the job detail payload")
+    parser.add_argument("--archives", type=int, default=100, help="archives in the /api/archives payload")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default="json_results.json", help="where to write JSON results")
+    args = parser.parse_args()
+
+    payloads = {
+        "/api/jobs": [job_payload(i, args.job_output_lines) for i in range(args.jobs)],
+        "/api/archives?limit=100": archives_payload(args.archives),
+        "/api/jobs/{id}": job_payload(0, args.detail_output_lines),
+    }
+    results = {
+        "version": git_version(),
+        "timestamp": datetime.now().isoformat(),
+        "parameters": vars(args),
+        "orjson": orjson is not None,
+        "zstandard": zstandard is not None,
+        "payloads": {name: bench_payload(payload, args.repeat) for name, payload in payloads.items()},
+    }
+
+    with open(os.path.abspath(args.output), "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results["payloads"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Capture the retention parity fixtures from real borg.
+
+Creates a throwaway unencrypted repository, adds archives with back-dated timestamps for each
+case below, and stores the archive list and a dry-run prune of each case under
+bench/fixtures/retention/<case>/:
+
+    archives.json   borg list --json
+    prune.txt       borg prune --dry-run --list (stderr)
+    case.json       policy, the time the prune ran, borg version and time zone
+
+Everything runs with TZ=UTC so the fixtures replay the same anywhere. Needs borg on PATH
+(or --borg); takes a few minutes, as every archive is a borg create.
+
+    python bench/capture_retention_fixtures.py
+    python bench/retention_parity.py --fixtures bench/fixtures/retention
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures", "retention")
+
+
+def daily_schedule(now):
+    """Fourteen months of nightly archives: some nights skipped, some with a second run."""
+    rng = random.Random(1)
+    start = datetime(2023, 5, 1, 2, 0)
+    times = []
+    for day in range(427):
+        night = start + timedelta(days=day, minutes=rng.randrange(50), seconds=rng.randrange(60))
+        if rng.random() < 0.1:
+            continue
+        times.append(night)
+        if rng.random() < 0.05:
+            times.append(night + timedelta(hours=12, minutes=rng.randrange(30)))
+    return [(time, "", "") for time in times]
+
+
+def oldest_schedule(now):
+    """Ten weekly archives: fewer months than keep_monthly asks for, so the oldest is kept too."""
+    return [(datetime(2024, 3, 4, 3, 15) + timedelta(weeks=week), "", "") for week in range(10)]
+
+
+def within_schedule(now):
+    """Archives every six hours for the last three weeks, relative to the capture time."""
+    return [(now - timedelta(hours=6 * step, minutes=17), "", "") for step in range(84)]
+
+
+def checkpoint_schedule(now):
+    """Nightly archives with interrupted runs: old checkpoints and a checkpoint newer than the last archive."""
+    start = datetime(2024, 2, 1, 1, 30)
+    times = [(start + timedelta(days=day), "", "") for day in range(20)]
+    times += [
+        (start + timedelta(days=4, hours=-1), "", ".checkpoint"),
+        (start + timedelta(days=11, hours=-1), "", ".checkpoint"),
+        (start + timedelta(days=11, hours=-1, minutes=20), "", ".checkpoint.1"),
+        (start + timedelta(days=19, hours=3), "", ".checkpoint"),
+    ]
+    return times
+
+
+def hourly_schedule(now):
+    """Two hosts backing up hourly into one repository; the prune only covers one of them."""
+    start = datetime(2024, 4, 1, 0, 5)
+    times = []
+    for hour in range(24 * 7):
+        times.append((start + timedelta(hours=hour), "web-", ""))
+        times.append((start + timedelta(hours=hour, minutes=20), "db-", ""))
+    return times
+
+
+# Case -> (archive name prefix, schedule of (time, host prefix, checkpoint suffix), policy)
+CASES = {
+    "daily-weekly-monthly": ("dwm-", daily_schedule, {"keep_daily": 7, "keep_weekly": 4, "keep_monthly": 6, "keep_yearly": 1}),
+    "oldest": ("old-", oldest_schedule, {"keep_weekly": 4, "keep_monthly": 12}),
+    "keep-within": ("kw-", within_schedule, {"keep_within": "7d", "keep_daily": 5, "keep_weekly": 2}),
+    "checkpoints": ("cp-", checkpoint_schedule, {"keep_daily": 5}),
+    "hourly-match-archives": ("hm-", hourly_schedule, {"keep_hourly": 24, "keep_daily": 7, "match_archives": "hm-web-*"}),
+}
+
+
+def borg(args, env, **kwargs):
+    return subprocess.run(args, env=env, check=True, text=True, **kwargs)
+
+
+def capture(borg_path: str, names):
+    work = tempfile.mkdtemp(prefix="retention-fixtures-")
+    env = {
+        **os.environ,
+        "TZ": "UTC",
+        "BORG_BASE_DIR": os.path.join(work, "home"),
+        "BORG_REPO": os.path.join(work, "repo"),
+        "BORG_UNKNOWN_UNENCRYPTED_REPO_ACCESS_IS_OK": "yes",
+    }
+    try:
+        source = os.path.join(work, "source")
+        os.makedirs(source)
+        with open(os.path.join(source, "file"), "w") as f:
+            f.write("retention fixture\n")
+        borg([borg_path, "init", "--encryption", "none"], env)
+        version = borg([borg_path, "--version"], env, capture_output=True).stdout.split()[-1]
+
+        for case in names:
+            prefix, schedule, policy = CASES[case]
+            now = datetime.utcnow().replace(microsecond=0)
+            for time, host, suffix in schedule(now):
+                name = f"{prefix}{host}{time.strftime('%Y-%m-%dT%H:%M:%S')}{suffix}"
+                borg([borg_path, "create", "--timestamp", time.isoformat(), f"::{name}", "."], env, cwd=source)
+
+            directory = os.path.join(FIXTURES_DIR, case)
+            os.makedirs(directory, exist_ok=True)
+            listing = borg([borg_path, "list", "--json", "--consider-checkpoints", "--glob-archives", f"{prefix}*"], env, capture_output=True).stdout
+            with open(os.path.join(directory, "archives.json"), "w") as f:
+                json.dump(json.loads(listing), f, indent=1)
+                f.write("\n")
+
+            prune = [borg_path, "prune", "--dry-run", "--list", "--glob-archives", policy.get("match_archives", f"{prefix}*")]
+            for key, value in policy.items():
+                if key.startswith("keep_"):
+                    prune += [f"--{key.replace('_', '-')}", str(value)]
+            ran_at = datetime.utcnow().replace(microsecond=0)
+            output = borg(prune, env, capture_output=True).stderr
+            with open(os.path.join(directory, "prune.txt"), "w") as f:
+                f.write(output)
+            with open(os.path.join(directory, "case.json"), "w") as f:
+                json.dump({"policy": policy, "now": ran_at.isoformat(), "tz": "UTC", "borg_version": version, "command": " ".join(prune[1:])}, f, indent=2)
+                f.write("\n")
+            print(f"{case}: {len(json.loads(listing)['archives'])} archives, {output.count(chr(10))} prune lines")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--borg", default="borg", help="borg executable")
+    parser.add_argument("cases", nargs="*", help=f"cases to capture (default: all of {', '.join(CASES)})")
+    args = parser.parse_args()
+    unknown = [case for case in args.cases if case not in CASES]
+    if unknown:
+        sys.exit(f"Unknown case(s): {', '.join(unknown)}")
+    capture(args.borg, args.cases or list(CASES))
+
+
+if __name__ == "__main__":
+    main()
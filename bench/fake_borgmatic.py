@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Deterministic stand-in for borgmatic, used by the DashBorg benchmarks and load tests.
+
+Put a symlink named "borgmatic" to this file first on PATH. Output shape follows
+borgmatic 1.9 / borg 1.4; the scale and timing are set with environment variables:
+
+    FAKE_BORGMATIC_REPOSITORIES     repositories per config (default 1)
+    FAKE_BORGMATIC_ARCHIVES         archives per repository (default 100)
+    FAKE_BORGMATIC_FILES            files listed per "create --list" (default 100000)
+    FAKE_BORGMATIC_ARCHIVE_INTERVAL hours between archives (default 24)
+    FAKE_BORGMATIC_SEED             seed for sizes, IDs and file statuses (default 1)
+    FAKE_BORGMATIC_STARTUP_DELAY    seconds of startup per invocation (default 0.3)
+    FAKE_BORGMATIC_LATENCY          extra seconds per repository access, e.g. SSH (default 0)
+    FAKE_BORGMATIC_FILES_PER_SECOND throttle for "create --list" output, 0 = unthrottled (default 0)
+    FAKE_BORGMATIC_FILE_SIZE        bytes returned by "extract --stdout" (default 1048576)
+    FAKE_BORGMATIC_STATE            optional file recording created archives across invocations
+"""
+import hashlib
+import io
+import json
+import os
+import random
+import signal
+import sys
+import tarfile
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+REPOSITORIES = int(os.getenv("FAKE_BORGMATIC_REPOSITORIES", "1"))
+ARCHIVES = int(os.getenv("FAKE_BORGMATIC_ARCHIVES", "100"))
+FILES = int(os.getenv("FAKE_BORGMATIC_FILES", "100000"))
+ARCHIVE_INTERVAL = float(os.getenv("FAKE_BORGMATIC_ARCHIVE_INTERVAL", "24"))
+SEED = int(os.getenv("FAKE_BORGMATIC_SEED", "1"))
+STARTUP_DELAY = float(os.getenv("FAKE_BORGMATIC_STARTUP_DELAY", "0.3"))
+LATENCY = float(os.getenv("FAKE_BORGMATIC_LATENCY", "0"))
+FILES_PER_SECOND = float(os.getenv("FAKE_BORGMATIC_FILES_PER_SECOND", "0"))
+FILE_SIZE = int(os.getenv("FAKE_BORGMATIC_FILE_SIZE", str(1024 * 1024)))
+STATE_FILE = os.getenv("FAKE_BORGMATIC_STATE")
+
+BASE_TIME = datetime(2020, 1, 1, 3, 0, 0)
+HOSTNAME = "fakehost"
+ACTIONS = {
+    "create", "prune", "compact", "check", "info", "list", "rlist", "mount", "umount",
+    "extract", "export-tar", "borg", "config", "repo-create", "init",
+}
+
+
+def option(args, name, default=None):
+    """Value of a command line option such as --archive NAME."""
+    if name in args:
+        index = args.index(name)
+        if index + 1 < len(args):
+            return args[index + 1]
+    return default
+
+
+def digest(*parts) -> str:
+    return hashlib.sha256(":".join(str(p) for p in (SEED,) + parts).encode()).hexdigest()
+
+
+def repositories(args):
+    """Repositories of the config, optionally narrowed by --repository."""
+    repos = []
+    for index in range(1, REPOSITORIES + 1):
+        label = f"repo{index}"
+        location = f"/destination/{label}" if index == 1 else f"ssh://backup@remote{index}.example.com/./{label}"
+        repos.append({"label": label, "location": location, "id": digest("repo", index), "index": index})
+    selected = option(args, "--repository")
+    if selected:
+        repos = [r for r in repos if selected in (r["label"], r["location"])]
+    return repos
+
+
+def archive_record(repo, index, created=None):
+    """Full archive record as returned by borg info --json."""
+    rng = random.Random(f"{SEED}:{repo['index']}:{index}")
+    start = created or BASE_TIME + timedelta(hours=ARCHIVE_INTERVAL * index, seconds=rng.randint(0, 600))
+    duration = round(rng.uniform(60, 3600), 6)
+    nfiles = FILES + rng.randint(-FILES // 100, FILES // 100 + 1)
+    original_size = nfiles * rng.randint(50_000, 150_000)
+    name = f"{HOSTNAME}-{start.strftime('%Y-%m-%dT%H:%M:%S')}"
+    return {
+        "name": name,
+        "id": digest("archive", repo["index"], name),
+        "start": start.strftime("%Y-%m-%dT%H:%M:%S.%f"),
+        "end": (start + timedelta(seconds=duration)).strftime("%Y-%m-%dT%H:%M:%S.%f"),
+        "duration": duration,
+        "hostname": HOSTNAME,
+        "username": "root",
+        "comment": "",
+        "command_line": ["borg", "create", f"{repo['location']}::{name}", "/source"],
+        "limits": {"max_archive_size": 0.0001},
+        "stats": {
+            "original_size": original_size,
+            "compressed_size": int(original_size * rng.uniform(0.4, 0.8)),
+            "deduplicated_size": int(original_size * rng.uniform(0.001, 0.05)),
+            "nfiles": nfiles,
+        },
+    }
+
+
+def load_created(repo):
+    """Archives recorded by earlier fake "create" runs."""
+    if not STATE_FILE or not os.path.exists(STATE_FILE):
+        return []
+    with open(STATE_FILE) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [r["archive"] for r in records if r["repository"] == repo["label"]]
+
+
+def archives(repo):
+    """All archives of a repository; the generated part is cached on disk between invocations."""
+    cache_path = os.path.join(
+        tempfile.gettempdir(),
+        f"fake-borgmatic-{digest('cache', repo['index'], ARCHIVES, FILES, ARCHIVE_INTERVAL)[:16]}.json"
+    )
+    try:
+        with open(cache_path) as f:
+            records = json.load(f)
+    except (OSError, ValueError):
+        records = [archive_record(repo, i) for i in range(ARCHIVES)]
+        with open(f"{cache_path}.{os.getpid()}", "w") as f:
+            json.dump(records, f)
+        os.replace(f"{cache_path}.{os.getpid()}", cache_path)
+    return records + load_created(repo)
+
+
+def repository_json(repo):
+    return {
+        "id": repo["id"],
+        "label": repo["label"],
+        "location": repo["location"],
+        "last_modified": (BASE_TIME + timedelta(hours=ARCHIVE_INTERVAL * ARCHIVES)).strftime("%Y-%m-%dT%H:%M:%S.%f"),
+    }
+
+
+def cache_json(repo_archives):
+    total_size = sum(a["stats"]["original_size"] for a in repo_archives)
+    unique_size = sum(a["stats"]["deduplicated_size"] for a in repo_archives) * 2
+    return {
+        "path": "/root/.cache/borg/fake",
+        "stats": {
+            "total_chunks": total_size // 500_000,
+            "total_csize": int(total_size * 0.6),
+            "total_size": total_size,
+            "total_unique_chunks": unique_size // 500_000,
+            "unique_csize": int(unique_size * 0.6),
+            "unique_size": unique_size,
+        },
+    }
+
+
+def select_archives(args, repo_archives):
+    name = option(args, "--archive")
+    if name == "latest":
+        return repo_archives[-1:]
+    if name:
+        return [a for a in repo_archives if a["name"] == name]
+    last = option(args, "--last")
+    if last:
+        return repo_archives[-int(last):]
+    return repo_archives
+
+
+def human_size(size: float) -> str:
+    for unit in ("B", "kB", "MB", "GB", "TB"):
+        if abs(size) < 1000 or unit == "TB":
+            return f"{size:.2f} {unit}" if unit != "B" else f"{int(size)} B"
+        size /= 1000
+
+
+# Per-file statuses repeat with a prime period so millions of lines cost no hashing
+_STATUS_ROLLS = [random.Random(f"{SEED}:status:{i}").randrange(100) for i in range(1009)]
+STATUSES = ["A" if roll < 3 else "M" if roll < 10 else "U" for roll in _STATUS_ROLLS]
+
+
+def do_list(args):
+    result = []
+    for repo in repositories(args):
+        time.sleep(LATENCY)
+        repo_archives = select_archives(args, archives(repo))
+        result.append({
+            "repository": repository_json(repo),
+            "encryption": {"mode": "repokey-blake2"},
+            "archives": [
+                {"archive": a["name"], "barchive": a["name"], "id": a["id"], "name": a["name"], "start": a["start"], "time": a["start"]}
+                for a in repo_archives
+            ],
+        })
+    print(json.dumps(result))
+
+
+def do_info(args):
+    result = []
+    for repo in repositories(args):
+        time.sleep(LATENCY)
+        repo_archives = archives(repo)
+        entry = {
+            "repository": repository_json(repo),
+            "encryption": {"mode": "repokey-blake2"},
+            "cache": cache_json(repo_archives),
+        }
+        if option(args, "--archive") or option(args, "--last"):
+            entry["archives"] = select_archives(args, repo_archives)
+        result.append(entry)
+    print(json.dumps(result))
+
+
+def do_create(args):
+    out = sys.stdout
+    for repo in repositories(args):
+        time.sleep(LATENCY)
+        out.write(f"{repo['label']}: Creating archive\n")
+        if "--list" in args:
+            batch = []
+            started = time.monotonic()
+            for index in range(FILES):
+                batch.append(f"{STATUSES[index % 1009]} /source/dir{index // 1000:05d}/file{index:08d}.dat\n")
+                if len(batch) == 1000:
+                    out.write("".join(batch))
+                    batch = []
+                    if FILES_PER_SECOND:
+                        ahead = (index + 1) / FILES_PER_SECOND - (time.monotonic() - started)
+                        if ahead > 0:
+                            out.flush()
+                            time.sleep(ahead)
+            out.write("".join(batch))
+
+        created = datetime.now().replace(microsecond=0)
+        archive = archive_record(repo, ARCHIVES + len(load_created(repo)), created=created)
+        if STATE_FILE:
+            with open(STATE_FILE, "a") as f:
+                f.write(json.dumps({"repository": repo["label"], "archive": archive}) + "\n")
+
+        repo_archives = archives(repo)
+        cache = cache_json(repo_archives)["stats"]
+        stats = archive["stats"]
+        if "--json" in args:
+            print(json.dumps({"archive": archive, "repository": repository_json(repo), "cache": cache_json(repo_archives)}))
+        elif "--stats" in args:
+            start = datetime.fromisoformat(archive["start"])
+            end = datetime.fromisoformat(archive["end"])
+            minutes, seconds = divmod(archive["duration"], 60)
+            out.write(
+                "------------------------------------------------------------------------------\n"
+                f"Repository: {repo['location']}\n"
+                f"Archive name: {archive['name']}\n"
+                f"Archive fingerprint: {archive['id']}\n"
+                f"Time (start): {start.strftime('%a, %Y-%m-%d %H:%M:%S')}\n"
+                f"Time (end):   {end.strftime('%a, %Y-%m-%d %H:%M:%S')}\n"
+                f"Duration: {int(minutes)} minutes {seconds:.2f} seconds\n"
+                f"Number of files: {stats['nfiles']}\n"
+                "Utilization of max. archive size: 0%\n"
+                "------------------------------------------------------------------------------\n"
+                "                       Original size      Compressed size    Deduplicated size\n"
+                f"This archive:   {human_size(stats['original_size']):>20} {human_size(stats['compressed_size']):>20} {human_size(stats['deduplicated_size']):>20}\n"
+                f"All archives:   {human_size(cache['total_size']):>20} {human_size(cache['total_csize']):>20} {human_size(cache['unique_csize']):>20}\n"
+                "\n"
+                "                       Unique chunks         Total chunks\n"
+                f"Chunk index:    {cache['total_unique_chunks']:>20} {cache['total_chunks']:>20}\n"
+                "------------------------------------------------------------------------------\n"
+            )
+    out.flush()
+
+
+def do_prune(args):
+    for repo in repositories(args):
+        time.sleep(LATENCY)
+        print(f"{repo['label']}: Pruning archives{' (dry run; not making any changes)' if '--dry-run' in args else ''}")
+
+
+CHECKS = ("repository", "archives", "data", "extract", "spot")
+
+
+def do_check(args):
+    max_duration = option(args, "--max-duration")
+    checks = [args[i + 1] for i, arg in enumerate(args[:-1]) if arg == "--only"] or ["repository", "archives"]
+    unknown = [arg for arg in args if arg in ("--repository-only", "--archives-only", "--verify-data")] + [c for c in checks if c not in CHECKS]
+    if unknown:  # borg's check flags, which borgmatic doesn't accept
+        print(f"borgmatic: error: unrecognized arguments: {' '.join(unknown)}", file=sys.stderr)
+        sys.exit(2)
+    for repo in repositories(args):
+        time.sleep(LATENCY)
+        print(f"{repo['label']}: Running consistency checks")
+        if "repository" in checks or "data" in checks:
+            print("Starting repository check")
+            stop = 100 if not max_duration else min(100, 10 + int(digest("check", repo["index"], time.time() // 60)[:2], 16) % 120)
+            for percent in range(0, stop, 10):
+                print(f"Checking segments {percent:.1f}%")
+            if stop < 100:
+                print(f"finished partial segment check, last segment checked is {stop * 10}")
+            else:
+                print("finished segment check at segment 1000")
+            print(f"Finished {'partial' if max_duration else 'full'} repository check, no problems found.")
+        if "archives" in checks or "data" in checks:
+            print("Starting archive consistency check...")
+            print("Archive consistency check complete, no problems found.")
+        if "extract" in checks:
+            print(f"{repo['label']}: Extracting latest archive (dry run)")
+    sys.stdout.flush()
+
+
+def do_mount(args):
+    print(f"Mounting archive {option(args, '--archive')} at {option(args, '--mount-point')}")
+    sys.stdout.flush()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    while True:
+        time.sleep(3600)
+
+
+def do_extract(args):
+    for repo in repositories(args)[:1]:
+        time.sleep(LATENCY)
+        for index in range(min(FILES, 1000)):
+            print(f"source/dir{index // 1000:05d}/file{index:08d}.dat")
+
+
+def do_export_tar(args):
+    """Write a small tar of synthetic files to stdout."""
+    out = sys.stdout.buffer
+    with tarfile.open(fileobj=out, mode="w|") as tar:
+        for index in range(min(FILES, 100)):
+            data = digest("content", index).encode() * (FILE_SIZE // 64 // 100 + 1)
+            info = tarfile.TarInfo(f"source/dir{index // 1000:05d}/file{index:08d}.dat")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+def do_borg(args):
+    if "diff" in args:
+        archive_names = [a for a in args[args.index("diff") + 1:] if not a.startswith("-")]
+        offset = int(digest("diff", archive_names)[:4], 16)
+        for index in range(FILES):
+            roll = _STATUS_ROLLS[(index + offset) % 1009] * 7 % 100
+            if roll >= 10:
+                continue
+            path = f"source/dir{index // 1000:05d}/file{index:08d}.dat"
+            if roll < 3:
+                changes = [{"type": "added", "size": 4096 + index}]
+            elif roll < 5:
+                changes = [{"type": "removed", "size": 4096 + index}]
+            else:
+                changes = [{"type": "modified", "added": 512, "removed": 256}, {"type": "mtime", "old_mtime": "a", "new_mtime": "b"}]
+            sys.stdout.write(json.dumps({"path": path, "changes": changes}) + "\n")
+    elif "extract" in args and "--stdout" in args:
+        out = sys.stdout.buffer
+        block = digest("content").encode() * 1024
+        remaining = FILE_SIZE
+        while remaining > 0:
+            out.write(block[:remaining])
+            remaining -= len(block)
+
+
+def do_config(args):
+    if "validate" in args:
+        print("All configuration files are valid.")
+
+
+def main():
+    args = sys.argv[1:]
+    time.sleep(STARTUP_DELAY)
+    action = next((a for a in args if a in ACTIONS), None)
+    handlers = {
+        "list": do_list, "rlist": do_list, "info": do_info, "create": do_create,
+        "prune": do_prune, "compact": do_prune, "check": do_check, "mount": do_mount,
+        "extract": do_extract, "export-tar": do_export_tar, "borg": do_borg, "config": do_config,
+    }
+    if action in handlers:
+        handlers[action](args)
+    elif action is None:
+        print("fake borgmatic: no action given", file=sys.stderr)
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except BrokenPipeError:
+        sys.exit(1)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+DashBorg concurrent-client load test.
+
+Starts the API under uvicorn against the fake borgmatic stand-in, then simulates
+--pollers browser tabs polling /api/jobs every --poll-interval seconds while
+--backups backup jobs run concurrently. Reports request throughput, latency
+percentiles, late polls and event loop blocking time (scraped from /metrics).
+
+Usage:
+    pip install -r bench/requirements.txt
+    python bench/load_test.py --pollers 100 --backups 4 --duration 60 --output load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import httpx
+
+from run_bench import BENCH_DIR, WEBAPI_DIR, git_version, percentiles
+
+METRIC_LINE = re.compile(r'^(\w+)(?:\{([^}]*)\})? (\S+)$')
+
+
+def prepare_workdir(args) -> tuple:
+    """Create a fake borgmatic on PATH, a fresh database and a fake UI build."""
+    workdir = tempfile.mkdtemp(prefix="dashborg-load-")
+    bin_dir = os.path.join(workdir, "bin")
+    os.makedirs(bin_dir)
+    os.symlink(os.path.join(BENCH_DIR, "fake_borgmatic.py"), os.path.join(bin_dir, "borgmatic"))
+    os.makedirs(os.path.join(workdir, "webui", "dist", "assets"))
+    with open(os.path.join(workdir, "webui", "dist", "index.html"), "w") as f:
+        f.write("<!doctype html><title>DashBorg</title>")
+    app_dir = os.path.join(workdir, "webapi")
+    os.makedirs(app_dir)
+
+    env = dict(os.environ)
+    env.update({
+        "PATH": f"{bin_dir}{os.pathsep}{env['PATH']}",
+        "PYTHONPATH": WEBAPI_DIR,
+        "DATABASE_PATH": os.path.join(workdir, "dashborg.db"),
+        "FAKE_BORGMATIC_FILES": str(args.files),
+        "FAKE_BORGMATIC_FILES_PER_SECOND": str(args.files_per_second),
+        "FAKE_BORGMATIC_STARTUP_DELAY": "0",
+    })
+    return app_dir, env
+
+
+def parse_metrics(text: str) -> dict:
+    """Parse the Prometheus text format into {(name, labels): value}."""
+    values = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match:
+            values[(match.group(1), match.group(2) or "")] = float(match.group(3))
+    return values
+
+
+def loop_blocking(before: dict, after: dict) -> dict:
+    """Event loop blocking during the run, from the difference of two /metrics scrapes."""
+    def delta(name, labels=""):
+        return after.get((name, labels), 0) - before.get((name, labels), 0)
+
+    buckets = sorted(
+        (float("inf") if labels == 'le="+Inf"' else float(labels[4:-1]), delta(name, labels))
+        for name, labels in after if name == "dashborg_event_loop_lag_seconds_bucket"
+    )
+    total = delta("dashborg_event_loop_lag_seconds_count")
+
+    def quantile(q):
+        for bound, count in buckets:
+            if total and count >= q * total:
+                return bound
+        return None
+
+    return {
+        "blocked_seconds": round(delta("dashborg_event_loop_blocked_seconds_total"), 3),
+        "lag_samples": int(total),
+        "lag_p50_le_s": quantile(0.50),
+        "lag_p99_le_s": quantile(0.99),
+        "lag_max_le_s": quantile(1.0),
+    }
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get("/api/jobs")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("DashBorg did not become ready")
+
+
+async def poller(client, interval: float, deadline: float, samples: list, counters: dict):
+    """One browser tab: GET /api/jobs every interval seconds."""
+    await asyncio.sleep(random.uniform(0, interval))
+    next_poll = time.monotonic()
+    while next_poll < deadline:
+        start = time.monotonic()
+        if start - next_poll > interval:
+            counters["late_polls"] += 1
+        try:
+            response = await client.get("/api/jobs")
+            samples.append(time.monotonic() - start)
+            counters["ok" if response.status_code == 200 else "errors"] += 1
+        except httpx.HTTPError:
+            counters["errors"] += 1
+        next_poll += interval
+        await asyncio.sleep(max(next_poll - time.monotonic(), 0))
+
+
+async def backup_runner(client, deadline: float, counters: dict):
+    """Start a backup, wait for it to finish and start the next one until the deadline."""
+    while time.monotonic() < deadline:
+        response = await client.post("/api/backup-create", json={"config": "config.yaml"})
+        job_id = response.json().get("job_id")
+        if not job_id:
+            counters["backup_errors"] += 1
+            return
+        while time.monotonic() < deadline:
+            await asyncio.sleep(1)
+            job = (await client.get(f"/api/jobs/{job_id}")).json()
+            if job.get("status") in ("completed", "failed"):
+                counters["backups_completed" if job["status"] == "completed" else "backup_errors"] += 1
+                break
+
+
+async def run_load(args, base_url: str) -> dict:
+    limits = httpx.Limits(max_connections=args.pollers + args.backups + 2)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        await wait_until_ready(client)
+        metrics_before = parse_metrics((await client.get("/metrics")).text)
+
+        samples = []
+        counters = {"ok": 0, "errors": 0, "late_polls": 0, "backups_completed": 0, "backup_errors": 0}
+        started = time.monotonic()
+        deadline = started + args.duration
+        await asyncio.gather(
+            *(poller(client, args.poll_interval, deadline, samples, counters) for _ in range(args.pollers)),
+            *(backup_runner(client, deadline, counters) for _ in range(args.backups)),
+        )
+        elapsed = time.monotonic() - started
+
+        metrics_after = parse_metrics((await client.get("/metrics")).text)
+
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "requests": counters["ok"] + counters["errors"],
+        "errors": counters["errors"],
+        "throughput_rps": round((counters["ok"] + counters["errors"]) / elapsed, 2),
+        "expected_rps": round(args.pollers / args.poll_interval, 2),
+        "late_polls": counters["late_polls"],
+        "latency": percentiles(samples) if samples else None,
+        "backups_completed": counters["backups_completed"],
+        "backup_errors": counters["backup_errors"],
+        "event_loop": loop_blocking(metrics_before, metrics_after),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pollers", type=int, default=50, help="simulated browser tabs polling /api/jobs")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="seconds between polls per tab")
+    parser.add_argument("--backups", type=int, default=2, help="backup jobs kept running concurrently")
+    parser.add_argument("--files", type=int, default=200000, help="files per fake backup")
+    parser.add_argument("--files-per-second", type=float, default=20000, help="fake backup speed")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run the scenario")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="load_results.json", help="where to write JSON results")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    app_dir, env = prepare_workdir(args)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning"],
+        cwd=app_dir, env=env
+    )
+    try:
+        results = {
+            "version": git_version(),
+            "timestamp": datetime.now().isoformat(),
+            "parameters": vars(args),
+            **asyncio.run(run_load(args, f"http://127.0.0.1:{args.port}")),
+        }
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    with open(os.path.abspath(args.output), "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Check the retention simulator against real borg prune output.
+
+Capture, for one repository, the archive list and a dry-run prune with the policy under test:
+
+    borgmatic list --json --match-archives '*' > archives.json
+    borgmatic prune --dry-run --list --verbosity 1 2> prune.txt   # or: borg prune --dry-run --list ...
+
+then replay them (pass the time the prune ran as --now when using keep_within):
+
+    python bench/retention_parity.py archives.json prune.txt --keep-daily 7 --keep-weekly 4 \\
+        --now 2024-05-01T12:00:00
+
+Or replay the fixtures captured from real borg (bench/capture_retention_fixtures.py), one case
+per directory with archives.json, prune.txt and case.json (policy, time the prune ran, time zone):
+
+    python bench/retention_parity.py --fixtures bench/fixtures/retention
+
+Exits non-zero if any archive is kept or pruned differently, or kept by a different rule.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "webapi"))
+
+from retention import RULES, simulate_prune, validate_policy  # noqa: E402
+
+# "Keeping archive (rule: daily #1):   name   Mon, 2024-04-30 02:00:01 [id]", "Would prune:   name ..."
+PRUNE_LINE = re.compile(
+    r"(Keeping (?:checkpoint )?archive(?: \(rule: (?P<rule>\S+) #(?P<number>\d+)\))?|Would prune|Pruning archive(?: \(\d+/\d+\))?):"
+    r"\s+(?P<name>\S(?:.*\S)?)\s+\w{3}, \d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} \[[0-9a-f]+\]\s*$"
+)
+
+
+def load_archives(path: str) -> list:
+    """Archives from borg list --json or borgmatic list --json (one repository)."""
+    with open(path) as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        if len(data) != 1:
+            sys.exit(f"{path} lists {len(data)} repositories; capture one at a time")
+        data = data[0]
+    archives = []
+    for archive in data["archives"]:
+        start = datetime.fromisoformat((archive.get("start") or archive["time"]).replace("Z", "+00:00"))
+        if start.tzinfo is not None:
+            start = start.astimezone().replace(tzinfo=None)  # borg compares periods in local time
+        archives.append((archive["name"], start))
+    return archives
+
+
+def parse_prune_output(path: str) -> dict:
+    """Archive name -> ("keep", rule, number) or ("prune", None, None)."""
+    decisions = {}
+    with open(path) as f:
+        for line in f:
+            match = PRUNE_LINE.search(line.rstrip("\n"))
+            if not match:
+                continue
+            if match.group(1).startswith("Keeping"):
+                number = int(match.group("number")) if match.group("number") else None
+                decisions[match.group("name")] = ("keep", match.group("rule"), number)
+            else:
+                decisions[match.group("name")] = ("prune", None, None)
+    return decisions
+
+
+def compare(archives: list, expected: dict, policy: dict, now) -> list:
+    """(name, borg's decision, simulator's decision) for every archive they disagree on."""
+    names = [name for name, _ in archives]
+    starts = [start for _, start in archives]
+    kept_because, pruned = simulate_prune(names, starts, policy, now)
+    actual = {names[index]: ("keep", rule, number) for index, (rule, number) in kept_because.items()}
+    actual.update({names[index]: ("prune", None, None) for index in pruned})
+
+    mismatches = []
+    for name in sorted(set(expected) | set(actual)):
+        want, got = expected.get(name), actual.get(name)
+        if want is None or got is None or want[0] != got[0]:
+            mismatches.append((name, want, got))
+        elif want[1] is not None and (want[1], want[2]) != (got[1], got[2]):  # older borg doesn't print rules
+            mismatches.append((name, want, got))
+    return mismatches
+
+
+def report(label: str, expected: dict, mismatches: list):
+    for name, want, got in mismatches:
+        print(f"MISMATCH {label}{name}: borg {want}, simulator {got}")
+    kept = sum(1 for decision in expected.values() if decision[0] == "keep")
+    print(f"{label}{len(expected)} archives compared ({kept} kept, {len(expected) - kept} pruned by borg), {len(mismatches)} mismatches")
+
+
+def check_fixtures(root: str) -> bool:
+    """Replay every captured case under root; True if all of them match."""
+    cases = sorted(name for name in os.listdir(root) if os.path.exists(os.path.join(root, name, "case.json")))
+    if not cases:
+        sys.exit(f"No fixtures (directories with case.json) in {root}")
+    failed = []
+    versions = set()
+    for case in cases:
+        directory = os.path.join(root, case)
+        with open(os.path.join(directory, "case.json")) as f:
+            spec = json.load(f)
+        versions.add(spec.get("borg_version", "?"))
+        # borg buckets archives by local time; replay in the zone the fixture was captured in
+        os.environ["TZ"] = spec.get("tz", "UTC")
+        time.tzset()
+        validate_policy(spec["policy"])
+        expected = parse_prune_output(os.path.join(directory, "prune.txt"))
+        if not expected:
+            sys.exit(f"No prune decisions in {directory}/prune.txt")
+        mismatches = compare(load_archives(os.path.join(directory, "archives.json")), expected, spec["policy"], datetime.fromisoformat(spec["now"]))
+        report(f"{case}: ", expected, mismatches)
+        if mismatches:
+            failed.append(case)
+    print(f"{len(cases) - len(failed)}/{len(cases)} fixture cases match borg {', '.join(sorted(versions))}")
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("archives", nargs="?", help="borg/borgmatic list --json output")
+    parser.add_argument("prune_output", nargs="?", help="borg prune --dry-run --list output")
+    parser.add_argument("--fixtures", help="directory of captured cases to replay instead")
+    parser.add_argument("--keep-within")
+    for rule in RULES:
+        parser.add_argument(f"--keep-{rule}", type=int)
+    parser.add_argument("--match-archives", help="glob the prune was restricted to")
+    parser.add_argument("--now", help="local time the prune ran (ISO 8601), for --keep-within")
+    args = parser.parse_args()
+
+    if args.fixtures:
+        sys.exit(0 if check_fixtures(args.fixtures) else 1)
+    if not args.archives or not args.prune_output:
+        parser.error("archives and prune_output are required without --fixtures")
+
+    policy = {key: value for key, value in vars(args).items() if key.startswith("keep_") and value is not None}
+    if args.match_archives:
+        policy["match_archives"] = args.match_archives
+    validate_policy(policy)
+
+    archives = load_archives(args.archives)
+    expected = parse_prune_output(args.prune_output)
+    if not expected:
+        sys.exit(f"No 'Keeping archive' / 'Would prune' lines in {args.prune_output} (was it run with --list?)")
+
+    mismatches = compare(archives, expected, policy, datetime.fromisoformat(args.now) if args.now else None)
+    report("", expected, mismatches)
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
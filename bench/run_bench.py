@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+DashBorg benchmark harness.
+
+Runs the API in-process against the fake borgmatic stand-in (fake_borgmatic.py) and a
+throwaway SQLite database, then measures:
+
+    - sync_archives duration for a repository of --archives archives
+    - run_job_in_background throughput (lines/s) and peak RSS for a --files file backup
+    - latency percentiles of /api/jobs, /api/archives and /api/stats/dashboard
+
+Results are written as JSON (--output) so runs of different versions can be compared.
+
+Usage:
+    pip install -r bench/requirements.txt
+    python bench/run_bench.py --archives 1000 --files 1000000 --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+WEBAPI_DIR = os.path.join(REPO_ROOT, "webapi")
+
+
+def prepare_environment(workdir: str, args) -> str:
+    """Put fake borgmatic on PATH, point the app at a fresh database and fake UI build."""
+    bin_dir = os.path.join(workdir, "bin")
+    os.makedirs(bin_dir)
+    os.symlink(os.path.join(BENCH_DIR, "fake_borgmatic.py"), os.path.join(bin_dir, "borgmatic"))
+
+    # main.py mounts ../webui/dist relative to the working directory
+    os.makedirs(os.path.join(workdir, "webui", "dist", "assets"))
+    with open(os.path.join(workdir, "webui", "dist", "index.html"), "w") as f:
+        f.write("<!doctype html><title>DashBorg</title>")
+    app_dir = os.path.join(workdir, "webapi")
+    os.makedirs(app_dir)
+
+    os.environ.update({
+        "PATH": f"{bin_dir}{os.pathsep}{os.environ['PATH']}",
+        "DATABASE_PATH": os.path.join(workdir, "dashborg.db"),
+        "FAKE_BORGMATIC_ARCHIVES": str(args.archives),
+        "FAKE_BORGMATIC_FILES": str(args.files),
+        "FAKE_BORGMATIC_REPOSITORIES": str(args.repositories),
+        "FAKE_BORGMATIC_STARTUP_DELAY": str(args.startup_delay),
+        "FAKE_BORGMATIC_SEED": str(args.seed),
+    })
+    os.chdir(app_dir)
+    sys.path.insert(0, WEBAPI_DIR)
+    return app_dir
+
+
+def percentiles(samples):
+    """Summary statistics of latency samples, in milliseconds."""
+    ordered = sorted(samples)
+
+    def pick(fraction):
+        return round(ordered[min(int(fraction * len(ordered)), len(ordered) - 1)] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def reset_peak_rss() -> bool:
+    """Reset the kernel's peak RSS counter (VmHWM) for this process, where supported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def bench_sync_archives(client):
+    start = time.perf_counter()
+    response = client.post("/api/sync-archives", json={"config": "config.yaml"})
+    duration = time.perf_counter() - start
+    body = response.json()
+    return {
+        "status_code": response.status_code,
+        "duration_s": round(duration, 3),
+        "archives_synced": body.get("synced_archives"),
+        "archives_per_s": round((body.get("synced_archives") or 0) / duration, 2) if duration else None,
+    }
+
+
+def bench_job_runner(main):
+    """Run a fake backup synchronously through run_job_in_background."""
+    job_id = f"bench-{int(time.time() * 1000)}"
+    cmd = ["borgmatic", "create", "--config", "/etc/borgmatic/config.yaml", "--verbosity", "1", "--list", "--stats"]
+    main.register_job(job_id, "backup-create", cmd, "config.yaml")
+
+    rss_reset = reset_peak_rss()
+    rss_before = peak_rss_bytes()
+    start = time.perf_counter()
+    main.run_job_in_background(job_id, cmd, "backup-create", "config.yaml")
+    duration = time.perf_counter() - start
+
+    db = main.SessionLocal()
+    try:
+        job = db.query(main.BackupJob).filter(main.BackupJob.job_id == job_id).first()
+        lines = len(job.output.splitlines()) if job and job.output else 0
+        status = job.status if job else None
+    finally:
+        db.close()
+
+    return {
+        "status": status,
+        "duration_s": round(duration, 3),
+        "lines": lines,
+        "lines_per_s": round(lines / duration, 1) if duration else None,
+        "peak_rss_bytes": peak_rss_bytes(),
+        "peak_rss_growth_bytes": peak_rss_bytes() - rss_before if rss_reset else None,
+    }
+
+
+def seed_jobs(main, count: int, output_lines: int):
+    """Insert finished jobs so job listing endpoints have realistic history to serve."""
+    if count <= 0:
+        return
+    output = "\n".join(f"U /source/dir{i // 1000:05d}/file{i:08d}.dat" for i in range(output_lines))
+    now = datetime.now()
+    db = main.SessionLocal()
+    try:
+        db.bulk_save_objects([
+            main.BackupJob(
+                job_id=f"seed-{i}",
+                job_type="backup-create",
+                config_file="config.yaml",
+                command="borgmatic create --config /etc/borgmatic/config.yaml --list --stats",
+                status="completed",
+                created_at=now - timedelta(hours=i),
+                started_at=now - timedelta(hours=i),
+                completed_at=now - timedelta(hours=i) + timedelta(minutes=5),
+                files_processed=output_lines,
+                return_code=0,
+                output=output
+            )
+            for i in range(count)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def bench_endpoints(client, requests_per_endpoint: int):
+    endpoints = {
+        "/api/jobs": "/api/jobs",
+        "/api/archives": "/api/archives?limit=100",
+        "/api/stats/dashboard": "/api/stats/dashboard",
+    }
+    results = {}
+    for name, url in endpoints.items():
+        client.get(url)  # warm up
+        samples = []
+        for _ in range(requests_per_endpoint):
+            start = time.perf_counter()
+            response = client.get(url)
+            samples.append(time.perf_counter() - start)
+            response.raise_for_status()
+        results[name] = percentiles(samples)
+        results[name]["response_bytes"] = len(response.content)
+    return results
+
+
+def git_version() -> str:
+    try:
+        return subprocess.run(
+            ["git", "-C", REPO_ROOT, "describe", "--always", "--dirty"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--archives", type=int, default=200, help="archives per repository")
+    parser.add_argument("--files", type=int, default=100000, help="files listed by the benchmarked backup")
+    parser.add_argument("--repositories", type=int, default=1, help="repositories per config")
+    parser.add_argument("--startup-delay", type=float, default=0.0, help="simulated borgmatic startup seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--jobs", type=int, default=200, help="finished jobs to seed into the database")
+    parser.add_argument("--job-output-lines", type=int, default=1000, help="output lines per seeded job")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint for latency")
+    parser.add_argument("--output", default="bench_results.json", help="where to write JSON results")
+    args = parser.parse_args()
+
+    output_path = os.path.abspath(args.output)
+    workdir = tempfile.mkdtemp(prefix="dashborg-bench-")
+    prepare_environment(workdir, args)
+
+    import main as dashborg
+    from fastapi.testclient import TestClient
+
+    results = {
+        "version": git_version(),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": vars(args),
+    }
+
+    with TestClient(dashborg.app) as client:
+        print(f"Syncing {args.archives} archives x {args.repositories} repositories...")
+        results["sync_archives"] = bench_sync_archives(client)
+
+        print(f"Running backup job with {args.files} files...")
+        results["job_runner"] = bench_job_runner(dashborg)
+
+        print(f"Seeding {args.jobs} jobs and measuring endpoint latency...")
+        seed_jobs(dashborg, args.jobs, args.job_output_lines)
+        results["endpoints"] = bench_endpoints(client, args.requests)
+
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(json.dumps({k: results[k] for k in ("sync_archives", "job_runner", "endpoints")}, indent=2))
+    print(f"Results written to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+Backup performance analytics over archive history: rolling trends and regression detection with NumPy
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+try:
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError:  # /api/stats/anomalies reports that it needs numpy
+    np = None
+
+# Analytics settings
+ANALYTICS_WINDOW = int(os.getenv("DASHBORG_ANALYTICS_WINDOW", "14"))  # previous archives forming the baseline
+SLOWDOWN_FACTOR = float(os.getenv("DASHBORG_SLOWDOWN_FACTOR", "2"))  # duration / baseline flagged as a slowdown
+CHANGE_FACTOR = float(os.getenv("DASHBORG_CHANGE_FACTOR", "3"))  # change rate / baseline flagged as a spike
+MIN_DURATION = 60  # seconds; faster backups are too noisy to call slow
+MIN_CHANGE_BYTES = 100 * 1024 * 1024  # deduplicated bytes below which a change spike isn't worth reporting
+HISTORY_CACHE_TTL = 300  # seconds; catches archives whose stats were updated in place
+MAX_WINDOW = 100  # archives; each baseline sorts window values per archive
+SORT_CHUNK = 8 * 1024 * 1024  # window values sorted at once (64 MiB of float64)
+
+# One row per archive, grouped by repository and in time order; NULLs become -1 and then NaN
+HISTORY_QUERY = """
+    SELECT repository_id,
+           id,
+           CAST(strftime('%s', start) AS INTEGER),
+           COALESCE(duration, -1),
+           COALESCE(original_size, -1),
+           COALESCE(deduplicated_size, -1),
+           COALESCE(nfiles, -1)
+    FROM archives
+    WHERE start IS NOT NULL
+    ORDER BY repository_id, start
+"""
+# Cheap to compute (covering index); changes whenever archives are added or removed
+FINGERPRINT_QUERY = "SELECT COUNT(*), MAX(id), MAX(created_at) FROM archives"
+
+
+def load_history(rows) -> Dict[int, Dict[str, Any]]:
+    """Archive history per repository id, as float arrays: id, start (epoch seconds), duration, original, deduplicated, nfiles."""
+    if not rows:
+        return {}
+
+    data = np.array(rows, dtype=np.float64)
+    data[:, 3:][data[:, 3:] < 0] = np.nan
+    repository_ids, first = np.unique(data[:, 0], return_index=True)
+    history = {}
+    for repository_id, columns in zip(repository_ids, np.split(data[:, 1:], first[1:])):
+        history[int(repository_id)] = {
+            "id": columns[:, 0],
+            "start": columns[:, 1],
+            "duration": columns[:, 2],
+            "original_size": columns[:, 3],
+            "deduplicated_size": columns[:, 4],
+            "nfiles": columns[:, 5],
+        }
+    return history
+
+
+class HistoryCache:
+    """Archive history kept in memory between requests; building a million row tuples costs far more than the analysis."""
+
+    def __init__(self, ttl: float = HISTORY_CACHE_TTL):
+        self.ttl = ttl
+        self._fingerprint = None
+        self._loaded_at = 0.0
+        self._history: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, engine) -> Dict[int, Dict[str, Any]]:
+        with self._lock:
+            connection = engine.raw_connection()
+            try:
+                cursor = connection.cursor()
+                cursor.execute(FINGERPRINT_QUERY)
+                fingerprint = tuple(cursor.fetchone())
+                if fingerprint != self._fingerprint or time.monotonic() - self._loaded_at > self.ttl:
+                    cursor.execute(HISTORY_QUERY)
+                    self._history = load_history(cursor.fetchall())
+                    self._fingerprint = fingerprint
+                    self._loaded_at = time.monotonic()
+            finally:
+                connection.close()
+            return self._history
+
+
+def rolling_baseline(values, window: int, first: int = 0):
+    """Median of the `window` values before each position from `first` on (NaN without a full window).
+
+    NaNs are skipped. Windows are sorted row-wise (NaN sorts last), which is several times
+    faster than np.nanmedian over a million windows; they're sorted a chunk at a time so a
+    wide window doesn't copy n * window values at once.
+    """
+    baseline = np.full(len(values) - first, np.nan)
+    begin = max(first, window)
+    if len(values) > begin:
+        windows = sliding_window_view(values[begin - window:-1], window)
+        missing = np.concatenate(([0], np.cumsum(np.isnan(values[begin - window:-1]))))
+        counts = window - (missing[window:] - missing[:-window])  # non-NaN values per window
+        rows = max(1, SORT_CHUNK // window)
+        for start in range(0, len(windows), rows):
+            chunk = np.sort(windows[start:start + rows], axis=1)
+            chunk_counts = counts[start:start + rows]
+            low = np.take_along_axis(chunk, np.maximum(chunk_counts - 1, 0)[:, None] // 2, axis=1)[:, 0]
+            high = np.take_along_axis(chunk, np.minimum(chunk_counts // 2, window - 1)[:, None], axis=1)[:, 0]
+            baseline[begin - first + start:begin - first + start + len(chunk)] = np.where(chunk_counts > 0, (low + high) / 2, np.nan)
+    return baseline
+
+
+def derive_metrics(archives: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-archive throughput (bytes/s, files/s), change rate (new bytes per day) and dedup efficiency."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        duration = np.where(archives["duration"] > 0, archives["duration"], np.nan)
+        original = archives["original_size"]
+        deduplicated = archives["deduplicated_size"]
+        interval_days = np.diff(archives["start"], prepend=np.nan) / 86400
+        return {
+            "bytes_per_second": original / duration,
+            "files_per_second": archives["nfiles"] / duration,
+            "change_bytes_per_day": deduplicated / np.where(interval_days > 0, interval_days, np.nan),
+            "dedup_efficiency": 1 - deduplicated / np.where(original > 0, original, np.nan),
+        }
+
+
+def _flag(kind: str, mask, values, baseline, archives) -> List[Dict[str, Any]]:
+    found = []
+    for index in np.flatnonzero(mask):
+        found.append({
+            "kind": kind,
+            "archive_id": int(archives["id"][index]),
+            "start": float(archives["start"][index]),
+            "value": float(values[index]),
+            "baseline": float(baseline[index]),
+            "ratio": round(float(values[index] / baseline[index]), 2) if baseline[index] else None,
+        })
+    return found
+
+
+def detect_anomalies(archives: Dict[str, Any], window: int = ANALYTICS_WINDOW, since: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Archives that regressed against the median of the archives before them.
+
+    - slowdown: took SLOWDOWN_FACTOR times as long as usual
+    - throughput_drop: processed bytes SLOWDOWN_FACTOR times slower than usual
+    - change_spike: CHANGE_FACTOR times more new data per day than usual
+    - file_count_change: file count multiplied or divided by CHANGE_FACTOR (a missing source shows up here)
+
+    since (epoch seconds) limits the result to recent archives; the baselines still use the older ones.
+    """
+    metrics = derive_metrics(archives)
+    first = int(np.searchsorted(archives["start"], since)) if since is not None else 0
+    recent = {key: value[first:] for key, value in archives.items()}
+    duration = recent["duration"]
+    throughput = metrics["bytes_per_second"][first:]
+    change = metrics["change_bytes_per_day"][first:]
+    nfiles = recent["nfiles"]
+    duration_b = rolling_baseline(archives["duration"], window, first)
+    throughput_b = rolling_baseline(metrics["bytes_per_second"], window, first)
+    change_b = rolling_baseline(metrics["change_bytes_per_day"], window, first)
+    nfiles_b = rolling_baseline(archives["nfiles"], window, first)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        anomalies = []
+        anomalies += _flag("slowdown", (duration >= SLOWDOWN_FACTOR * duration_b) & (duration >= MIN_DURATION),
+                           duration, duration_b, recent)
+        anomalies += _flag("throughput_drop", (throughput * SLOWDOWN_FACTOR <= throughput_b) & (duration >= MIN_DURATION),
+                           throughput, throughput_b, recent)
+        anomalies += _flag("change_spike", (change >= CHANGE_FACTOR * change_b) & (recent["deduplicated_size"] >= MIN_CHANGE_BYTES),
+                           change, change_b, recent)
+        anomalies += _flag("file_count_change", (nfiles >= CHANGE_FACTOR * nfiles_b) | (nfiles * CHANGE_FACTOR <= nfiles_b),
+                           nfiles, nfiles_b, recent)
+    anomalies.sort(key=lambda anomaly: anomaly["start"])
+    return anomalies
+
+
+def summarize_trends(archives: Dict[str, Any], window: int = ANALYTICS_WINDOW) -> Dict[str, Any]:
+    """Median of each metric over the last `window` archives, and its change against the `window` before."""
+    metrics = derive_metrics(archives)
+    metrics["duration"] = archives["duration"]
+    summary = {"archives": int(len(archives["start"]))}
+    with np.errstate(all="ignore"):
+        for name, values in metrics.items():
+            current = np.nanmedian(values[-window:]) if len(values) else np.nan
+            previous = np.nanmedian(values[-2 * window:-window]) if len(values) > window else np.nan
+            summary[name] = None if np.isnan(current) else round(float(current), 4)
+            summary[f"{name}_change_pct"] = (
+                None if np.isnan(current) or np.isnan(previous) or previous == 0
+                else round(float((current - previous) / abs(previous) * 100), 1)
+            )
+    return summary
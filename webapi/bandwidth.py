@@ -0,0 +1,151 @@
+"""
+Time-of-day bandwidth windows for remote repository jobs: upload rate limits and off-peak deferral
+"""
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+# Bandwidth settings: a JSON list of windows, first match wins, e.g.
+# [{"name": "business", "days": "mon-fri", "start": "08:00", "end": "18:00", "upload_rate_limit": 2048},
+#  {"name": "backup-freeze", "start": "18:00", "end": "20:00", "defer": true}]
+# upload_rate_limit is in KiB/s like borgmatic's option; "defer" windows start no shaped jobs at all.
+# Time outside every window is off-peak and unlimited.
+BANDWIDTH_PROFILES = os.getenv("DASHBORG_BANDWIDTH_PROFILES", "")
+SHAPED_JOB_TYPES = ("backup-create", "check", "extract")
+DEFER_CHECK_INTERVAL = 60  # seconds between re-checks of a deferred job
+
+DAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+OFF_PEAK = "off-peak"
+
+
+def parse_days(days) -> List[int]:
+    """Weekday numbers (Monday 0) of "mon-fri", "sat,sun" or ["mon", "wed"]; all days if empty."""
+    if not days:
+        return list(range(7))
+    parts = days.split(",") if isinstance(days, str) else days
+    numbers = []
+    for part in parts:
+        first, _, last = part.strip().lower().partition("-")
+        start = DAYS.index(first[:3])
+        end = DAYS.index(last[:3]) if last else start
+        numbers.extend(day % 7 for day in range(start, end + 1 if end >= start else end + 8))
+    return sorted(set(numbers))
+
+
+def is_remote(path: str) -> bool:
+    """Whether a repository path points at another host (ssh://..., user@host:path, host:path)."""
+    if "://" in path:
+        return not path.startswith("file://")
+    return not path.startswith(("/", ".", "~")) and ":" in path.split("/", 1)[0]
+
+
+class BandwidthWindow:
+    """A recurring daily time window; days are the days it starts on, end <= start runs past midnight."""
+
+    def __init__(self, spec: Dict[str, Any]):
+        self.name = spec.get("name") or f"{spec['start']}-{spec['end']}"
+        self.days = parse_days(spec.get("days"))
+        start = datetime.strptime(spec["start"], "%H:%M")
+        end = datetime.strptime(spec["end"], "%H:%M")
+        self.start = timedelta(hours=start.hour, minutes=start.minute)
+        self.length = (timedelta(hours=end.hour, minutes=end.minute) - self.start) % timedelta(days=1) or timedelta(days=1)
+        self.upload_rate_limit = spec.get("upload_rate_limit") or None
+        self.defer = bool(spec.get("defer", False))
+
+    def occurrence(self, now: datetime) -> Optional[datetime]:
+        """Start of the occurrence of this window that contains now, if any."""
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        for days_back in (0, 1):
+            start = midnight - timedelta(days=days_back) + self.start
+            if start.weekday() in self.days and start <= now < start + self.length:
+                return start
+        return None
+
+    def next_start(self, now: datetime) -> Optional[datetime]:
+        """First start of this window after now (within a week)."""
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        for days_ahead in range(8):
+            start = midnight + timedelta(days=days_ahead) + self.start
+            if start > now and start.weekday() in self.days:
+                return start
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "days": [DAYS[day] for day in self.days],
+            "start": str(self.start)[:-3].zfill(5),
+            "hours": self.length / timedelta(hours=1),
+            "upload_rate_limit": self.upload_rate_limit,
+            "defer": self.defer,
+        }
+
+
+class BandwidthSchedule:
+    """Decides when a shaped job may start and with which upload rate limit."""
+
+    def __init__(self, specs: Optional[List[Dict[str, Any]]] = None):
+        if specs is None:
+            specs = json.loads(BANDWIDTH_PROFILES) if BANDWIDTH_PROFILES else []
+        self.windows = [BandwidthWindow(spec) for spec in specs]
+
+    def current(self, now: datetime) -> Optional[BandwidthWindow]:
+        return next((window for window in self.windows if window.occurrence(now) is not None), None)
+
+    def slot_end(self, now: datetime) -> Optional[datetime]:
+        """When the next defer window begins (end of the slot jobs may run in); None if never."""
+        starts = [window.next_start(now) for window in self.windows if window.defer]
+        starts = [start for start in starts if start is not None]
+        return min(starts) if starts else None
+
+    def next_slot(self, now: datetime) -> datetime:
+        """Earliest time from now on that isn't inside a defer window."""
+        moment = now
+        for _ in range(len(self.windows) * 8 + 1):
+            window = self.current(moment)
+            if window is None or not window.defer:
+                return moment
+            moment = window.occurrence(moment) + window.length
+        return moment
+
+    def decide(self, now: datetime, expected_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """Start now, or defer to the next slot long enough for the job's expected duration.
+
+        Returns {"start": bool, "window", "upload_rate_limit", "deferred_until"}. A job longer
+        than every slot in the coming week runs in the next slot anyway.
+        """
+        slot = self.next_slot(now)
+        first_slot = slot
+        for _ in range(8 * max(len(self.windows), 1)):
+            end = self.slot_end(slot)
+            if expected_seconds is None or end is None or slot + timedelta(seconds=expected_seconds) <= end:
+                break
+            slot = self.next_slot(end)
+        else:
+            slot = first_slot
+        if slot > now:
+            return {"start": False, "window": None, "upload_rate_limit": None, "deferred_until": slot.isoformat()}
+        window = self.current(now)
+        return {
+            "start": True,
+            "window": window.name if window else OFF_PEAK,
+            "upload_rate_limit": window.upload_rate_limit if window else None,
+            "deferred_until": None,
+        }
+
+    def to_dict(self, now: datetime) -> Dict[str, Any]:
+        window = self.current(now)
+        return {
+            "windows": [window.to_dict() for window in self.windows],
+            "current": window.name if window else OFF_PEAK,
+            "upload_rate_limit": window.upload_rate_limit if window else None,
+            "next_slot": self.next_slot(now).isoformat(),
+        }
+
+
+def rate_limit_args(upload_rate_limit: Optional[int]) -> List[str]:
+    """borgmatic arguments that set borg's upload rate limit (KiB/s) for one run."""
+    if not upload_rate_limit:
+        return []
+    return ["--override", f"upload_rate_limit={int(upload_rate_limit)}"]
@@ -0,0 +1,221 @@
+"""
+Time-boxed, resumable repository checks rotated across repositories within a nightly window
+
+borgmatic check --only repository --max-duration (borg check --repository-only underneath)
+checks segments for at most the given time and remembers where it stopped, so the next run
+carries on from there. Each slice of checking is recorded in check_progress to report how much
+of the current pass is verified.
+"""
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from database import CheckProgress, SessionLocal
+
+# Check scheduling settings
+CHECK_WINDOW = os.getenv("DASHBORG_CHECK_WINDOW", "")  # local time, e.g. "01:00-05:00"; empty disables scheduled checks
+CHECK_MAX_DURATION = int(os.getenv("DASHBORG_CHECK_MAX_DURATION", "3600"))  # seconds per check slice
+CHECK_MIN_DURATION = 300  # seconds; a slice shorter than this isn't worth the repository lock
+CHECK_SCHEDULER_INTERVAL = 60  # seconds
+
+# borg 1.2 Repository.check messages; a slice that reaches the last segment ends the pass
+PERCENT_LINE = re.compile(r"Checking segments\s+(\d+(?:\.\d+)?)%", re.IGNORECASE)
+PARTIAL_LINE = re.compile(r"finished partial segment check, last segment checked is (\d+)", re.IGNORECASE)
+PASS_LINE = re.compile(r"finished segment check at segment (-?\d+)", re.IGNORECASE)
+FULL_LINE = re.compile(r"Finished full repository check", re.IGNORECASE)
+
+
+def parse_window(spec: str) -> Optional[Tuple[int, int]]:
+    """Parse "HH:MM-HH:MM" into (start, end) minutes after midnight; the end may be past midnight."""
+    if not spec:
+        return None
+    try:
+        start, end = (datetime.strptime(part.strip(), "%H:%M") for part in spec.split("-"))
+    except ValueError:
+        raise ValueError(f"Invalid check window {spec!r}, expected HH:MM-HH:MM")
+    return start.hour * 60 + start.minute, end.hour * 60 + end.minute
+
+
+def window_remaining(window: Tuple[int, int], now: datetime) -> float:
+    """Seconds left in the window if now is inside it, else 0."""
+    start, end = window
+    minute = now.hour * 60 + now.minute + now.second / 60
+    if start <= end:
+        inside = start <= minute < end
+    else:  # Wraps around midnight
+        inside = minute >= start or minute < end
+    if not inside:
+        return 0
+    return ((end - minute) % (24 * 60)) * 60
+
+
+def parse_check_output(lines: List[str]) -> Dict[str, Any]:
+    """Progress reached by a (partial) check: last percent shown, last segment, whether the pass finished."""
+    result = {"percent": None, "last_segment": None, "finished": False}
+    for line in lines:
+        match = PERCENT_LINE.search(line)
+        if match:
+            result["percent"] = float(match.group(1))
+            continue
+        match = PARTIAL_LINE.search(line)
+        if match:
+            result["last_segment"] = int(match.group(1))
+            continue
+        match = PASS_LINE.search(line)
+        if match:
+            result["last_segment"] = int(match.group(1))
+            result["finished"] = True
+        elif FULL_LINE.search(line):
+            result["finished"] = True
+    return result
+
+
+def build_partial_check_command(config_path: str, repository: str, max_duration: int) -> List[str]:
+    return [
+        "borgmatic", "check",
+        "--config", config_path,
+        "--verbosity", "1",
+        "--progress",  # "Checking segments N%" lines
+        "--repository", repository,
+        "--only", "repository",  # --max-duration only applies to the repository check
+        "--force",  # Don't let check_last's frequency skip a scheduled slice
+        "--max-duration", str(int(max_duration))
+    ]
+
+
+def record_check(location: str, config_file: str, repository: str, job: Dict[str, Any]):
+    """Update a repository's check progress from a finished partial check job."""
+    started = datetime.fromisoformat(job["started_at"]) if job.get("started_at") else datetime.now()
+    completed = datetime.fromisoformat(job["completed_at"]) if job.get("completed_at") else datetime.now()
+    result = parse_check_output((job.get("output") or "").splitlines())
+
+    db = SessionLocal()
+    try:
+        progress = db.query(CheckProgress).filter(CheckProgress.location == location).first()
+        if progress is None:
+            progress = CheckProgress(location=location, percent_verified=0, seconds_checked=0, full_passes=0)
+            db.add(progress)
+        progress.config_file = config_file
+        progress.repository = repository
+        progress.last_run_at = completed
+        progress.last_job_id = job["id"]
+
+        # The previous slice completed a pass, so this one started the next
+        if progress.pass_started_at is None or (progress.percent_verified or 0) >= 100:
+            progress.pass_started_at = started
+            progress.percent_verified = 0
+            progress.seconds_checked = 0
+            progress.last_segment = None
+
+        if job["status"] != "completed":
+            progress.last_status = "failed"
+        else:
+            progress.seconds_checked = (progress.seconds_checked or 0) + (completed - started).total_seconds()
+            if result["finished"]:
+                progress.last_status = "full"
+                progress.percent_verified = 100
+                progress.last_full_pass_at = completed
+                progress.full_passes = (progress.full_passes or 0) + 1
+            else:
+                progress.last_status = "partial"
+                if result["percent"] is not None:
+                    progress.percent_verified = result["percent"]
+                if result["last_segment"] is not None:
+                    progress.last_segment = result["last_segment"]
+        db.commit()
+    finally:
+        db.close()
+
+
+class CheckScheduler:
+    """Starts one time-boxed check at a time during the check window, least recently checked repository first.
+
+    targets() lists (config_file, repository, location) for every configured repository,
+    start_check(config_file, repository, location, max_duration) starts a check job, and
+    busy() says whether a job that needs the repositories (backup, prune, check) is running.
+    """
+
+    def __init__(
+        self,
+        targets: Callable[[], List[Tuple[str, str, str]]],
+        start_check: Callable[[str, str, str, int], str],
+        busy: Callable[[], bool],
+        window: str = CHECK_WINDOW,
+        max_duration: int = CHECK_MAX_DURATION
+    ):
+        self.targets = targets
+        self.start_check = start_check
+        self.busy = busy
+        self.window = parse_window(window)
+        self.max_duration = max_duration
+        self._thread = None
+
+    def next_target(self, targets: Optional[List[Tuple[str, str, str]]] = None) -> Optional[Tuple[str, str, str]]:
+        """Repository to check next (of targets, default all): never checked first, then the longest since its last slice."""
+        targets = self.targets() if targets is None else targets
+        if not targets:
+            return None
+        db = SessionLocal()
+        try:
+            last_run = dict(db.query(CheckProgress.location, CheckProgress.last_run_at).all())
+        finally:
+            db.close()
+        return min(targets, key=lambda target: last_run.get(target[2]) or datetime.min)
+
+    def tick(self, now: Optional[datetime] = None) -> Optional[str]:
+        """Start the next check slice if the window allows; returns its job ID."""
+        if self.window is None:
+            return None
+        remaining = window_remaining(self.window, now or datetime.now())
+        if remaining < CHECK_MIN_DURATION or self.busy():
+            return None
+        target = self.next_target()
+        if target is None:
+            return None
+        return self.start_check(*target, int(min(self.max_duration, remaining)))
+
+    def start(self):
+        if self.window is None or self._thread is not None:
+            return self._thread
+
+        def schedule_loop():
+            while True:
+                time.sleep(CHECK_SCHEDULER_INTERVAL)
+                try:
+                    self.tick()
+                except Exception as e:
+                    print(f"Error scheduling repository check: {e}")
+
+        self._thread = threading.Thread(target=schedule_loop, name="check-scheduler", daemon=True)
+        self._thread.start()
+        print(f"✓ Repository checks scheduled in window {CHECK_WINDOW} (up to {self.max_duration}s per slice)")
+        return self._thread
+
+    def coverage(self, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Verification coverage of every configured repository."""
+        now = now or datetime.now()
+        db = SessionLocal()
+        try:
+            progress = {row.location: row for row in db.query(CheckProgress).all()}
+        finally:
+            db.close()
+        coverage = []
+        for config_file, repository, location in self.targets():
+            row = progress.get(location)
+            coverage.append({
+                "repository": repository,
+                "location": location,
+                "config": config_file,
+                "percent_verified": row.percent_verified if row else 0,
+                "last_status": row.last_status if row else None,
+                "last_run_at": row.last_run_at.isoformat() if row and row.last_run_at else None,
+                "pass_started_at": row.pass_started_at.isoformat() if row and row.pass_started_at else None,
+                "last_full_pass_at": row.last_full_pass_at.isoformat() if row and row.last_full_pass_at else None,
+                "hours_since_full_pass": round((now - row.last_full_pass_at) / timedelta(hours=1), 1) if row and row.last_full_pass_at else None,
+                "full_passes": row.full_passes if row else 0,
+                "seconds_checked": round(row.seconds_checked or 0) if row else 0
+            })
+        return coverage
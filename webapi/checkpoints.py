@@ -0,0 +1,79 @@
+"""
+Write-coalesced checkpointing of running jobs to the database
+"""
+import os
+import threading
+import time
+from typing import Any, Dict
+
+from database import BackupJob, SessionLocal
+
+# Seconds between checkpoint flushes
+JOB_CHECKPOINT_INTERVAL = float(os.getenv("DASHBORG_JOB_CHECKPOINT_INTERVAL", "2"))
+
+
+class JobCheckpointWriter:
+    """Collects BackupJob column updates from all jobs and writes them in one transaction per tick.
+
+    Updates for the same job are merged, so a job reporting thousands of files per second
+    still costs a single UPDATE per tick, and the number of commits stays constant no
+    matter how many jobs are running.
+    """
+
+    def __init__(self, interval: float = JOB_CHECKPOINT_INTERVAL):
+        self.interval = interval
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()  # Protects _pending
+        self._flush_lock = threading.Lock()  # Serializes flushes so older snapshots never win
+        self._thread = None
+        self.flush_count = 0
+        self.rows_written = 0
+
+    def update(self, job_id: str, **fields):
+        """Queue column updates for a job; later values override earlier ones."""
+        with self._lock:
+            self._pending.setdefault(job_id, {}).update(fields)
+
+    def discard(self, job_id: str):
+        """Drop queued updates for a job (e.g. when it is deleted)."""
+        with self._lock:
+            self._pending.pop(job_id, None)
+
+    def flush(self):
+        """Write all queued updates in a single transaction."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+
+            db = SessionLocal()
+            try:
+                for job_id, fields in pending.items():
+                    db.query(BackupJob).filter(BackupJob.job_id == job_id).update(fields, synchronize_session=False)
+                db.commit()
+                self.flush_count += 1
+                self.rows_written += len(pending)
+            except Exception as e:
+                db.rollback()
+                # Requeue, keeping any newer updates that arrived meanwhile
+                with self._lock:
+                    for job_id, fields in pending.items():
+                        self._pending[job_id] = {**fields, **self._pending.get(job_id, {})}
+                print(f"Error checkpointing jobs: {e}")
+            finally:
+                db.close()
+
+    def start(self):
+        """Start the background flush thread."""
+        if self._thread is not None:
+            return self._thread
+
+        def writer_loop():
+            while True:
+                time.sleep(self.interval)
+                self.flush()
+
+        self._thread = threading.Thread(target=writer_loop, daemon=True)
+        self._thread.start()
+        return self._thread
@@ -0,0 +1,106 @@
+"""
+Negotiated response compression (zstd or gzip) for DashBorg API responses
+"""
+import asyncio
+import gzip
+import os
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from metrics import HTTP_COMPRESSION_BYTES
+from static_files import accepted_encodings
+
+try:
+    import zstandard
+except ImportError:  # gzip only
+    zstandard = None
+
+# Compression settings
+COMPRESSION_MIN_SIZE = int(os.getenv("DASHBORG_COMPRESSION_MIN_SIZE", "1024"))  # bytes
+COMPRESSION_THREAD_SIZE = 256 * 1024  # bytes; larger bodies are compressed off the event loop
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Content types worth compressing; downloads, tarballs and precompressed assets are left alone
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "application/xml", "image/svg+xml")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Best encoding both sides support: zstd, then gzip."""
+    accepted = accepted_encodings(accept_encoding)
+    if zstandard is not None and "zstd" in accepted:
+        return "zstd"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """Compress complete responses above a size threshold.
+
+    Only responses sent in a single body message are compressed; streaming responses
+    (restores, exports) pass through untouched so they keep flowing chunk by chunk.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            passthrough = True
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            if (
+                not message.get("more_body", False)
+                and len(body) >= self.minimum_size
+                and "content-encoding" not in headers
+                and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            ):
+                if len(body) >= COMPRESSION_THREAD_SIZE:
+                    compressed = await asyncio.to_thread(compress, body, encoding)
+                else:
+                    compressed = compress(body, encoding)
+                if len(compressed) < len(body):
+                    HTTP_COMPRESSION_BYTES.inc(len(body), encoding=encoding, stage="in")
+                    HTTP_COMPRESSION_BYTES.inc(len(compressed), encoding=encoding, stage="out")
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(compressed))
+                    headers.add_vary_header("Accept-Encoding")
+                    if "etag" in headers:
+                        # The compressed representation is a different entity
+                        headers["ETag"] = headers["etag"].rstrip('"') + f'-{encoding}"'
+                    await send(start)
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,262 @@
+"""
+In-memory registry of borgmatic config files, refreshed by inotify (or mtime polling)
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import yaml
+
+from config_validation import load_config, normalize_legacy
+
+# Registry settings
+CONFIG_DIR = os.getenv("DASHBORG_CONFIG_DIR", "/etc/borgmatic")
+CONFIG_POLL_INTERVAL = float(os.getenv("DASHBORG_CONFIG_POLL_INTERVAL", "5"))
+
+# inotify event masks (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def is_config_file(config_dir: str, name: str) -> bool:
+    """Same filter the config listing has always used: regular files, no dotfiles or editor leftovers."""
+    return (
+        not name.startswith('.')
+        and not name.endswith('.swp')
+        and not name.endswith('~')
+        and os.path.isfile(os.path.join(config_dir, name))
+    )
+
+
+def parse_repositories(content: str, include_dir: Optional[str] = None, includes: Optional[List[str]] = None) -> List[Dict[str, Optional[str]]]:
+    """Repositories (path and label) a config points at, reading its includes from include_dir.
+
+    Included files are appended to `includes`. Raises yaml.YAMLError or OSError if it doesn't load.
+    """
+    config = load_config(content, include_dir, includes)
+    if not isinstance(config, dict):
+        return []
+    repositories = []
+    for repo in normalize_legacy(config).get("repositories") or []:
+        if isinstance(repo, dict) and repo.get("path"):
+            repositories.append({"path": repo["path"], "label": repo.get("label")})
+    return repositories
+
+
+class InotifyWatcher:
+    """Minimal ctypes binding to inotify for watching one directory."""
+
+    def __init__(self, path: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, path.encode(), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {path}")
+
+    def wait(self, timeout: float) -> Optional[List[int]]:
+        """Wait for events; returns their masks ([] on timeout)."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        masks = []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            _, mask, _, name_length = INOTIFY_EVENT.unpack_from(data, offset)
+            masks.append(mask)
+            offset += INOTIFY_EVENT.size + name_length
+        return masks
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ConfigRegistry:
+    """Parsed borgmatic configs indexed by name and by repository, kept in sync with the config directory."""
+
+    def __init__(self, config_dir: str = CONFIG_DIR, poll_interval: float = CONFIG_POLL_INTERVAL):
+        self.config_dir = config_dir
+        self.poll_interval = poll_interval
+        self._configs: Dict[str, Dict[str, Any]] = {}
+        self._by_repository: Dict[str, List[str]] = {}
+        self._subscribers: List[Callable[[str, str], None]] = []
+        self._lock = threading.RLock()
+        self.mode: Optional[str] = None
+
+    def subscribe(self, callback: Callable[[str, str], None]):
+        """Call callback(event, name) with event "added", "modified" or "removed" on every change."""
+        self._subscribers.append(callback)
+
+    def _notify(self, event: str, name: str):
+        for callback in self._subscribers:
+            try:
+                callback(event, name)
+            except Exception as e:
+                print(f"Error in config change subscriber: {e}")
+
+    def _load(self, name: str, stat: os.stat_result) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.config_dir, name), 'r') as f:
+                content = f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"Error reading config {name}: {e}")
+            return None
+        return {
+            "name": name,
+            "content": content,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            **self._parse(name, content),
+        }
+
+    def _parse(self, name: str, content: str) -> Dict[str, Any]:
+        includes: List[str] = []
+        try:
+            repositories = parse_repositories(content, self.config_dir, includes)
+        except (yaml.YAMLError, OSError) as e:
+            print(f"Could not read repositories from config {name}: {e}")
+            repositories = []
+        return {"repositories": repositories, "includes": includes}
+
+    def _reindex(self):
+        by_repository: Dict[str, List[str]] = {}
+        for name, entry in sorted(self._configs.items()):
+            for repo in entry["repositories"]:
+                for key in filter(None, (repo["path"], repo["label"])):
+                    by_repository.setdefault(key, []).append(name)
+        self._by_repository = by_repository
+
+    def refresh(self, name: Optional[str] = None):
+        """Re-read changed configs (only `name` if given); unchanged files are skipped by mtime and size."""
+        events = []
+        with self._lock:
+            if name is not None:
+                names = [name] if is_config_file(self.config_dir, name) else []
+                stale = [name] if name in self._configs and not names else []
+            else:
+                try:
+                    names = [n for n in os.listdir(self.config_dir) if is_config_file(self.config_dir, n)]
+                except OSError:
+                    names = []
+                stale = [n for n in self._configs if n not in names]
+
+            for config_name in stale:
+                del self._configs[config_name]
+                events.append(("removed", config_name))
+
+            for config_name in names:
+                try:
+                    stat = os.stat(os.path.join(self.config_dir, config_name))
+                except OSError:
+                    continue
+                current = self._configs.get(config_name)
+                if current and current["mtime_ns"] == stat.st_mtime_ns and current["size"] == stat.st_size:
+                    continue
+                entry = self._load(config_name, stat)
+                if entry is None:
+                    continue
+                if current and current["content"] == entry["content"]:
+                    current.update(mtime_ns=entry["mtime_ns"], size=entry["size"])
+                    continue
+                self._configs[config_name] = entry
+                events.append(("modified" if current else "added", config_name))
+
+            # Configs that include a changed file get its new options too
+            changed = {config_name for _, config_name in events}
+            changed_paths = {os.path.join(self.config_dir, config_name) for config_name in changed}
+            for config_name, entry in list(self._configs.items()):
+                if config_name not in changed and changed_paths & set(entry["includes"]):
+                    entry.update(self._parse(config_name, entry["content"]))
+                    events.append(("modified", config_name))
+
+            if events:
+                self._reindex()
+
+        for event, config_name in events:
+            self._notify(event, config_name)
+
+    def path(self, name: str) -> str:
+        """Path of a config file in the config directory, as passed to borgmatic --config."""
+        return os.path.join(self.config_dir, name)
+
+    def list_configs(self) -> List[str]:
+        with self._lock:
+            return sorted(self._configs)
+
+    def get_content(self, name: str) -> Optional[str]:
+        with self._lock:
+            entry = self._configs.get(name)
+            return entry["content"] if entry else None
+
+    def repositories(self, name: str) -> List[Dict[str, Optional[str]]]:
+        """Repositories configured in a config file."""
+        with self._lock:
+            entry = self._configs.get(name)
+            return list(entry["repositories"]) if entry else []
+
+    def configs_for_repository(self, repository: str) -> List[str]:
+        """Config files that reference a repository, by path or label."""
+        with self._lock:
+            return list(self._by_repository.get(repository, []))
+
+    def _watch(self):
+        while True:
+            watcher = None
+            try:
+                watcher = InotifyWatcher(self.config_dir)
+                self.mode = "inotify"
+            except (OSError, AttributeError) as e:
+                if self.mode != "polling":
+                    print(f"Config watcher falling back to polling every {self.poll_interval}s: {e}")
+                self.mode = "polling"
+
+            try:
+                # The directory may have changed while no watch was in place
+                self.refresh()
+                while True:
+                    if watcher is None:
+                        time.sleep(self.poll_interval)
+                        self.refresh()
+                        if os.path.isdir(self.config_dir):
+                            break  # Try to set up inotify again
+                        continue
+                    masks = watcher.wait(self.poll_interval * 12)
+                    if any(mask & (IN_DELETE_SELF | IN_MOVE_SELF) for mask in masks):
+                        break
+                    if masks:
+                        time.sleep(0.05)  # Let editors finish their write/rename sequence
+                        watcher.wait(0)
+                    self.refresh()
+            except Exception as e:
+                print(f"Error in config watcher: {e}")
+                time.sleep(self.poll_interval)
+            finally:
+                if watcher is not None:
+                    watcher.close()
+
+    def start(self):
+        """Load all configs and keep them up to date from a background thread."""
+        self.refresh()
+        threading.Thread(target=self._watch, name="config-registry", daemon=True).start()
@@ -0,0 +1,324 @@
+"""
+Borgmatic config validation with a content-hash cache and an in-process fast path
+"""
+import glob
+import hashlib
+import os
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import yaml
+
+try:
+    import jsonschema
+except ImportError:  # Fall back to the built-in subset checker
+    jsonschema = None
+
+# Validation settings
+VALIDATION_CACHE_SIZE = int(os.getenv("DASHBORG_VALIDATION_CACHE_SIZE", "128"))
+SCHEMA_PATH = os.getenv("DASHBORG_BORGMATIC_SCHEMA")
+
+# Where pipx installs borgmatic in the container
+SCHEMA_SEARCH_PATTERNS = [
+    "/root/.local/share/pipx/venvs/borgmatic/lib/python*/site-packages/borgmatic/config/schema.yaml",
+    "/root/.local/pipx/venvs/borgmatic/lib/python*/site-packages/borgmatic/config/schema.yaml",
+    "/usr/lib/python3*/site-packages/borgmatic/config/schema.yaml",
+    "/usr/local/lib/python3*/site-packages/borgmatic/config/schema.yaml",
+]
+
+# JSON schema type names to Python types (bool is excluded from integer/number below)
+SCHEMA_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "null": type(None),
+}
+
+# Pre-1.8 borgmatic configs nest options under these sections
+LEGACY_SECTIONS = ("location", "storage", "retention", "consistency", "output", "hooks")
+
+_schema: Optional[Dict[str, Any]] = None
+_schema_loaded = False
+_schema_validator = None
+_schema_lock = threading.Lock()
+
+
+class ConfigLoader(yaml.SafeLoader):
+    """SafeLoader that accepts borgmatic's own tags.
+
+    !include loads the named file, relative to include_dir; without an include_dir included files
+    aren't read and load as None. !retain and !omit only steer borgmatic's deep merge, so the value
+    they tag is loaded as if untagged. Merges ("<<: !include ...") are YAML's shallow ones.
+    """
+
+    def __init__(self, stream, include_dir: Optional[str] = None, includes: Optional[List[str]] = None, parents: Tuple[str, ...] = ()):
+        super().__init__(stream)
+        self.include_dir = include_dir
+        self.includes = includes if includes is not None else []
+        self.parents = parents  # files being included, to catch include loops
+
+    def construct_include(self, node) -> Any:
+        name = self.construct_scalar(node)
+        path = os.path.join(self.include_dir, name) if self.include_dir is not None else name
+        if path in self.parents:
+            raise yaml.constructor.ConstructorError(None, None, f"{name} is included recursively", node.start_mark)
+        self.includes.append(path)
+        if self.include_dir is None:
+            return None
+        with open(path) as f:
+            return load_config(f.read(), os.path.dirname(path), self.includes, self.parents + (path,))
+
+    def construct_untagged(self, node) -> Any:
+        if isinstance(node, yaml.MappingNode):
+            return self.construct_mapping(node, deep=True)
+        if isinstance(node, yaml.SequenceNode):
+            return self.construct_sequence(node, deep=True)
+        tag = self.resolve(yaml.ScalarNode, node.value, (True, False))
+        return self.yaml_constructors[tag](self, node)
+
+    def flatten_mapping(self, node):
+        # YAML merges only accept mappings, so merged includes are loaded and turned back into nodes
+        for index, (key_node, value_node) in enumerate(node.value):
+            if key_node.tag != "tag:yaml.org,2002:merge":
+                continue
+            if value_node.tag == "!include":
+                node.value[index] = (key_node, self._included_node(value_node))
+            elif isinstance(value_node, yaml.SequenceNode):
+                value_node.value = [self._included_node(item) if item.tag == "!include" else item for item in value_node.value]
+        super().flatten_mapping(node)
+
+    def _included_node(self, node):
+        included = self.construct_include(node)
+        return yaml.representer.SafeRepresenter().represent_data(included if isinstance(included, dict) else {})
+
+
+ConfigLoader.add_constructor("!include", ConfigLoader.construct_include)
+ConfigLoader.add_constructor("!retain", ConfigLoader.construct_untagged)
+ConfigLoader.add_constructor("!omit", ConfigLoader.construct_untagged)
+
+
+def load_config(content: str, include_dir: Optional[str] = None, includes: Optional[List[str]] = None, parents: Tuple[str, ...] = ()) -> Any:
+    """Parse a borgmatic config with its tags (see ConfigLoader); included paths are appended to `includes`."""
+    loader = ConfigLoader(content, include_dir, includes, parents)
+    try:
+        return loader.get_single_data()
+    finally:
+        loader.dispose()
+
+
+def find_schema_path() -> Optional[str]:
+    """Locate borgmatic's schema.yaml, preferring DASHBORG_BORGMATIC_SCHEMA."""
+    if SCHEMA_PATH:
+        return SCHEMA_PATH if os.path.exists(SCHEMA_PATH) else None
+    for pattern in SCHEMA_SEARCH_PATTERNS:
+        matches = sorted(glob.glob(pattern))
+        if matches:
+            return matches[-1]
+    return None
+
+
+def load_schema() -> Optional[Dict[str, Any]]:
+    """Load borgmatic's config schema once; None if it can't be found."""
+    global _schema, _schema_loaded
+    with _schema_lock:
+        if not _schema_loaded:
+            path = find_schema_path()
+            if path:
+                try:
+                    with open(path) as f:
+                        _schema = yaml.safe_load(f)
+                    print(f"✓ Loaded borgmatic config schema from {path}")
+                except (OSError, yaml.YAMLError) as e:
+                    print(f"Warning: could not load borgmatic schema {path}: {e}")
+            _schema_loaded = True
+        return _schema
+
+
+def _format_path(path: List[Any]) -> str:
+    return ".".join(str(part) for part in path) or "(root)"
+
+
+def _type_matches(value: Any, type_name: str) -> bool:
+    if type_name in ("integer", "number") and isinstance(value, bool):
+        return False
+    expected = SCHEMA_TYPES.get(type_name)
+    return expected is None or isinstance(value, expected)
+
+
+def _check_subset(value: Any, schema: Dict[str, Any], path: List[Any], errors: List[str]):
+    """Check the schema keywords borgmatic relies on: type, enum, properties, required, items."""
+    if not isinstance(schema, dict):
+        return
+    if "oneOf" in schema or "anyOf" in schema:
+        options = schema.get("oneOf") or schema.get("anyOf")
+        for option in options:
+            option_errors: List[str] = []
+            _check_subset(value, option, path, option_errors)
+            if not option_errors:
+                break
+        else:
+            errors.append(f"{_format_path(path)}: {value!r} does not match any allowed form")
+        return
+
+    types = schema.get("type")
+    if types:
+        types = types if isinstance(types, list) else [types]
+        if not any(_type_matches(value, t) for t in types):
+            errors.append(f"{_format_path(path)}: {value!r} is not of type {' or '.join(types)}")
+            return
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{_format_path(path)}: {value!r} is not one of {schema['enum']}")
+
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{_format_path(path)}: '{key}' is a required property")
+        for key, item in value.items():
+            if key in properties:
+                _check_subset(item, properties[key], path + [key], errors)
+            elif schema.get("additionalProperties") is False:
+                errors.append(f"{_format_path(path)}: unknown option '{key}'")
+            elif isinstance(schema.get("additionalProperties"), dict):
+                _check_subset(item, schema["additionalProperties"], path + [key], errors)
+    elif isinstance(value, list) and isinstance(schema.get("items"), dict):
+        for index, item in enumerate(value):
+            _check_subset(item, schema["items"], path + [index], errors)
+
+
+def normalize_legacy(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply the upgrades borgmatic itself makes to old-style configs before schema validation."""
+    config = dict(config)
+    for section in LEGACY_SECTIONS:
+        if isinstance(config.get(section), dict):
+            config.update(config.pop(section))
+    if isinstance(config.get("repositories"), list):
+        config["repositories"] = [
+            {"path": repo} if isinstance(repo, str) else repo for repo in config["repositories"]
+        ]
+    if isinstance(config.get("checks"), list):
+        config["checks"] = [
+            {"name": check} if isinstance(check, str) else check for check in config["checks"]
+        ]
+    if isinstance(config.get("exclude_if_present"), str):
+        config["exclude_if_present"] = [config["exclude_if_present"]]
+    return config
+
+
+def schema_errors(config: Any, schema: Dict[str, Any]) -> List[str]:
+    """Validate a parsed config against borgmatic's schema."""
+    global _schema_validator
+    if jsonschema is not None:
+        if _schema_validator is None or _schema_validator.schema is not schema:
+            _schema_validator = jsonschema.Draft7Validator(schema)
+        validator = _schema_validator
+        return [
+            f"{_format_path(list(error.absolute_path))}: {error.message}"
+            for error in sorted(validator.iter_errors(config), key=lambda e: list(map(str, e.absolute_path)))
+        ]
+    errors: List[str] = []
+    _check_subset(config, schema, [], errors)
+    return errors
+
+
+def quick_validate(content: str) -> Dict[str, Any]:
+    """In-process YAML syntax and schema check. Returns {"valid": None} when nothing was found wrong.
+
+    Configs that include other files are only checked for syntax (and list the includes), as
+    borgmatic deep-merges the included options before validating.
+    """
+    includes: List[str] = []
+    try:
+        config = load_config(content, includes=includes)
+    except yaml.YAMLError as e:
+        mark = getattr(e, "problem_mark", None)
+        where = f" at line {mark.line + 1}, column {mark.column + 1}" if mark else ""
+        problem = getattr(e, "problem", None) or str(e)
+        return {"valid": False, "stage": "syntax", "error": f"YAML syntax error{where}: {problem}"}
+
+    if not isinstance(config, dict):
+        return {"valid": False, "stage": "syntax", "error": "Configuration must be a YAML mapping of options"}
+    if includes:
+        return {"valid": None, "stage": "syntax", "includes": includes}
+
+    schema = load_schema()
+    if schema is None:
+        return {"valid": None, "stage": "syntax"}
+    errors = schema_errors(normalize_legacy(config), schema)
+    if errors:
+        return {"valid": False, "stage": "schema", "error": "\n".join(errors), "errors": errors}
+    return {"valid": None, "stage": "schema"}
+
+
+def borgmatic_validate(content: str, run: Callable[..., subprocess.CompletedProcess] = subprocess.run,
+                       include_dir: Optional[str] = None) -> Dict[str, Any]:
+    """Full semantic validation with `borgmatic config validate`, run in include_dir so relative includes resolve."""
+    with tempfile.NamedTemporaryFile(mode="w", suffix=".yaml", delete=False) as f:
+        f.write(content)
+        temp_path = f.name
+    try:
+        result = run(["borgmatic", "config", "validate", "--config", temp_path], capture_output=True, text=True, cwd=include_dir)
+        if result.returncode == 0:
+            return {"valid": True, "stage": "borgmatic", "output": result.stdout}
+        return {"valid": False, "stage": "borgmatic", "error": result.stderr.replace(temp_path, "config")}
+    finally:
+        os.unlink(temp_path)
+
+
+class ConfigValidator:
+    """Validate configs, caching results by content hash (LRU)."""
+
+    def __init__(self, max_entries: int = VALIDATION_CACHE_SIZE, run: Callable[..., subprocess.CompletedProcess] = subprocess.run,
+                 include_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.run = run
+        self.include_dir = include_dir
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return result
+
+    def _put(self, key: str, result: Dict[str, Any]):
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def validate(self, content: str, full: bool = True) -> Dict[str, Any]:
+        """Validate config content; full=False stops after the in-process checks."""
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        # Full results also answer quick requests; quick passes are cached separately
+        for key in ([f"full:{digest}"] if full else [f"full:{digest}", f"quick:{digest}"]):
+            cached = self._get(key)
+            if cached is not None:
+                return {**cached, "cached": True}
+
+        result = quick_validate(content)
+        # borgmatic's verdict on a config with includes also depends on the included files
+        cacheable = result["valid"] is False or not result.get("includes")
+        if result["valid"] is False:
+            self._put(f"full:{digest}", result)
+        elif full:
+            result = borgmatic_validate(content, self.run, self.include_dir)
+            if cacheable:
+                self._put(f"full:{digest}", result)
+        elif cacheable:
+            self._put(f"quick:{digest}", result)
+        return {**result, "cached": False}
@@ -0,0 +1,160 @@
+"""
+Backup results from borgmatic create --stats output (parsing and storage)
+"""
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from database import Archive, Repository, SessionLocal
+
+# "Key: value" lines of borg's statistics block, optionally behind a borgmatic "label: " prefix
+STATS_LINE = re.compile(
+    r"(?:^|: )(Repository|Archive name|Archive fingerprint|Time \(start\)|Time \(end\)|Duration"
+    r"|Number of files|This archive|All archives|Chunk index): +(.*)$"
+)
+SIZE = re.compile(r"(\d+(?:\.\d+)?) ([kMGTPEZY]i?B|B)\b")
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?) (day|hour|minute|second)s?\b")
+
+# borg prints decimal units, or binary ones when run with --iec
+SIZE_UNITS = {"B": 1}
+for power, prefix in enumerate("kMGTPEZY", start=1):
+    SIZE_UNITS[f"{prefix}B"] = 1000 ** power
+    SIZE_UNITS[f"{prefix.upper()}iB"] = 1024 ** power
+DURATION_UNITS = {"day": 86400, "hour": 3600, "minute": 60, "second": 1}
+TIME_FORMAT = "%a, %Y-%m-%d %H:%M:%S"
+
+
+def parse_size(text: str) -> List[int]:
+    """Byte counts of the human-readable sizes in a line ("1.23 GB  800.00 MB" -> [1230000000, 800000000])."""
+    return [int(float(number) * SIZE_UNITS[unit]) for number, unit in SIZE.findall(text)]
+
+
+def parse_duration(text: str) -> Optional[float]:
+    """Seconds in a borg duration ("1 hours 2 minutes 3.45 seconds")."""
+    parts = DURATION_PART.findall(text)
+    if not parts:
+        return None
+    return round(sum(float(number) * DURATION_UNITS[unit] for number, unit in parts), 6)
+
+
+def parse_time(text: str) -> Optional[str]:
+    try:
+        return datetime.strptime(text.strip(), TIME_FORMAT).isoformat()
+    except ValueError:
+        return None
+
+
+def parse_create_stats(lines: List[str]) -> List[Dict[str, Any]]:
+    """Statistics blocks of borgmatic create --stats output, one per repository.
+
+    Each result has the shape of a borg info --json entry (archive, repository, cache),
+    so it can stand in for the stats previously fetched with a separate borgmatic info.
+    Sizes are as precise as borg prints them (three significant digits).
+    """
+    results = []
+    current = None
+    for line in lines:
+        # File list entries ("A /path") are the bulk of the output; skip them cheaply
+        if len(line) > 2 and line[1] == " " and line[0] in "AMUCEdbchsfi-x?":
+            continue
+        match = STATS_LINE.search(line)
+        if not match:
+            continue
+        key, value = match.group(1), match.group(2).strip()
+
+        # A block starts with "Repository:" (borg 1.2+) or "Archive name:" (older borg)
+        if key == "Repository" or (key == "Archive name" and (current is None or current["archive"].get("name"))):
+            current = {"repository": {"location": None}, "archive": {"stats": {}}, "cache": {"stats": {}}}
+            results.append(current)
+        if current is None:
+            continue
+
+        archive = current["archive"]
+        if key == "Repository":
+            current["repository"]["location"] = value
+        elif key == "Archive name":
+            archive["name"] = value
+        elif key == "Archive fingerprint":
+            archive["id"] = value
+        elif key == "Time (start)":
+            archive["start"] = parse_time(value)
+        elif key == "Time (end)":
+            archive["end"] = parse_time(value)
+        elif key == "Duration":
+            archive["duration"] = parse_duration(value)
+        elif key == "Number of files":
+            archive["stats"]["nfiles"] = int(value) if value.isdigit() else None
+        elif key == "This archive":
+            sizes = parse_size(value)
+            if len(sizes) == 3:
+                archive["stats"].update(original_size=sizes[0], compressed_size=sizes[1], deduplicated_size=sizes[2])
+            elif len(sizes) == 2:  # borg 2 drops the compressed size column
+                archive["stats"].update(original_size=sizes[0], deduplicated_size=sizes[1])
+        elif key == "All archives":
+            sizes = parse_size(value)
+            if len(sizes) == 3:
+                current["cache"]["stats"].update(total_size=sizes[0], total_csize=sizes[1], unique_csize=sizes[2])
+        elif key == "Chunk index":
+            counts = [int(count) for count in value.split() if count.isdigit()]
+            if len(counts) == 2:
+                current["cache"]["stats"].update(total_unique_chunks=counts[0], total_chunks=counts[1])
+    return [result for result in results if result["archive"].get("name")]
+
+
+def ingest_create_stats(results: List[Dict[str, Any]], configured: List[Dict[str, Optional[str]]]) -> List[int]:
+    """Upsert the archives of parsed create results; returns the Archive ids.
+
+    configured are the config's repositories (path and label); they name repositories that
+    aren't in the database yet and stand in for the location when borg doesn't print it.
+    Results are completed in place with the repository label and known encryption mode.
+    New archives are marked provisional: the next archive sync replaces their rounded sizes
+    and fills in what the text output lacks (hostname, username, comment, command line).
+    Repository totals aren't stored: the text has no unique (uncompressed) size, so they
+    wouldn't be comparable to the statistics repository syncs record.
+    """
+    labels = {repo["path"]: repo.get("label") for repo in configured}
+    archive_ids = []
+    db = SessionLocal()
+    try:
+        for result in results:
+            location = result["repository"]["location"]
+            if location is None:
+                if len(configured) != 1:
+                    continue  # Can't tell which repository it belongs to
+                location = result["repository"]["location"] = configured[0]["path"]
+
+            repo = db.query(Repository).filter(Repository.location == location).first()
+            if repo is None:
+                repo = Repository(label=labels.get(location) or location, location=location)
+                db.add(repo)
+                db.flush()
+            result["repository"]["label"] = repo.label
+            if repo.encryption_mode:
+                result["encryption"] = {"mode": repo.encryption_mode}
+
+            data = result["archive"]
+            stats = data["stats"]
+            archive = db.query(Archive).filter(Archive.archive_id == data.get("id")).first() if data.get("id") else None
+            if archive is None:
+                archive = Archive(repository_id=repo.id, archive_id=data.get("id"), provisional=True)
+                db.add(archive)
+            elif not archive.provisional:
+                archive_ids.append(archive.id)  # Already synced with borg's exact stats
+                continue
+            archive.name = data["name"]
+            archive.start = datetime.fromisoformat(data["start"]) if data.get("start") else None
+            archive.end = datetime.fromisoformat(data["end"]) if data.get("end") else None
+            archive.duration = data.get("duration")
+            archive.original_size = stats.get("original_size")
+            archive.compressed_size = stats.get("compressed_size")
+            archive.deduplicated_size = stats.get("deduplicated_size")
+            archive.nfiles = stats.get("nfiles")
+            db.flush()
+            archive_ids.append(archive.id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return archive_ids
@@ -1,7 +1,7 @@
 """
 Database models and connection for DashBorg
 """
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, JSON
+from sqlalchemy import create_engine, inspect, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, JSON, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -68,6 +68,7 @@ class Archive(Base):
     username = Column(String)
     comment = Column(Text)
     command_line = Column(JSON)  # Store as JSON array
+    provisional = Column(Boolean, default=False)  # Recorded from create --stats text; the next sync replaces it
     
     created_at = Column(DateTime, default=datetime.utcnow)
     
@@ -107,6 +108,39 @@ class BackupJob(Base):
     # Link to archive if created
     archive_id = Column(Integer, ForeignKey("archives.id"), nullable=True)
     archive = relationship("Archive")
+    
+    # Per-repository sub-job of a parallel backup
+    parent_job_id = Column(String, index=True, nullable=True)
+    repository = Column(String, nullable=True)  # label or path passed as --repository
+    
+    # Resource class and limits the job's processes ran with
+    resources = Column(JSON, nullable=True)
+
+
+class JobLogIndex(Base):
+    """Summary of a finished job's output, built once so problem filtering doesn't rescan it"""
+    __tablename__ = "job_log_index"
+
+    job_id = Column(String, primary_key=True)
+    lines = Column(Integer)
+    status_counts = Column(JSON)  # borg --list status letter -> lines
+    errors = Column(Integer, default=0)
+    warnings = Column(Integer, default=0)
+    indexed_at = Column(DateTime, default=datetime.utcnow)
+
+
+class JobLogProblem(Base):
+    """Error or warning line of a job's output"""
+    __tablename__ = "job_log_problems"
+    __table_args__ = (
+        Index("ix_job_log_problems_job_line", "job_id", "line_number"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(String, nullable=False)
+    line_number = Column(Integer, nullable=False)  # 1-based
+    severity = Column(String)  # "error", "warning"
+    line = Column(Text)
 
 
 class RepositoryStatistics(Base):
@@ -133,10 +167,281 @@ class RepositoryStatistics(Base):
     repository = relationship("Repository", back_populates="statistics")
 
 
+class CheckProgress(Base):
+    """Progress of time-boxed (borg check --max-duration) repository checks, one row per repository"""
+    __tablename__ = "check_progress"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    location = Column(String, unique=True, index=True, nullable=False)  # repository path
+    config_file = Column(String)
+    repository = Column(String)  # label or path passed as --repository
+    
+    # Current pass over the repository's segments
+    percent_verified = Column(Float, default=0)
+    last_segment = Column(Integer)
+    pass_started_at = Column(DateTime)
+    seconds_checked = Column(Float, default=0)  # check time spent on the current pass
+    
+    # Last partial check
+    last_run_at = Column(DateTime, index=True)
+    last_job_id = Column(String)
+    last_status = Column(String)  # "partial", "full", "failed"
+    
+    # Completed passes
+    last_full_pass_at = Column(DateTime)
+    full_passes = Column(Integer, default=0)
+
+
+class BandwidthSample(Base):
+    """Upload throughput achieved by a remote backup job, by bandwidth window"""
+    __tablename__ = "bandwidth_samples"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    job_id = Column(String, index=True)
+    config_file = Column(String)
+    window = Column(String, index=True)  # bandwidth window name, "off-peak" outside all windows
+    upload_rate_limit = Column(Integer)  # KiB/s, null = unlimited
+    bytes_uploaded = Column(Integer)  # deduplicated (new, compressed) bytes of the archive(s)
+    duration_seconds = Column(Float)
+    bytes_per_second = Column(Float)
+    recorded_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class ExtractCacheEntry(Base):
+    """Extracted archive content kept on disk for reuse; archives are immutable, so it never goes stale"""
+    __tablename__ = "extract_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String, unique=True, index=True, nullable=False)  # hash of archive identity and path set
+    archive_key = Column(String, index=True, nullable=False)  # borg archive ID, or config:name if not synced yet
+    config_file = Column(String)
+    archive = Column(String)  # archive name
+    paths = Column(JSON)  # extracted paths, [] = whole archive
+    directory = Column(String, nullable=False)
+
+    status = Column(String, index=True)  # "extracting", "ready"
+    job_id = Column(String, index=True)
+    size_bytes = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_access = Column(DateTime, default=datetime.utcnow, index=True)  # LRU order for eviction
+    hits = Column(Integer, default=0)
+
+
+class FederatedPeer(Base):
+    """Peer DashBorg instance pulled into this one's federated view"""
+    __tablename__ = "federated_peers"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, index=True, nullable=False)
+    url = Column(String, nullable=False)
+    instance = Column(String)  # name the peer reports for itself
+    cursor = Column(JSON)  # position in the peer's change feed
+
+    last_attempt_at = Column(DateTime)
+    last_success_at = Column(DateTime)
+    last_error = Column(Text)
+    failures = Column(Integer, default=0)  # consecutive; drives the backoff
+    next_attempt_at = Column(DateTime, index=True)
+    last_pull_rows = Column(Integer)
+    last_pull_bytes = Column(Integer)  # transferred, i.e. compressed
+
+
+class FederatedRepository(Base):
+    """Repository of a peer instance"""
+    __tablename__ = "federated_repositories"
+    __table_args__ = (
+        UniqueConstraint("peer", "remote_id", name="uq_federated_repositories_remote"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    peer = Column(String, nullable=False, index=True)
+    remote_id = Column(Integer, nullable=False)  # id on the peer
+    label = Column(String)
+    location = Column(String)
+    encryption_mode = Column(String)
+    last_modified = Column(DateTime)
+    archive_count = Column(Integer)  # on the peer, to notice archives deleted there
+
+
+class FederatedArchive(Base):
+    """Archive of a peer instance"""
+    __tablename__ = "federated_archives"
+    __table_args__ = (
+        UniqueConstraint("peer", "remote_id", name="uq_federated_archives_remote"),
+        Index("ix_federated_archives_peer_start", "peer", "start"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    peer = Column(String, nullable=False)
+    remote_id = Column(Integer, nullable=False)
+    repository_remote_id = Column(Integer)
+    name = Column(String)
+    start = Column(DateTime)
+    end = Column(DateTime)
+    duration = Column(Float)
+    original_size = Column(Integer)
+    compressed_size = Column(Integer)
+    deduplicated_size = Column(Integer)
+    nfiles = Column(Integer)
+    hostname = Column(String)
+
+
+class FederatedStatistics(Base):
+    """Repository statistics snapshot of a peer instance"""
+    __tablename__ = "federated_statistics"
+    __table_args__ = (
+        UniqueConstraint("peer", "remote_id", name="uq_federated_statistics_remote"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    peer = Column(String, nullable=False, index=True)
+    remote_id = Column(Integer, nullable=False)
+    repository_remote_id = Column(Integer)
+    collected_at = Column(DateTime)
+    total_size = Column(Integer)
+    total_csize = Column(Integer)
+    unique_size = Column(Integer)
+    unique_csize = Column(Integer)
+    deduplication_ratio = Column(Float)
+
+
+class FederatedJob(Base):
+    """Job summary (no output) of a peer instance"""
+    __tablename__ = "federated_jobs"
+    __table_args__ = (
+        UniqueConstraint("peer", "remote_id", name="uq_federated_jobs_remote"),
+        Index("ix_federated_jobs_peer_created", "peer", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    peer = Column(String, nullable=False)
+    remote_id = Column(Integer, nullable=False)
+    job_id = Column(String)
+    job_type = Column(String)
+    config_file = Column(String)
+    repository = Column(String)
+    status = Column(String)
+    created_at = Column(DateTime)
+    started_at = Column(DateTime)
+    completed_at = Column(DateTime)
+    return_code = Column(Integer)
+    error = Column(Text)
+
+
+class ArchiveDiff(Base):
+    """Cached result of a borg diff between two archives"""
+    __tablename__ = "archive_diffs"
+    __table_args__ = (
+        UniqueConstraint("config_file", "repository", "archive1", "archive2", name="uq_archive_diffs_pair"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    config_file = Column(String, nullable=False)
+    repository = Column(String, nullable=False, default="")  # borgmatic repository label/path, "" = config default
+    archive1 = Column(String, nullable=False)  # older archive
+    archive2 = Column(String, nullable=False)  # newer archive
+    
+    # Status tracking
+    status = Column(String, index=True)  # "running", "completed", "failed"
+    job_id = Column(String, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime)
+    
+    # Results
+    entry_count = Column(Integer, default=0)
+    summary = Column(JSON)  # Entry counts per change type
+    error = Column(Text)
+    
+    entries = relationship("ArchiveDiffEntry", back_populates="diff", cascade="all, delete-orphan")
+
+
+class ArchiveDiffEntry(Base):
+    """Single changed path of an archive diff"""
+    __tablename__ = "archive_diff_entries"
+    __table_args__ = (
+        Index("ix_archive_diff_entries_diff_path", "diff_id", "path"),
+        Index("ix_archive_diff_entries_diff_type_path", "diff_id", "change_type", "path"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    diff_id = Column(Integer, ForeignKey("archive_diffs.id"), nullable=False)
+    
+    path = Column(Text, nullable=False)
+    change_type = Column(String, nullable=False)  # "added", "removed", "modified", "mode", ...
+    size_added = Column(Integer)  # bytes
+    size_removed = Column(Integer)  # bytes
+    changes = Column(JSON)  # Raw borg change list
+    
+    diff = relationship("ArchiveDiff", back_populates="entries")
+
+
+class LiveJob(Base):
+    """Live state of a pending or running job, shared between worker processes"""
+    __tablename__ = "live_jobs"
+    
+    job_id = Column(String, primary_key=True)
+    data = Column(JSON, nullable=False)  # Same shape as the in-memory job dict
+    owner = Column(String)  # Executor process running the job
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class LiveMount(Base):
+    """Archive mount tracked by the mount manager, shared between worker processes"""
+    __tablename__ = "live_mounts"
+    
+    archive = Column(String, primary_key=True)
+    data = Column(JSON, nullable=False)
+
+
+class QueuedJob(Base):
+    """Job registered by a worker and waiting for the executor to start it"""
+    __tablename__ = "job_queue"
+    
+    job_id = Column(String, primary_key=True)
+    runner = Column(String, nullable=False)  # Name of the job runner function
+    args = Column(JSON, nullable=False)
+    job = Column(JSON, nullable=False)  # Initial in-memory job dict
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class ExecutorLease(Base):
+    """Lease held by the worker process elected to run borg jobs"""
+    __tablename__ = "executor_lease"
+    
+    id = Column(Integer, primary_key=True)
+    owner = Column(String, nullable=False)
+    expires_at = Column(Float, nullable=False)  # Unix timestamp
+
+
 # Database initialization
+# Columns added to tables after their first release; create_all() leaves existing tables alone
+ADDED_COLUMNS = {
+    "backup_jobs": ["parent_job_id", "repository", "resources"],
+    "archives": ["provisional"],
+}
+
+
+def migrate_db():
+    """Add missing ADDED_COLUMNS (and their indexes) to tables created by an older version"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table_name, column_names in ADDED_COLUMNS.items():
+            table = Base.metadata.tables[table_name]
+            existing = {column["name"] for column in inspector.get_columns(table_name)}
+            for name in column_names:
+                if name in existing:
+                    continue
+                column_type = table.columns[name].type.compile(dialect=engine.dialect)
+                conn.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {name} {column_type}")
+            for index in table.indexes:
+                if {column.name for column in index.columns} <= set(column_names):
+                    index.create(conn, checkfirst=True)
+
+
 def init_db():
     """Create all tables"""
     Base.metadata.create_all(bind=engine)
+    migrate_db()
 
 
 def get_db():
@@ -0,0 +1,171 @@
+"""
+Archive comparison helpers for DashBorg (borg diff parsing and storage)
+"""
+import json
+import subprocess
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from database import ArchiveDiff, ArchiveDiffEntry, SessionLocal
+
+# Number of diff entries written per INSERT batch
+DIFF_INSERT_BATCH = 2000
+
+# Change types as a file-level category, most significant first
+CHANGE_TYPE_PRIORITY = ["added", "removed", "modified", "mode", "owner", "mtime", "ctime"]
+
+
+def build_diff_command(config_path: str, archive1: str, archive2: str, repository: Optional[str] = None) -> List[str]:
+    """Build the borgmatic passthrough command for borg diff --json-lines."""
+    cmd = ["borgmatic", "borg", "--config", config_path]
+    if repository:
+        cmd.extend(["--repository", repository])
+    # borgmatic exports BORG_REPO, so "::archive" resolves against the selected repository
+    cmd.extend(["diff", "--json-lines", f"::{archive1}", archive2])
+    return cmd
+
+
+def classify_changes(changes: List[Dict[str, Any]]) -> str:
+    """Collapse a borg change list into a single change type for filtering."""
+    types = set()
+    for change in changes:
+        change_type = change.get("type", "")
+        # "added directory", "removed link", ... -> "added", "removed"
+        if change_type.startswith("added"):
+            types.add("added")
+        elif change_type.startswith("removed"):
+            types.add("removed")
+        elif change_type in ("modified", "changed link"):
+            types.add("modified")
+        elif change_type:
+            types.add(change_type)
+    for change_type in CHANGE_TYPE_PRIORITY:
+        if change_type in types:
+            return change_type
+    return sorted(types)[0] if types else "unknown"
+
+
+def parse_diff_line(line: str) -> Optional[Dict[str, Any]]:
+    """Parse one borg diff --json-lines record into an entry row, or None for non-JSON output."""
+    line = line.strip()
+    if not line.startswith("{"):
+        return None
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    if "path" not in record:
+        return None
+
+    changes = record.get("changes", [])
+    size_added = 0
+    size_removed = 0
+    for change in changes:
+        if change.get("type") == "modified":
+            size_added += change.get("added", 0) or 0
+            size_removed += change.get("removed", 0) or 0
+        elif change.get("type", "").startswith("added"):
+            size_added += change.get("size", 0) or 0
+        elif change.get("type", "").startswith("removed"):
+            size_removed += change.get("size", 0) or 0
+
+    return {
+        "path": record["path"],
+        "change_type": classify_changes(changes),
+        "size_added": size_added,
+        "size_removed": size_removed,
+        "changes": changes,
+    }
+
+
+def run_diff(diff_id: int, cmd: List[str], on_progress: Optional[Callable[[int, str], None]] = None) -> Dict[str, Any]:
+    """Run borg diff and stream its entries into the database in batches.
+
+    Returns a dict with status, return_code, entry_count, summary and error.
+    """
+    summary: Dict[str, int] = {}
+    entry_count = 0
+    other_lines = []
+    batch = []
+    db = SessionLocal()
+    try:
+        # Drop partial results of a previous failed run
+        db.query(ArchiveDiffEntry).filter(ArchiveDiffEntry.diff_id == diff_id).delete()
+        db.commit()
+
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1
+        )
+        for line in process.stdout:
+            entry = parse_diff_line(line)
+            if entry is None:
+                if line.strip():
+                    other_lines.append(line.strip())
+                continue
+
+            entry["diff_id"] = diff_id
+            batch.append(entry)
+            entry_count += 1
+            summary[entry["change_type"]] = summary.get(entry["change_type"], 0) + 1
+
+            if len(batch) >= DIFF_INSERT_BATCH:
+                db.execute(insert(ArchiveDiffEntry), batch)
+                db.commit()
+                batch = []
+                if on_progress:
+                    on_progress(entry_count, entry["path"])
+
+        return_code = process.wait()
+        if batch:
+            db.execute(insert(ArchiveDiffEntry), batch)
+
+        diff = db.query(ArchiveDiff).filter(ArchiveDiff.id == diff_id).first()
+        diff.status = "completed" if return_code == 0 else "failed"
+        diff.entry_count = entry_count
+        diff.summary = summary
+        diff.error = "\n".join(other_lines[-50:]) if return_code != 0 else None
+        diff.completed_at = datetime.utcnow()
+        db.commit()
+
+        return {
+            "status": diff.status,
+            "return_code": return_code,
+            "entry_count": entry_count,
+            "summary": summary,
+            "error": diff.error,
+        }
+    except Exception as e:
+        db.rollback()
+        diff = db.query(ArchiveDiff).filter(ArchiveDiff.id == diff_id).first()
+        if diff:
+            diff.status = "failed"
+            diff.error = str(e)
+            diff.completed_at = datetime.utcnow()
+            db.commit()
+        return {"status": "failed", "return_code": None, "entry_count": entry_count, "summary": summary, "error": str(e)}
+    finally:
+        db.close()
+
+
+def diff_to_dict(diff: ArchiveDiff) -> Dict[str, Any]:
+    """Serialize an ArchiveDiff row for API responses."""
+    return {
+        "id": diff.id,
+        "config": diff.config_file,
+        "repository": diff.repository or None,
+        "archive1": diff.archive1,
+        "archive2": diff.archive2,
+        "status": diff.status,
+        "job_id": diff.job_id,
+        "entry_count": diff.entry_count or 0,
+        "summary": diff.summary or {},
+        "error": diff.error,
+        "created_at": diff.created_at.isoformat() if diff.created_at else None,
+        "completed_at": diff.completed_at.isoformat() if diff.completed_at else None,
+    }
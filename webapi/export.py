@@ -0,0 +1,205 @@
+"""
+Streaming export of archives, repository statistics and job history as CSV, NDJSON or Parquet
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, Iterator, List, Optional
+
+from sqlalchemy import JSON, DateTime, Float, Integer, func, select
+
+from database import Archive, BackupJob, Repository, RepositoryStatistics, SessionLocal
+from responses import dumps
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet export is unavailable, CSV and NDJSON still work
+    pyarrow = None
+
+# Export settings
+EXPORT_BATCH_SIZE = 5000  # rows fetched per round trip (and per Parquet row group)
+
+# Table -> (model, timestamp column for ?since=, columns left out unless asked for)
+EXPORT_TABLES = {
+    "archives": (Archive, Archive.start, ()),
+    "repository_statistics": (RepositoryStatistics, RepositoryStatistics.collected_at, ()),
+    "backup_jobs": (BackupJob, BackupJob.created_at, ("output",)),  # full job logs can be megabytes each
+}
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+class ExportError(ValueError):
+    """Invalid export request (unknown table, format or column)"""
+
+
+class Export:
+    """One export of a table: rows with id > since_id (and timestamp >= since) up to the highest id at creation.
+
+    The upper bound makes the export a consistent snapshot even while jobs and syncs add rows,
+    and gives the since_id to resume from next time (last_id).
+    """
+
+    def __init__(self, table: str, format: str = "csv", since: Optional[str] = None, since_id: int = 0, columns: Optional[str] = None):
+        if table not in EXPORT_TABLES:
+            raise ExportError(f"Unknown table {table!r}, expected one of: {', '.join(EXPORT_TABLES)}")
+        if format not in EXPORT_FORMATS:
+            raise ExportError(f"Unknown format {format!r}, expected one of: {', '.join(EXPORT_FORMATS)}")
+        if format == "parquet" and pyarrow is None:
+            raise ExportError("Parquet export requires pyarrow (pip install pyarrow)")
+        self.table = table
+        self.format = format
+        self.model, self.timestamp_column, hidden = EXPORT_TABLES[table]
+        self.since = datetime.fromisoformat(since) if since else None
+        self.since_id = since_id or 0
+
+        available = [column.name for column in self.model.__table__.columns]
+        # Rows referencing a repository by id also get its label
+        self.repository_label = "repository_id" in available
+        if self.repository_label:
+            available.insert(available.index("repository_id") + 1, "repository")
+        if columns:
+            self.columns = [name.strip() for name in columns.split(",") if name.strip()]
+            unknown = [name for name in self.columns if name not in available]
+            if unknown:
+                raise ExportError(f"Unknown column(s) for {table}: {', '.join(unknown)}")
+        else:
+            self.columns = [name for name in available if name not in hidden]
+
+        db = SessionLocal()
+        try:
+            self.last_id = db.execute(select(func.max(self.model.id))).scalar() or 0
+        finally:
+            db.close()
+
+    @property
+    def media_type(self) -> str:
+        return EXPORT_FORMATS[self.format][0]
+
+    @property
+    def filename(self) -> str:
+        return f"dashborg-{self.table}.{EXPORT_FORMATS[self.format][1]}"
+
+    def query(self):
+        table_columns = self.model.__table__.columns
+        selected = [
+            Repository.label.label("repository") if self.repository_label and name == "repository" else table_columns[name]
+            for name in self.columns
+        ]
+        query = select(*selected).where(self.model.id > self.since_id, self.model.id <= self.last_id)
+        if self.repository_label and "repository" in self.columns:
+            query = query.outerjoin(Repository, Repository.id == self.model.repository_id)
+        if self.since is not None:
+            query = query.where(self.timestamp_column >= self.since)
+        return query.order_by(self.model.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    def batches(self) -> Iterator[List[Any]]:
+        """Rows in batches of EXPORT_BATCH_SIZE, streamed from the database with a server-side cursor."""
+        db = SessionLocal()
+        try:
+            for partition in db.connection().execute(self.query()).partitions():
+                yield partition
+        finally:
+            db.close()
+
+    def stream(self) -> Iterator[bytes]:
+        if self.format == "csv":
+            return self._stream_csv()
+        if self.format == "ndjson":
+            return self._stream_ndjson()
+        return self._stream_parquet()
+
+    def converted(self, batch: List[Any], types) -> List[Any]:
+        """Rows with the values of the given column types converted, None left as is.
+
+        Only the few date/JSON columns are touched; per-value type checks would cost more than the export.
+        """
+        converters = [
+            (index, converter) for index, name in enumerate(self.columns)
+            for column_type, converter in types
+            if isinstance(_column_type(self.model, name), column_type)
+        ]
+        if not converters:
+            return batch
+        rows = []
+        for row in batch:
+            row = list(row)
+            for index, converter in converters:
+                if row[index] is not None:
+                    row[index] = converter(row[index])
+            rows.append(row)
+        return rows
+
+    def _stream_csv(self) -> Iterator[bytes]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self.columns)
+        for batch in self.batches():
+            writer.writerows(self.converted(batch, ((DateTime, datetime.isoformat), (JSON, json.dumps))))
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue().encode("utf-8")
+
+    def _stream_ndjson(self) -> Iterator[bytes]:
+        for batch in self.batches():
+            yield b"".join(
+                dumps(dict(zip(self.columns, row))) + b"\n"
+                for row in self.converted(batch, ((DateTime, datetime.isoformat),))
+            )
+
+    def _stream_parquet(self) -> Iterator[bytes]:
+        schema = pyarrow.schema([(name, _arrow_type(self.model, name)) for name in self.columns])
+        sink = _Sink()
+        writer = pyarrow.parquet.ParquetWriter(sink, schema, compression="zstd")
+        try:
+            for batch in self.batches():
+                columns = zip(*self.converted(batch, ((JSON, json.dumps),)))
+                arrays = [pyarrow.array(values, type=field.type) for field, values in zip(schema, columns)]
+                # One row group per batch, flushed to the client as soon as it's written
+                writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+                yield sink.take()
+        finally:
+            writer.close()
+        yield sink.take()
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file that hands its contents to the response as it fills."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _column_type(model, name: str):
+    """SQLAlchemy type of a column; None for the joined repository label."""
+    column = model.__table__.columns.get(name)
+    return column.type if column is not None else None
+
+
+def _arrow_type(model, name: str):
+    column_type = _column_type(model, name)
+    if isinstance(column_type, Integer):
+        return pyarrow.int64()
+    if isinstance(column_type, Float):
+        return pyarrow.float64()
+    if isinstance(column_type, DateTime):
+        return pyarrow.timestamp("us")
+    return pyarrow.string()  # String, Text, JSON (serialized) and the repository label
@@ -0,0 +1,274 @@
+"""
+Cache of extracted archive content with a disk quota and least-recently-used eviction
+
+Archives never change, so an extraction stays valid until it's evicted. A request is served
+from an existing extraction of the same archive that covers all of its paths.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy.exc import IntegrityError
+
+from database import Archive, ExtractCacheEntry, SessionLocal
+
+# Extract cache settings
+EXTRACT_CACHE_ROOT = os.getenv("DASHBORG_EXTRACT_CACHE_ROOT", "/mounts/extracts/cache")
+EXTRACT_CACHE_QUOTA = int(os.getenv("DASHBORG_EXTRACT_CACHE_QUOTA", str(20 * 1024 ** 3)))  # bytes, 0 = unlimited
+TOUCH_INTERVAL = 60  # seconds; browsing an extraction records its use at most this often
+
+
+def normalize_paths(paths: List[str]) -> List[str]:
+    """Archive paths as borg stores them (no leading or trailing slash), sorted and without duplicates."""
+    normalized = {os.path.normpath(path).strip("/") for path in paths or []}
+    return sorted(path for path in normalized if path and path != ".")
+
+
+def covers(extracted: List[str], requested: List[str]) -> bool:
+    """Whether an extraction of `extracted` paths ([] = everything) contains all `requested` paths."""
+    if not extracted:
+        return True
+    if not requested:
+        return False
+    return all(
+        any(path == prefix or path.startswith(prefix + "/") for prefix in extracted)
+        for path in requested
+    )
+
+
+def disk_usage(directory: str) -> int:
+    """Bytes allocated to the files under a directory."""
+    total = 0
+    for root, dirs, files in os.walk(directory):
+        for name in dirs + files:
+            try:
+                stat = os.lstat(os.path.join(root, name))
+            except OSError:
+                continue
+            total += stat.st_blocks * 512 if hasattr(stat, "st_blocks") else stat.st_size
+    return total
+
+
+def entry_to_dict(entry: ExtractCacheEntry) -> Dict[str, Any]:
+    return {
+        "id": entry.id,
+        "archive": entry.archive,
+        "config": entry.config_file,
+        "paths": entry.paths or [],
+        "directory": entry.directory,
+        "status": entry.status,
+        "job_id": entry.job_id,
+        "size_bytes": entry.size_bytes or 0,
+        "created_at": entry.created_at.isoformat() if entry.created_at else None,
+        "last_access": entry.last_access.isoformat() if entry.last_access else None,
+        "hits": entry.hits or 0
+    }
+
+
+class ExtractCache:
+    """Extractions under root, one directory per (archive, path set), evicted least recently used first.
+
+    Entries are rows in extract_cache, so every worker process shares the cache.
+    """
+
+    def __init__(self, root: str = EXTRACT_CACHE_ROOT, quota: int = EXTRACT_CACHE_QUOTA):
+        self.root = root.rstrip("/")
+        self.quota = quota
+        self.misses = 0
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def archive_key(self, db, config_file: str, archive: str) -> str:
+        """Borg's ID of the archive if it's synced and the name is unambiguous, else config:name."""
+        ids = db.query(Archive.archive_id).filter(Archive.name == archive, Archive.archive_id.is_not(None)).limit(2).all()
+        if len(ids) == 1:
+            return ids[0].archive_id
+        return f"{config_file}:{archive}"
+
+    def lookup(self, config_file: str, archive: str, paths: List[str]) -> Optional[Dict[str, Any]]:
+        """An extraction (ready, or still extracting) that covers the paths; marks it as used."""
+        paths = normalize_paths(paths)
+        db = SessionLocal()
+        try:
+            archive_key = self.archive_key(db, config_file, archive)
+            candidates = db.query(ExtractCacheEntry).filter(ExtractCacheEntry.archive_key == archive_key).all()
+            # Ready before extracting, then the smallest extraction covering the request
+            candidates.sort(key=lambda entry: (entry.status != "ready", not entry.paths, entry.size_bytes or 0))
+            for entry in candidates:
+                if not covers(entry.paths or [], paths):
+                    continue
+                if entry.status == "ready" and not os.path.isdir(entry.directory):
+                    db.delete(entry)  # Removed behind our back
+                    db.commit()
+                    continue
+                entry.hits = (entry.hits or 0) + 1
+                entry.last_access = datetime.utcnow()
+                db.commit()
+                return entry_to_dict(entry)
+            with self._lock:
+                self.misses += 1
+            return None
+        finally:
+            db.close()
+
+    def reserve(self, config_file: str, archive: str, paths: List[str], job_id: str) -> Dict[str, Any]:
+        """Create the entry and directory a new extraction goes into.
+
+        If an identical extraction was reserved concurrently, that entry is returned instead
+        (with a different job_id), and nothing needs to be extracted.
+        """
+        paths = normalize_paths(paths)
+        db = SessionLocal()
+        try:
+            archive_key = self.archive_key(db, config_file, archive)
+            key = hashlib.sha256(json.dumps([archive_key, paths]).encode("utf-8")).hexdigest()
+            entry = ExtractCacheEntry(
+                key=key,
+                archive_key=archive_key,
+                config_file=config_file,
+                archive=archive,
+                paths=paths,
+                directory=os.path.join(self.root, key[:24]),
+                status="extracting",
+                job_id=job_id
+            )
+            db.add(entry)
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                return entry_to_dict(db.query(ExtractCacheEntry).filter(ExtractCacheEntry.key == key).one())
+
+            # Whole-archive extractions will need about the archive's size
+            estimate = 0
+            if not paths:
+                estimate = db.query(Archive.original_size).filter(Archive.name == archive).limit(1).scalar() or 0
+            self.make_room(estimate)
+
+            shutil.rmtree(entry.directory, ignore_errors=True)  # Leftovers of an entry lost in a crash
+            os.makedirs(entry.directory)
+            return entry_to_dict(entry)
+        finally:
+            db.close()
+
+    def complete(self, job_id: str, succeeded: bool):
+        """Account an extraction job's result, or drop its entry if it failed; then enforce the quota."""
+        db = SessionLocal()
+        try:
+            entry = db.query(ExtractCacheEntry).filter(
+                ExtractCacheEntry.job_id == job_id, ExtractCacheEntry.status == "extracting"
+            ).first()
+            if entry is None:
+                return  # Not a cached extraction
+            if not succeeded:
+                shutil.rmtree(entry.directory, ignore_errors=True)
+                db.delete(entry)
+                db.commit()
+                return
+            entry.status = "ready"
+            entry.size_bytes = disk_usage(entry.directory)
+            entry.last_access = datetime.utcnow()
+            db.commit()
+        finally:
+            db.close()
+        self.make_room()
+
+    def make_room(self, needed: int = 0) -> List[Dict[str, Any]]:
+        """Evict least recently used extractions until used space plus `needed` fits the quota.
+
+        The most recently used extraction is kept even if it alone exceeds the quota.
+        """
+        if not self.quota:
+            return []
+        evicted = []
+        db = SessionLocal()
+        try:
+            ready = db.query(ExtractCacheEntry).filter(ExtractCacheEntry.status == "ready").order_by(ExtractCacheEntry.last_access).all()
+            used = sum(entry.size_bytes or 0 for entry in ready)
+            for entry in ready[:-1] if not needed else ready:
+                if used + needed <= self.quota:
+                    break
+                used -= entry.size_bytes or 0
+                evicted.append(entry_to_dict(entry))
+                self._remove(db, entry)
+            db.commit()
+        finally:
+            db.close()
+        if evicted:
+            print(f"✓ Evicted {len(evicted)} cached extractions ({sum(e['size_bytes'] for e in evicted)} bytes) to stay under the quota")
+        return evicted
+
+    def evict(self, entry_id: Optional[int] = None) -> int:
+        """Remove one ready extraction, or all of them; returns how many were removed."""
+        db = SessionLocal()
+        try:
+            query = db.query(ExtractCacheEntry).filter(ExtractCacheEntry.status == "ready")
+            if entry_id is not None:
+                query = query.filter(ExtractCacheEntry.id == entry_id)
+            entries = query.all()
+            for entry in entries:
+                self._remove(db, entry)
+            db.commit()
+            return len(entries)
+        finally:
+            db.close()
+
+    def _remove(self, db, entry: ExtractCacheEntry):
+        shutil.rmtree(entry.directory, ignore_errors=True)
+        db.delete(entry)
+
+    def touch_path(self, path: str):
+        """Mark the extraction containing a browsed or downloaded path as recently used."""
+        if not path.startswith(self.root + "/"):
+            return
+        directory = os.path.join(self.root, path[len(self.root) + 1:].split("/", 1)[0])
+        now = time.monotonic()
+        with self._lock:
+            if now - self._touched.get(directory, 0) < TOUCH_INTERVAL:
+                return
+            self._touched[directory] = now
+        db = SessionLocal()
+        try:
+            db.query(ExtractCacheEntry).filter(ExtractCacheEntry.directory == directory).update({"last_access": datetime.utcnow()})
+            db.commit()
+        finally:
+            db.close()
+
+    def recover(self, active_job_ids: Set[str]):
+        """Drop extractions interrupted by a restart and directories no entry refers to."""
+        db = SessionLocal()
+        try:
+            for entry in db.query(ExtractCacheEntry).filter(ExtractCacheEntry.status == "extracting").all():
+                if entry.job_id not in active_job_ids:
+                    self._remove(db, entry)
+            db.commit()
+            known = {os.path.basename(directory) for (directory,) in db.query(ExtractCacheEntry.directory).all()}
+        finally:
+            db.close()
+        if os.path.isdir(self.root):
+            for name in os.listdir(self.root):
+                if name not in known and os.path.isdir(os.path.join(self.root, name)):
+                    shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def status(self) -> Dict[str, Any]:
+        """Quota, space used and the cached extractions, most recently used first."""
+        db = SessionLocal()
+        try:
+            entries = [entry_to_dict(entry) for entry in db.query(ExtractCacheEntry).order_by(ExtractCacheEntry.last_access.desc()).all()]
+        finally:
+            db.close()
+        used = sum(entry["size_bytes"] for entry in entries if entry["status"] == "ready")
+        return {
+            "root": self.root,
+            "quota_bytes": self.quota or None,
+            "used_bytes": used,
+            "free_bytes": max(self.quota - used, 0) if self.quota else None,
+            "entries": entries,
+            "hits": sum(entry["hits"] for entry in entries),
+            "misses": self.misses  # since this process started
+        }
@@ -0,0 +1,529 @@
+"""
+Federation of DashBorg instances: a change feed peers can pull, and pulling peers into a local view
+
+Every instance serves /api/federation/changes. An instance with DASHBORG_FEDERATION_PEERS pulls
+that feed from each peer incrementally and keeps their repositories, archives, statistics and
+job summaries in the federated_* tables, so the federated dashboard is answered locally.
+"""
+import base64
+import gzip
+import json
+import os
+import random
+import socket
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert
+
+from database import (
+    Archive, BackupJob, FederatedArchive, FederatedJob, FederatedPeer, FederatedRepository,
+    FederatedStatistics, Repository, RepositoryStatistics, SessionLocal
+)
+
+try:
+    import zstandard
+except ImportError:  # Ask peers for gzip only
+    zstandard = None
+
+# Federation settings
+FEDERATION_PEERS = os.getenv("DASHBORG_FEDERATION_PEERS", "")  # "web1=http://web1:8000,http://db1:8000" (name defaults to the host)
+INSTANCE_NAME = os.getenv("DASHBORG_INSTANCE_NAME", socket.gethostname())  # how this instance names itself to others
+FEDERATION_INTERVAL = int(os.getenv("DASHBORG_FEDERATION_INTERVAL", "300"))  # seconds between pulls of a peer
+FEDERATION_CONCURRENCY = int(os.getenv("DASHBORG_FEDERATION_CONCURRENCY", "4"))  # peers pulled at once
+FEDERATION_TIMEOUT = 30  # seconds per request
+FEDERATION_MAX_BACKOFF = 3600  # seconds between attempts at a peer that keeps failing
+FEDERATION_TICK = 15  # seconds between checks for peers due for a pull
+CHANGES_PAGE_SIZE = 5000  # rows per table and page of the change feed
+MAX_PAGES_PER_PULL = 1000
+MAX_OPEN_JOBS = 200
+ERROR_SUMMARY_LENGTH = 500  # characters of a job's error sent to peers
+
+ARCHIVE_FIELDS = ("id", "repository_id", "name", "start", "end", "duration", "original_size", "compressed_size", "deduplicated_size", "nfiles", "hostname")
+STATISTICS_FIELDS = ("id", "repository_id", "collected_at", "total_size", "total_csize", "unique_size", "unique_csize", "deduplication_ratio")
+JOB_FIELDS = ("id", "job_id", "job_type", "config_file", "repository", "status", "created_at", "started_at", "completed_at", "return_code", "error")
+DATETIME_FIELDS = {"start", "end", "collected_at", "created_at", "started_at", "completed_at", "last_modified"}
+
+
+def encode_cursor(cursor: Dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(cursor, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(token: Optional[str]) -> Dict[str, Any]:
+    """Cursor from its URL form; empty for the start of the feed. Raises ValueError if malformed."""
+    if not token:
+        return {}
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid federation cursor")
+    if not isinstance(cursor, dict):
+        raise ValueError("Invalid federation cursor")
+    return cursor
+
+
+def _serialize(row) -> Dict[str, Any]:
+    return {key: value.isoformat() if isinstance(value, datetime) else value for key, value in row._mapping.items()}
+
+
+def _page(db, model, fields, after: int, limit: int) -> List[Dict[str, Any]]:
+    rows = db.execute(
+        select(*(getattr(model, field) for field in fields)).where(model.id > after).order_by(model.id).limit(limit)
+    ).all()
+    return [_serialize(row) for row in rows]
+
+
+def collect_changes(db, cursor: Dict[str, Any], limit: int = CHANGES_PAGE_SIZE) -> Dict[str, Any]:
+    """One page of the change feed after cursor, and the cursor to continue from.
+
+    Archives and statistics are only ever added (or deleted), so their position is the last id
+    sent; repositories carry their archive count so deletions can be noticed. Jobs change until
+    they finish, so the cursor also lists the jobs that were still open, which are sent again.
+    Likewise archives recorded provisionally from a backup are sent again once a sync replaced them.
+    """
+    archives_after = int(cursor.get("archives", 0))
+    statistics_after = int(cursor.get("statistics", 0))
+    jobs_after = int(cursor.get("jobs", 0))
+    open_jobs = [int(job_id) for job_id in cursor.get("open_jobs", [])][:MAX_OPEN_JOBS]
+    provisional = [int(archive_id) for archive_id in cursor.get("provisional_archives", [])][:MAX_OPEN_JOBS]
+
+    archive_counts = dict(db.execute(select(Archive.repository_id, func.count(Archive.id)).group_by(Archive.repository_id)).all())
+    repositories = [
+        {**_serialize(row), "archive_count": archive_counts.get(row.id, 0)}
+        for row in db.execute(select(
+            Repository.id, Repository.label, Repository.location, Repository.encryption_mode, Repository.last_modified
+        )).all()
+    ]
+    new_archives = _page(db, Archive, ARCHIVE_FIELDS, archives_after, limit)
+    archives_until = new_archives[-1]["id"] if new_archives else archives_after
+    synced = []
+    if provisional:
+        synced = [
+            _serialize(row) for row in db.execute(
+                select(*(getattr(Archive, field) for field in ARCHIVE_FIELDS))
+                .where(Archive.id.in_(provisional), Archive.provisional.is_not(True))
+            ).all()
+        ]
+    archives = synced + new_archives
+    still_provisional = db.execute(
+        select(Archive.id).where(Archive.provisional.is_(True), Archive.id <= archives_until).order_by(Archive.id)
+    ).scalars().all()
+    statistics = _page(db, RepositoryStatistics, STATISTICS_FIELDS, statistics_after, limit)
+    new_jobs = _page(db, BackupJob, JOB_FIELDS, jobs_after, limit)
+
+    refreshed = []
+    if open_jobs:
+        refreshed = [
+            _serialize(row) for row in db.execute(
+                select(*(getattr(BackupJob, field) for field in JOB_FIELDS)).where(BackupJob.id.in_(open_jobs))
+            ).all()
+        ]
+    removed_jobs = sorted(set(open_jobs) - {job["id"] for job in refreshed})
+    jobs = refreshed + new_jobs
+    for job in jobs:
+        if job["error"] and len(job["error"]) > ERROR_SUMMARY_LENGTH:
+            job["error"] = job["error"][:ERROR_SUMMARY_LENGTH] + "…"
+
+    return {
+        "instance": INSTANCE_NAME,
+        "generated_at": datetime.utcnow().isoformat(),
+        "cursor": {
+            "archives": archives_until,
+            "statistics": statistics[-1]["id"] if statistics else statistics_after,
+            "jobs": max([jobs_after] + [job["id"] for job in jobs]),
+            "open_jobs": [job["id"] for job in jobs if job["status"] in ("pending", "running")][-MAX_OPEN_JOBS:],
+            "provisional_archives": still_provisional[-MAX_OPEN_JOBS:]
+        },
+        "more": max(len(new_archives), len(statistics), len(new_jobs)) >= limit,
+        "repositories": repositories,
+        "archives": archives,
+        "statistics": statistics,
+        "jobs": jobs,
+        "removed_jobs": removed_jobs
+    }
+
+
+def parse_peers(spec: str) -> List[Tuple[str, str]]:
+    """(name, base URL) of each comma-separated "name=url" or "url"."""
+    peers = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, url = item.partition("=") if "=" in item.split("://", 1)[0] else ("", "", item)
+        url = url.rstrip("/")
+        peers.append((name or urllib.parse.urlparse(url).hostname or url, url))
+    return peers
+
+
+def fetch_json(url: str, timeout: float = FEDERATION_TIMEOUT) -> Tuple[Any, int]:
+    """GET a JSON document with compressed transfer; returns it and the bytes transferred."""
+    request = urllib.request.Request(url, headers={
+        "Accept": "application/json",
+        "Accept-Encoding": "zstd, gzip" if zstandard is not None else "gzip",
+        "User-Agent": f"DashBorg-Federation ({INSTANCE_NAME})"
+    })
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        body = response.read()
+        encoding = response.headers.get("Content-Encoding", "")
+    transferred = len(body)
+    if encoding == "gzip":
+        body = gzip.decompress(body)
+    elif encoding == "zstd":
+        body = zstandard.ZstdDecompressor().decompress(body)
+    return json.loads(body), transferred
+
+
+def _values(peer: str, rows: List[Dict[str, Any]], fields, renamed: Dict[str, str]) -> List[Dict[str, Any]]:
+    values = []
+    for row in rows:
+        value = {"peer": peer, "remote_id": row["id"]}
+        for field in fields:
+            if field == "id":
+                continue
+            item = row.get(field)
+            if item is not None and field in DATETIME_FIELDS:
+                item = datetime.fromisoformat(item)
+            value[renamed.get(field, field)] = item
+        values.append(value)
+    return values
+
+
+def _upsert(db, model, values: List[Dict[str, Any]]):
+    if not values:
+        return
+    statement = insert(model)
+    columns = [key for key in values[0] if key not in ("peer", "remote_id")]
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[model.peer, model.remote_id],
+            set_={column: statement.excluded[column] for column in columns}
+        ),
+        values
+    )
+
+
+def apply_changes(db, peer: str, page: Dict[str, Any]) -> int:
+    """Store one page of a peer's change feed; returns the rows stored."""
+    renamed = {"repository_id": "repository_remote_id"}
+    repositories = _values(peer, page["repositories"], ("id", "label", "location", "encryption_mode", "last_modified", "archive_count"), renamed)
+    archives = _values(peer, page["archives"], ARCHIVE_FIELDS, renamed)
+    statistics = _values(peer, page["statistics"], STATISTICS_FIELDS, renamed)
+    jobs = _values(peer, page["jobs"], JOB_FIELDS, renamed)
+
+    _upsert(db, FederatedRepository, repositories)
+    db.execute(delete(FederatedRepository).where(
+        FederatedRepository.peer == peer,
+        FederatedRepository.remote_id.not_in([value["remote_id"] for value in repositories])
+    ))
+    _upsert(db, FederatedArchive, archives)
+    _upsert(db, FederatedStatistics, statistics)
+    _upsert(db, FederatedJob, jobs)
+    if page.get("removed_jobs"):
+        db.execute(delete(FederatedJob).where(FederatedJob.peer == peer, FederatedJob.remote_id.in_(page["removed_jobs"])))
+    return len(archives) + len(statistics) + len(jobs)
+
+
+def _delete_peer_data(db, peer: str):
+    for model in (FederatedRepository, FederatedArchive, FederatedStatistics, FederatedJob):
+        db.execute(delete(model).where(model.peer == peer))
+
+
+class Federation:
+    """Pulls the change feeds of the configured peers, a few at a time, backing off from unreachable ones."""
+
+    def __init__(self, peers: str = FEDERATION_PEERS, interval: int = FEDERATION_INTERVAL, concurrency: int = FEDERATION_CONCURRENCY):
+        self.peers = parse_peers(peers)
+        self.interval = interval
+        self.concurrency = max(1, concurrency)
+        self._pulling = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def sync_peers(self):
+        """Make federated_peers match the configured peers; data of peers no longer configured is dropped."""
+        db = SessionLocal()
+        try:
+            configured = dict(self.peers)
+            for peer in db.query(FederatedPeer).all():
+                if peer.name not in configured:
+                    _delete_peer_data(db, peer.name)
+                    db.delete(peer)
+                elif peer.url != configured[peer.name]:
+                    # Another instance behind the name: start over
+                    _delete_peer_data(db, peer.name)
+                    peer.url = configured[peer.name]
+                    peer.cursor = None
+                configured.pop(peer.name, None)
+            for name, url in configured.items():
+                db.add(FederatedPeer(name=name, url=url, failures=0))
+            db.commit()
+        finally:
+            db.close()
+
+    def pull(self, name: str) -> Dict[str, Any]:
+        """Pull everything a peer changed since the last pull; returns the peer's status afterwards."""
+        with self._lock:
+            if name in self._pulling:
+                return {"name": name, "skipped": "already being pulled"}
+            self._pulling.add(name)
+        try:
+            return self._pull(name)
+        finally:
+            with self._lock:
+                self._pulling.discard(name)
+
+    def _pull(self, name: str) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            peer = db.query(FederatedPeer).filter(FederatedPeer.name == name).first()
+            if peer is None:  # Configured, but the executor hasn't recorded it yet
+                self.sync_peers()
+                peer = db.query(FederatedPeer).filter(FederatedPeer.name == name).one()
+            peer.last_attempt_at = datetime.utcnow()
+            db.commit()
+            cursor = dict(peer.cursor or {})
+            rows = transferred = 0
+            full_archive_resync = False
+            seen_archives = set()
+            try:
+                for _ in range(MAX_PAGES_PER_PULL):
+                    query = urllib.parse.urlencode({"cursor": encode_cursor(cursor), "limit": CHANGES_PAGE_SIZE})
+                    page, size = fetch_json(f"{peer.url}/api/federation/changes?{query}")
+                    transferred += size
+                    rows += apply_changes(db, name, page)
+                    cursor = page["cursor"]
+                    peer.cursor = cursor
+                    peer.instance = page.get("instance")
+                    db.commit()  # Each page with its cursor, so an interrupted pull resumes where it stopped
+                    if full_archive_resync:
+                        seen_archives.update(archive["id"] for archive in page["archives"])
+                    if page["more"]:
+                        continue
+                    if full_archive_resync:
+                        self._drop_missing_archives(db, name, seen_archives)
+                        break
+                    if not self._archive_counts_match(db, name, page["repositories"]):
+                        # Archives were deleted (pruned) on the peer: list them all once more
+                        full_archive_resync = True
+                        cursor = {**cursor, "archives": 0}
+                        continue
+                    break
+            except Exception as e:
+                db.rollback()
+                peer.failures = (peer.failures or 0) + 1
+                backoff = min(self.interval * 2 ** (peer.failures - 1), FEDERATION_MAX_BACKOFF)
+                peer.next_attempt_at = datetime.utcnow() + timedelta(seconds=backoff * random.uniform(0.9, 1.1))
+                peer.last_error = str(e) or e.__class__.__name__
+                db.commit()
+                print(f"Federation pull from {name} failed ({peer.failures} in a row, next try in {backoff:.0f}s): {peer.last_error}")
+                return self.peer_status(peer)
+
+            peer.failures = 0
+            peer.last_error = None
+            peer.last_success_at = datetime.utcnow()
+            peer.next_attempt_at = peer.last_success_at + timedelta(seconds=self.interval)
+            peer.last_pull_rows = rows
+            peer.last_pull_bytes = transferred
+            db.commit()
+            return self.peer_status(peer)
+        finally:
+            db.close()
+
+    def _archive_counts_match(self, db, peer: str, repositories: List[Dict[str, Any]]) -> bool:
+        local = dict(db.execute(
+            select(FederatedArchive.repository_remote_id, func.count(FederatedArchive.id))
+            .where(FederatedArchive.peer == peer)
+            .group_by(FederatedArchive.repository_remote_id)
+        ).all())
+        return all(local.get(repository["id"], 0) == repository["archive_count"] for repository in repositories)
+
+    def _drop_missing_archives(self, db, peer: str, seen: set):
+        stored = db.execute(select(FederatedArchive.remote_id).where(FederatedArchive.peer == peer)).scalars().all()
+        missing = [remote_id for remote_id in stored if remote_id not in seen]
+        for start in range(0, len(missing), 500):
+            db.execute(delete(FederatedArchive).where(FederatedArchive.peer == peer, FederatedArchive.remote_id.in_(missing[start:start + 500])))
+        db.commit()
+
+    def due_peers(self, now: Optional[datetime] = None) -> List[str]:
+        now = now or datetime.utcnow()
+        db = SessionLocal()
+        try:
+            return [
+                name for (name,) in db.execute(
+                    select(FederatedPeer.name).where(
+                        (FederatedPeer.next_attempt_at.is_(None)) | (FederatedPeer.next_attempt_at <= now)
+                    )
+                ).all()
+            ]
+        finally:
+            db.close()
+
+    def pull_all(self, names: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Pull the given peers (default: those due), at most `concurrency` at a time."""
+        names = self.due_peers() if names is None else names
+        if not names:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(names)), thread_name_prefix="federation") as pool:
+            return list(pool.map(self.pull, names))
+
+    def start(self):
+        if not self.peers or self._thread is not None:
+            return self._thread
+        self.sync_peers()
+
+        def pull_loop():
+            while True:
+                try:
+                    self.pull_all()
+                except Exception as e:
+                    print(f"Error pulling federation peers: {e}")
+                time.sleep(FEDERATION_TICK)
+
+        self._thread = threading.Thread(target=pull_loop, name="federation", daemon=True)
+        self._thread.start()
+        print(f"✓ Federating {len(self.peers)} peers every {self.interval}s ({self.concurrency} at a time)")
+        return self._thread
+
+    def peer_status(self, peer: FederatedPeer, now: Optional[datetime] = None) -> Dict[str, Any]:
+        now = now or datetime.utcnow()
+        if peer.last_success_at is None:
+            state = "failing" if peer.failures else "pending"
+        elif peer.failures:
+            state = "failing"
+        elif now - peer.last_success_at > timedelta(seconds=3 * self.interval):
+            state = "stale"
+        else:
+            state = "ok"
+        return {
+            "name": peer.name,
+            "url": peer.url,
+            "instance": peer.instance,
+            "state": state,
+            "last_attempt_at": peer.last_attempt_at.isoformat() if peer.last_attempt_at else None,
+            "last_success_at": peer.last_success_at.isoformat() if peer.last_success_at else None,
+            "next_attempt_at": peer.next_attempt_at.isoformat() if peer.next_attempt_at else None,
+            "failures": peer.failures or 0,
+            "last_error": peer.last_error,
+            "last_pull_rows": peer.last_pull_rows,
+            "last_pull_bytes": peer.last_pull_bytes
+        }
+
+    def peer_statuses(self) -> List[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            return [self.peer_status(peer) for peer in db.query(FederatedPeer).order_by(FederatedPeer.name).all()]
+        finally:
+            db.close()
+
+    def dashboard(self, recent: int = 20) -> Dict[str, Any]:
+        """Per-instance summary of this instance and every peer, from the local database only."""
+        since = datetime.utcnow() - timedelta(hours=24)
+        db = SessionLocal()
+        try:
+            peers = db.query(FederatedPeer).order_by(FederatedPeer.name).all()
+            local = _summarize(
+                db, Repository, Archive, RepositoryStatistics, BackupJob, since,
+                archive_repository=Archive.repository_id, statistics_repository=RepositoryStatistics.repository_id
+            ).get(None, {})
+            federated = _summarize(
+                db, FederatedRepository, FederatedArchive, FederatedStatistics, FederatedJob, since,
+                archive_repository=FederatedArchive.repository_remote_id, statistics_repository=FederatedStatistics.repository_remote_id,
+                peer_of=lambda model: model.peer
+            )
+
+            instances = [{"name": INSTANCE_NAME, "local": True, "state": "ok", **_empty_summary(), **local}]
+            for peer in peers:
+                instances.append({**self.peer_status(peer), "local": False, **_empty_summary(), **federated.get(peer.name, {})})
+
+            recent_archives = [
+                {"instance": row.peer, "name": row.name, "start": row.start.isoformat() if row.start else None,
+                 "original_size": row.original_size, "deduplicated_size": row.deduplicated_size}
+                for row in db.execute(
+                    select(FederatedArchive.peer, FederatedArchive.name, FederatedArchive.start, FederatedArchive.original_size, FederatedArchive.deduplicated_size)
+                    .order_by(FederatedArchive.start.desc()).limit(recent)
+                ).all()
+            ]
+            recent_failures = [
+                {"instance": row.peer, "job_id": row.job_id, "type": row.job_type, "config": row.config_file,
+                 "completed_at": row.completed_at.isoformat() if row.completed_at else None, "error": row.error}
+                for row in db.execute(
+                    select(FederatedJob.peer, FederatedJob.job_id, FederatedJob.job_type, FederatedJob.config_file, FederatedJob.completed_at, FederatedJob.error)
+                    .where(FederatedJob.status == "failed").order_by(FederatedJob.created_at.desc()).limit(recent)
+                ).all()
+            ]
+        finally:
+            db.close()
+
+        totals = {key: sum(instance[key] or 0 for instance in instances) for key in ("repositories", "archives", "original_size", "unique_size", "running_jobs", "completed_jobs_24h", "failed_jobs_24h")}
+        return {
+            "instances": instances,
+            "totals": totals,
+            "last_backup": max((instance["last_backup"] for instance in instances if instance["last_backup"]), default=None),
+            "recent_archives": recent_archives,
+            "recent_failures": recent_failures
+        }
+
+
+def _empty_summary() -> Dict[str, Any]:
+    return {"repositories": 0, "archives": 0, "last_backup": None, "original_size": 0, "unique_size": 0,
+            "running_jobs": 0, "completed_jobs_24h": 0, "failed_jobs_24h": 0}
+
+
+def _summarize(db, repository_model, archive_model, statistics_model, job_model, since: datetime,
+               archive_repository, statistics_repository, peer_of=None) -> Dict[Any, Dict[str, Any]]:
+    """Counts and sizes per peer (None for the local tables), with a handful of grouped queries."""
+    def group(model):
+        return [peer_of(model)] if peer_of else []
+
+    def key(row):
+        return row[0] if peer_of else None
+
+    summary: Dict[Any, Dict[str, Any]] = {}
+
+    for row in db.execute(select(*group(repository_model), func.count(repository_model.id)).group_by(*group(repository_model))).all():
+        summary.setdefault(key(row), {})["repositories"] = row[-1]
+
+    for row in db.execute(
+        select(*group(archive_model), func.count(archive_model.id), func.max(archive_model.start)).group_by(*group(archive_model))
+    ).all():
+        entry = summary.setdefault(key(row), {})
+        entry["archives"] = row[-2]
+        entry["last_backup"] = row[-1].isoformat() if row[-1] else None
+
+    # Latest statistics snapshot of each repository
+    id_column = statistics_model.remote_id if peer_of else statistics_model.id
+    latest = (
+        select(*group(statistics_model), func.max(id_column).label("latest"))
+        .group_by(*group(statistics_model), statistics_repository)
+        .subquery()
+    )
+    join_on = id_column == latest.c.latest
+    if peer_of:
+        join_on = join_on & (statistics_model.peer == latest.c.peer)
+    for row in db.execute(
+        select(*group(statistics_model), func.sum(statistics_model.total_size), func.sum(statistics_model.unique_size))
+        .join(latest, join_on).group_by(*group(statistics_model))
+    ).all():
+        entry = summary.setdefault(key(row), {})
+        entry["original_size"] = row[-2] or 0
+        entry["unique_size"] = row[-1] or 0
+
+    for row in db.execute(
+        select(*group(job_model), job_model.status, func.count(job_model.id))
+        .where((job_model.created_at >= since) | job_model.status.in_(("pending", "running")))
+        .group_by(*group(job_model), job_model.status)
+    ).all():
+        entry = summary.setdefault(key(row), {})
+        status, count = row[-2], row[-1]
+        if status in ("pending", "running"):
+            entry["running_jobs"] = entry.get("running_jobs", 0) + count
+        elif status in ("completed", "failed"):
+            entry[f"{status}_jobs_24h"] = count
+    return summary
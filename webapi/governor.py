@@ -0,0 +1,176 @@
+"""
+Resource classes for borg child processes: CPU/IO priority, optional cgroup v2 weights, concurrency caps
+"""
+import asyncio
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict, List
+
+# Resource governor settings
+CGROUP_ROOT = os.getenv("DASHBORG_CGROUP_ROOT", "")  # delegated cgroup v2 directory to create class cgroups in
+
+# nice: CPU niceness; ionice_class: "best-effort" (with ionice_level 0-7) or "idle";
+# cpu_weight/io_weight: cgroup v2 weights (1-10000, default 100); memory_high: bytes, throttled above;
+# max_concurrent: jobs of the class running at once, 0 for no cap.
+RESOURCE_CLASSES: Dict[str, Dict[str, Any]] = {
+    "interactive": {"nice": 0, "ionice_class": "best-effort", "ionice_level": 0, "cpu_weight": 400, "io_weight": 400, "memory_high": None, "max_concurrent": 4},
+    "mount": {"nice": 0, "ionice_class": "best-effort", "ionice_level": 2, "cpu_weight": 200, "io_weight": 200, "memory_high": None, "max_concurrent": 0},
+    "backup": {"nice": 10, "ionice_class": "best-effort", "ionice_level": 7, "cpu_weight": 100, "io_weight": 100, "memory_high": None, "max_concurrent": 4},
+    "maintenance": {"nice": 19, "ionice_class": "idle", "ionice_level": None, "cpu_weight": 20, "io_weight": 20, "memory_high": None, "max_concurrent": 1},
+}
+# Overrides per class, e.g. '{"maintenance": {"max_concurrent": 2, "memory_high": 2147483648}}'
+for _name, _overrides in json.loads(os.getenv("DASHBORG_RESOURCE_CLASSES", "{}")).items():
+    RESOURCE_CLASSES.setdefault(_name, dict(RESOURCE_CLASSES["backup"])).update(_overrides)
+
+# Job type (prefix) -> resource class; restores and browsing come before background verification
+JOB_TYPE_CLASSES = (
+    ("backup-create", "backup"),
+    ("extract", "interactive"),
+    ("restore", "interactive"),
+    ("diff", "interactive"),
+    ("repo-create", "interactive"),
+    ("mount", "mount"),
+    ("prune", "maintenance"),
+    ("check", "maintenance"),
+)
+DEFAULT_CLASS = "backup"
+
+IONICE_CLASSES = {"best-effort": "2", "idle": "3"}
+
+
+def setup_cgroups(root: str, classes: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+    """Create a child cgroup per class under root, with its weights; {} if cgroup v2 can't be used there.
+
+    root must be a cgroup v2 directory this process may manage (e.g. delegated by systemd)
+    and must not contain processes itself, as controllers are enabled for its children.
+    """
+    if not root:
+        return {}
+    try:
+        with open(os.path.join(root, "cgroup.controllers")) as f:
+            available = f.read().split()
+        enable = [controller for controller in ("cpu", "io", "memory") if controller in available]
+        if enable:
+            with open(os.path.join(root, "cgroup.subtree_control"), "w") as f:
+                f.write(" ".join(f"+{controller}" for controller in enable))
+
+        paths = {}
+        for name, settings in classes.items():
+            path = os.path.join(root, f"dashborg-{name}")
+            os.makedirs(path, exist_ok=True)
+            for filename, value in (
+                ("cpu.weight", settings.get("cpu_weight")),
+                ("io.weight", f"default {settings['io_weight']}" if settings.get("io_weight") else None),
+                ("memory.high", settings.get("memory_high")),
+            ):
+                if value is not None and os.path.exists(os.path.join(path, filename)):
+                    with open(os.path.join(path, filename), "w") as f:
+                        f.write(str(value))
+            paths[name] = path
+        print(f"✓ cgroup v2 resource classes under {root} ({', '.join(enable) or 'no controllers'})")
+        return paths
+    except OSError as e:
+        print(f"Warning: cgroup v2 limits unavailable in {root} ({e}); using nice/ionice only")
+        return {}
+
+
+class ResourceGovernor:
+    """Applies a job's resource class to the borg/borgmatic processes it starts and caps concurrency per class."""
+
+    def __init__(self, classes: Dict[str, Dict[str, Any]] = RESOURCE_CLASSES, cgroup_root: str = CGROUP_ROOT):
+        self.classes = classes
+        self.cgroup_root = cgroup_root
+        self.cgroups: Dict[str, str] = {}
+        self.nice_path = shutil.which("nice")
+        self.ionice_path = shutil.which("ionice")
+        self._slots = {
+            name: threading.BoundedSemaphore(settings["max_concurrent"])
+            for name, settings in classes.items() if settings.get("max_concurrent")
+        }
+        self._waiting: Dict[str, int] = {name: 0 for name in classes}
+        self._lock = threading.Lock()
+
+    def setup(self):
+        """Create the class cgroups, if configured; called once on the executor."""
+        self.cgroups = setup_cgroups(self.cgroup_root, self.classes)
+
+    def class_for(self, job_type: str) -> str:
+        for prefix, name in JOB_TYPE_CLASSES:
+            if job_type.startswith(prefix) and name in self.classes:
+                return name
+        return DEFAULT_CLASS
+
+    def limits(self, job_type: str) -> Dict[str, Any]:
+        """The limits a job of this type runs with, as recorded on the job."""
+        name = self.class_for(job_type)
+        settings = self.classes[name]
+        return {
+            "class": name,
+            "nice": settings.get("nice") if self.nice_path else None,
+            "ionice_class": settings.get("ionice_class") if self.ionice_path else None,
+            "ionice_level": settings.get("ionice_level") if self.ionice_path else None,
+            "cgroup": self.cgroups.get(name),
+            "cpu_weight": settings.get("cpu_weight") if name in self.cgroups else None,
+            "io_weight": settings.get("io_weight") if name in self.cgroups else None,
+            "memory_high": settings.get("memory_high") if name in self.cgroups else None,
+            "max_concurrent": settings.get("max_concurrent") or None,
+        }
+
+    def acquire(self, job_type: str) -> Dict[str, Any]:
+        """Wait for a free slot in the job type's class; returns its limits, including the time waited."""
+        limits = self.limits(job_type)
+        slot = self._slots.get(limits["class"])
+        start = time.monotonic()
+        if slot is not None:
+            with self._lock:
+                self._waiting[limits["class"]] += 1
+            try:
+                slot.acquire()
+            finally:
+                with self._lock:
+                    self._waiting[limits["class"]] -= 1
+        limits["waited_seconds"] = round(time.monotonic() - start, 3)
+        return limits
+
+    async def acquire_async(self, job_type: str) -> Dict[str, Any]:
+        """acquire() in a worker thread, for the event loop; a slot taken after the caller gave up is released."""
+        waiting = asyncio.ensure_future(asyncio.to_thread(self.acquire, job_type))
+        try:
+            return await asyncio.shield(waiting)
+        except asyncio.CancelledError:
+            def release_unused(done):
+                if not done.cancelled() and done.exception() is None:
+                    self.release(done.result())
+            waiting.add_done_callback(release_unused)
+            raise
+
+    def release(self, limits: Dict[str, Any]):
+        slot = self._slots.get(limits["class"])
+        if slot is not None:
+            slot.release()
+
+    def wrap(self, cmd: List[str], limits: Dict[str, Any]) -> List[str]:
+        """Command line that runs cmd with the limits; nice, ionice and sh exec, so the PID stays cmd's."""
+        prefix = []
+        if limits.get("nice"):
+            prefix += [self.nice_path, "-n", str(limits["nice"])]
+        if limits.get("ionice_class") in IONICE_CLASSES:
+            # -t: run anyway if the kernel or IO scheduler doesn't allow it
+            prefix += [self.ionice_path, "-t", "-c", IONICE_CLASSES[limits["ionice_class"]]]
+            if limits["ionice_class"] == "best-effort" and limits.get("ionice_level") is not None:
+                prefix += ["-n", str(limits["ionice_level"])]
+        if limits.get("cgroup"):
+            # Join the class cgroup before exec, so borg and everything it starts is accounted there
+            prefix += ["sh", "-c", 'echo $$ > "$0" && exec "$@"', os.path.join(limits["cgroup"], "cgroup.procs")]
+        return prefix + list(cmd)
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        """Per class: concurrency cap and jobs waiting for a slot."""
+        with self._lock:
+            return {
+                name: {"max_concurrent": settings.get("max_concurrent") or None, "waiting": self._waiting[name], "cgroup": self.cgroups.get(name)}
+                for name, settings in self.classes.items()
+            }
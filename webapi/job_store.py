@@ -0,0 +1,392 @@
+"""
+Shared live job and mount state, so several uvicorn workers can serve one DashBorg instance
+
+One worker process is elected executor through a lease in the database. It runs all
+borg/borgmatic jobs and keeps their live state in memory. Every other worker queues the
+jobs it creates for the executor and reads live state from the store.
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import IntegrityError
+
+from database import ExecutorLease, LiveJob, LiveMount, QueuedJob, SessionLocal, engine
+
+# Job store settings
+JOB_STORE = os.getenv("DASHBORG_JOB_STORE", "memory")  # "memory" (single process) or "sqlite"
+EXECUTOR_LEASE_TTL = float(os.getenv("DASHBORG_EXECUTOR_LEASE_TTL", "15"))  # seconds
+JOB_STATE_PUBLISH_INTERVAL = float(os.getenv("DASHBORG_JOB_STATE_PUBLISH_INTERVAL", "1"))  # seconds
+LIVE_OUTPUT_TAIL = int(os.getenv("DASHBORG_LIVE_OUTPUT_TAIL", "1000"))  # output lines shared per running job
+JOB_QUEUE_POLL_INTERVAL = 0.5  # seconds
+
+# Identifies this worker process as lease and job owner
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+QueuedJobSpec = Tuple[Dict[str, Any], str, List[Any]]  # (job dict, runner name, runner args)
+
+
+class JobStore(ABC):
+    """Live state of pending/running jobs and of archive mounts.
+
+    Jobs run by this process live in `local_jobs` (the dict the job runners update)
+    and are always served from there.
+    """
+
+    def __init__(self, local_jobs: Dict[str, Dict[str, Any]]):
+        self.local_jobs = local_jobs
+
+    def setup(self):
+        """Prepare the backing storage; called once the database tables exist."""
+
+    # Jobs
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def get_many(self, job_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def active(self) -> List[Dict[str, Any]]:
+        """All pending and running jobs, on any worker."""
+
+    @abstractmethod
+    def remove(self, job_id: str):
+        ...
+
+    def publish(self):
+        """Share the live state of jobs run by this process."""
+
+    def start_publisher(self, interval: float = JOB_STATE_PUBLISH_INTERVAL):
+        """Publish live job state periodically from a background thread."""
+
+    def reset_live_jobs(self) -> Set[str]:
+        """Forget live state left by a previous executor; returns IDs of jobs still queued."""
+        return set()
+
+    # Queue of jobs waiting for the executor
+    @abstractmethod
+    def enqueue(self, job: Dict[str, Any], runner: str, args: List[Any]):
+        ...
+
+    @abstractmethod
+    def claim(self) -> List[QueuedJobSpec]:
+        """Take all queued jobs, oldest first."""
+
+    # Mounts
+    @abstractmethod
+    def get_mount(self, archive: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def put_mount(self, archive: str, mount: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    def update_mount(self, archive: str, **fields):
+        ...
+
+    @abstractmethod
+    def remove_mount(self, archive: str):
+        ...
+
+    @abstractmethod
+    def mounts(self) -> Dict[str, Dict[str, Any]]:
+        ...
+
+    # Executor election
+    @abstractmethod
+    def acquire_executor(self, owner: str, ttl: float) -> bool:
+        """Take or renew the executor lease; False if another process holds it."""
+
+    def release_executor(self, owner: str):
+        pass
+
+
+class MemoryJobStore(JobStore):
+    """Process-local store for single-worker deployments (and tests); this process is always the executor."""
+
+    def __init__(self, local_jobs: Dict[str, Dict[str, Any]]):
+        super().__init__(local_jobs)
+        self._queue: List[QueuedJobSpec] = []
+        self._mounts: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.local_jobs.get(job_id)
+
+    def get_many(self, job_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        return {job_id: self.local_jobs[job_id] for job_id in job_ids if job_id in self.local_jobs}
+
+    def active(self) -> List[Dict[str, Any]]:
+        return list(self.local_jobs.values())
+
+    def remove(self, job_id: str):
+        self.local_jobs.pop(job_id, None)
+        with self._lock:
+            self._queue = [spec for spec in self._queue if spec[0]["id"] != job_id]
+
+    def enqueue(self, job: Dict[str, Any], runner: str, args: List[Any]):
+        with self._lock:
+            self._queue.append((job, runner, list(args)))
+
+    def claim(self) -> List[QueuedJobSpec]:
+        with self._lock:
+            claimed, self._queue = self._queue, []
+        return claimed
+
+    def get_mount(self, archive: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            mount = self._mounts.get(archive)
+            return dict(mount) if mount else None
+
+    def put_mount(self, archive: str, mount: Dict[str, Any]):
+        with self._lock:
+            self._mounts[archive] = dict(mount)
+
+    def update_mount(self, archive: str, **fields):
+        with self._lock:
+            if archive in self._mounts:
+                self._mounts[archive].update(fields)
+
+    def remove_mount(self, archive: str):
+        with self._lock:
+            self._mounts.pop(archive, None)
+
+    def mounts(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {archive: dict(mount) for archive, mount in self._mounts.items()}
+
+    def acquire_executor(self, owner: str, ttl: float) -> bool:
+        return True
+
+
+def _shareable(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a live job dict, with output trimmed to the last LIVE_OUTPUT_TAIL lines."""
+    snapshot = dict(job)
+    output_lines = list(snapshot.get("output_lines") or [])
+    snapshot["output_lines"] = output_lines[-LIVE_OUTPUT_TAIL:]
+    snapshot["output_line_count"] = len(output_lines)
+    return snapshot
+
+
+class SQLiteJobStore(JobStore):
+    """Store shared through the DashBorg database, for running several uvicorn workers."""
+
+    def __init__(self, local_jobs: Dict[str, Dict[str, Any]], owner: str = WORKER_ID):
+        super().__init__(local_jobs)
+        self.owner = owner
+        self._publisher = None
+
+    def setup(self):
+        # WAL lets readers in other workers proceed while the executor writes
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.local_jobs.get(job_id)
+        if job is not None:
+            return job
+        with SessionLocal() as db:
+            return db.execute(select(LiveJob.data).where(LiveJob.job_id == job_id)).scalar()
+
+    def get_many(self, job_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        job_ids = list(job_ids)
+        found = {job_id: self.local_jobs[job_id] for job_id in job_ids if job_id in self.local_jobs}
+        remote_ids = [job_id for job_id in job_ids if job_id not in found]
+        if remote_ids:
+            with SessionLocal() as db:
+                rows = db.execute(select(LiveJob.job_id, LiveJob.data).where(LiveJob.job_id.in_(remote_ids)))
+                found.update({job_id: data for job_id, data in rows})
+        return found
+
+    def active(self) -> List[Dict[str, Any]]:
+        local = list(self.local_jobs.values())
+        local_ids = {job["id"] for job in local}
+        with SessionLocal() as db:
+            rows = db.execute(select(LiveJob.job_id, LiveJob.data)).all()
+        return local + [data for job_id, data in rows if job_id not in local_ids]
+
+    def remove(self, job_id: str):
+        self.local_jobs.pop(job_id, None)
+        with SessionLocal() as db:
+            db.execute(delete(LiveJob).where(LiveJob.job_id == job_id))
+            db.execute(delete(QueuedJob).where(QueuedJob.job_id == job_id))
+            db.commit()
+
+    def publish(self):
+        snapshots = [_shareable(job) for job in list(self.local_jobs.values())]
+        now = datetime.utcnow()
+        with SessionLocal() as db:
+            for snapshot in snapshots:
+                statement = insert(LiveJob).values(job_id=snapshot["id"], data=snapshot, owner=self.owner, updated_at=now)
+                db.execute(statement.on_conflict_do_update(
+                    index_elements=[LiveJob.job_id],
+                    set_={"data": statement.excluded.data, "owner": self.owner, "updated_at": now}
+                ))
+            # Jobs this process finished (or that were deleted) are served from backup_jobs again
+            db.execute(delete(LiveJob).where(
+                LiveJob.owner == self.owner,
+                LiveJob.job_id.not_in([snapshot["id"] for snapshot in snapshots])
+            ))
+            db.commit()
+
+    def start_publisher(self, interval: float = JOB_STATE_PUBLISH_INTERVAL):
+        if self._publisher is not None:
+            return self._publisher
+
+        def publisher_loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.publish()
+                except Exception as e:
+                    print(f"Error publishing live job state: {e}")
+
+        self._publisher = threading.Thread(target=publisher_loop, name="job-state-publisher", daemon=True)
+        self._publisher.start()
+        return self._publisher
+
+    def reset_live_jobs(self) -> Set[str]:
+        with SessionLocal() as db:
+            queued = set(db.execute(select(QueuedJob.job_id)).scalars())
+            db.execute(delete(LiveJob).where(LiveJob.job_id.not_in(queued)))
+            db.commit()
+        return queued
+
+    def enqueue(self, job: Dict[str, Any], runner: str, args: List[Any]):
+        with SessionLocal() as db:
+            db.add(QueuedJob(job_id=job["id"], runner=runner, args=list(args), job=job))
+            # Visible as pending to every worker until the executor picks it up
+            db.add(LiveJob(job_id=job["id"], data=_shareable(job), owner=None))
+            db.commit()
+
+    def claim(self) -> List[QueuedJobSpec]:
+        with SessionLocal() as db:
+            queued = db.execute(select(QueuedJob).order_by(QueuedJob.created_at)).scalars().all()
+            if not queued:
+                return []
+            claimed = [(row.job, row.runner, row.args) for row in queued]
+            db.execute(delete(QueuedJob).where(QueuedJob.job_id.in_([row.job_id for row in queued])))
+            db.execute(update(LiveJob).where(LiveJob.job_id.in_([row.job_id for row in queued])).values(owner=self.owner))
+            db.commit()
+        return claimed
+
+    def get_mount(self, archive: str) -> Optional[Dict[str, Any]]:
+        with SessionLocal() as db:
+            return db.execute(select(LiveMount.data).where(LiveMount.archive == archive)).scalar()
+
+    def put_mount(self, archive: str, mount: Dict[str, Any]):
+        with SessionLocal() as db:
+            db.merge(LiveMount(archive=archive, data=dict(mount)))
+            db.commit()
+
+    def update_mount(self, archive: str, **fields):
+        with SessionLocal() as db:
+            row = db.get(LiveMount, archive)
+            if row is not None:
+                row.data = {**row.data, **fields}
+                db.commit()
+
+    def remove_mount(self, archive: str):
+        with SessionLocal() as db:
+            db.execute(delete(LiveMount).where(LiveMount.archive == archive))
+            db.commit()
+
+    def mounts(self) -> Dict[str, Dict[str, Any]]:
+        with SessionLocal() as db:
+            return {archive: data for archive, data in db.execute(select(LiveMount.archive, LiveMount.data))}
+
+    def acquire_executor(self, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with SessionLocal() as db:
+            result = db.execute(
+                update(ExecutorLease)
+                .where(ExecutorLease.id == 1, or_(ExecutorLease.owner == owner, ExecutorLease.expires_at < now))
+                .values(owner=owner, expires_at=now + ttl)
+            )
+            if result.rowcount:
+                db.commit()
+                return True
+            try:
+                db.add(ExecutorLease(id=1, owner=owner, expires_at=now + ttl))
+                db.commit()
+                return True
+            except IntegrityError:
+                db.rollback()
+                return False
+
+    def release_executor(self, owner: str):
+        with SessionLocal() as db:
+            db.execute(delete(ExecutorLease).where(ExecutorLease.id == 1, ExecutorLease.owner == owner))
+            db.commit()
+
+
+def create_job_store(local_jobs: Dict[str, Dict[str, Any]], kind: str = JOB_STORE) -> JobStore:
+    """Build the job store selected by DASHBORG_JOB_STORE."""
+    if kind == "memory":
+        return MemoryJobStore(local_jobs)
+    if kind == "sqlite":
+        return SQLiteJobStore(local_jobs)
+    raise ValueError(f"Unknown DASHBORG_JOB_STORE '{kind}' (expected 'memory' or 'sqlite')")
+
+
+class ExecutorElection:
+    """Holds this process's claim on the executor lease, taking over when the holder stops renewing it."""
+
+    def __init__(self, store: JobStore, on_elected: Callable[[], None], owner: str = WORKER_ID, ttl: float = EXECUTOR_LEASE_TTL):
+        self.store = store
+        self.on_elected = on_elected
+        self.owner = owner
+        self.ttl = ttl
+        self.is_executor = False
+        self._elected_before = False
+        self._thread = None
+
+    def try_acquire(self) -> bool:
+        try:
+            acquired = self.store.acquire_executor(self.owner, self.ttl)
+        except Exception as e:
+            print(f"Error renewing executor lease: {e}")
+            acquired = False
+
+        if acquired and not self.is_executor:
+            self.is_executor = True
+            print(f"✓ Worker {self.owner} elected job executor")
+            # Recovery of the previous executor's state only makes sense once per process
+            if not self._elected_before:
+                self._elected_before = True
+                self.on_elected()
+        elif not acquired and self.is_executor:
+            self.is_executor = False
+            print(f"Warning: worker {self.owner} lost the executor lease; no longer starting queued jobs")
+        return acquired
+
+    def start(self):
+        """Try to become executor now and keep renewing (or retrying) in the background."""
+        self.try_acquire()
+        if self._thread is not None:
+            return self._thread
+
+        def lease_loop():
+            while True:
+                time.sleep(self.ttl / 3)
+                self.try_acquire()
+
+        self._thread = threading.Thread(target=lease_loop, name="executor-lease", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def release(self):
+        if self.is_executor:
+            self.store.release_executor(self.owner)
+            self.is_executor = False
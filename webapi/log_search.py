@@ -0,0 +1,266 @@
+"""
+Server-side search of job output: substring/regex, borg --list status and path filters, and a problem index
+"""
+import codecs
+import re
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, Optional, Pattern, Tuple
+
+from sqlalchemy import delete, select
+
+from database import BackupJob, JobLogIndex, JobLogProblem, SessionLocal, engine
+
+# Log search settings
+LOG_CHUNK_SIZE = 1024 * 1024  # bytes of stored output read at a time
+MAX_INDEXED_PROBLEMS = 10000  # problem lines kept per job; counts stay exact
+MAX_LINE_LENGTH = 2000  # characters of a line returned or indexed
+
+# borg create --list status letters
+STATUS_NAMES = {
+    "A": "added",
+    "M": "modified",
+    "U": "unchanged",
+    "E": "error",
+    "C": "changed",  # changed while being backed up
+    "d": "directory",
+    "s": "symlink",
+    "h": "hardlink",
+    "b": "block device",
+    "c": "char device",
+    "f": "fifo",
+    "i": "stdin",
+    "x": "excluded",
+    "-": "dry run",
+    "?": "missing",
+}
+STATUS_LETTERS = {name: letter for letter, name in STATUS_NAMES.items()}
+
+# Only matched against lines that aren't file status lines, so a file named error.log isn't a problem
+ERROR_PATTERN = re.compile(r"\b(error|errno|exception|traceback|failed|permission denied|no such file)\b", re.IGNORECASE)
+WARNING_PATTERN = re.compile(r"\bwarning\b", re.IGNORECASE)
+
+
+def line_status(line: str) -> Optional[str]:
+    """Status letter of a borg --list line ("A /etc/hosts"), None for other output."""
+    if len(line) > 2 and line[1] == " " and line[0] in STATUS_NAMES:
+        return line[0]
+    return None
+
+
+def classify(line: str) -> Optional[str]:
+    """"error", "warning" or None."""
+    status = line_status(line)
+    if status is not None:
+        return "error" if status == "E" else "warning" if status == "C" else None
+    if ERROR_PATTERN.search(line):
+        return "error"
+    if WARNING_PATTERN.search(line):
+        return "warning"
+    return None
+
+
+def parse_statuses(spec: Optional[str]) -> Optional[set]:
+    """Status letters from "A,M", "added,modified" or "AM"; ValueError for unknown ones."""
+    if not spec:
+        return None
+    letters = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if part.lower() in STATUS_LETTERS:
+            letters.add(STATUS_LETTERS[part.lower()])
+        elif part and all(letter in STATUS_NAMES for letter in part):
+            letters.update(part)
+        elif part:
+            raise ValueError(f"Unknown status {part!r}, expected letters or: {', '.join(STATUS_LETTERS)}")
+    return letters
+
+
+def iter_stored_lines(row_id: int, chunk_size: int = LOG_CHUNK_SIZE) -> Iterator[str]:
+    """Lines of a finished job's stored output, read incrementally instead of loading the whole text."""
+    connection = engine.raw_connection()
+    try:
+        dbapi_connection = connection.driver_connection
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending = ""
+        for chunk in _stored_chunks(dbapi_connection, row_id, chunk_size):
+            text = pending + decoder.decode(chunk)
+            lines = text.split("\n")
+            pending = lines.pop()
+            yield from lines
+        pending += decoder.decode(b"", final=True)
+        if pending:
+            yield pending
+    finally:
+        connection.close()
+
+
+def _stored_chunks(dbapi_connection, row_id: int, chunk_size: int) -> Iterator[bytes]:
+    if hasattr(dbapi_connection, "blobopen"):  # Python 3.11+: SQLite incremental blob I/O
+        try:
+            blob = dbapi_connection.blobopen("backup_jobs", "output", row_id, readonly=True)
+        except Exception:
+            return  # No output (NULL) or no such row
+        with blob:
+            while True:
+                chunk = blob.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+    else:
+        position = 1
+        while True:
+            row = dbapi_connection.execute(
+                "SELECT CAST(substr(CAST(output AS BLOB), ?, ?) AS BLOB) FROM backup_jobs WHERE id = ?",
+                (position, chunk_size, row_id)
+            ).fetchone()
+            if not row or not row[0]:
+                return
+            yield row[0]
+            position += chunk_size
+
+
+def in_path(line: str, status: Optional[str], path: str) -> bool:
+    """Whether a borg --list line is for path or something under it ("etc" matches etc/hosts, not etcetera)."""
+    if status is None:
+        return False
+    name = line[2:].lstrip("/")
+    return not path or name == path or name.startswith(path + "/")
+
+
+def _truncate(line: str) -> str:
+    return line if len(line) <= MAX_LINE_LENGTH else line[:MAX_LINE_LENGTH] + "…"
+
+
+def search_lines(
+    lines: Iterable[Tuple[int, str]],
+    pattern: Optional[Pattern] = None,
+    query: Optional[str] = None,
+    statuses: Optional[set] = None,
+    path: Optional[str] = None,
+    limit: int = 200
+) -> Dict[str, Any]:
+    """First `limit` matching (line number, line) pairs; stops reading once one more match shows there are more."""
+    matches = []
+    more = False
+    scanned = 0
+    for number, line in lines:
+        scanned += 1
+        status = line_status(line)
+        if statuses is not None and status not in statuses:
+            continue
+        if path is not None and not in_path(line, status, path):
+            continue
+        if query is not None and query not in line:
+            continue
+        if pattern is not None and not pattern.search(line):
+            continue
+        if len(matches) == limit:
+            more = True
+            break
+        matches.append({"line": number, "status": STATUS_NAMES.get(status), "text": _truncate(line)})
+    return {
+        "matches": matches,
+        "next_after_line": matches[-1]["line"] if more else None,
+        "scanned_lines": scanned
+    }
+
+
+def build_index(job_id: str, lines: Iterable[str]) -> Dict[str, Any]:
+    """Count status letters and record error/warning lines of a finished job (replacing any earlier index)."""
+    status_counts: Dict[str, int] = {}
+    problems = []
+    counts = {"error": 0, "warning": 0}
+    total = 0
+    for number, line in enumerate(lines, 1):
+        total = number
+        status = line_status(line)
+        if status is not None:
+            status_counts[status] = status_counts.get(status, 0) + 1
+        severity = classify(line)
+        if severity is not None:
+            counts[severity] += 1
+            if len(problems) < MAX_INDEXED_PROBLEMS:
+                problems.append({"job_id": job_id, "line_number": number, "severity": severity, "line": _truncate(line)})
+
+    db = SessionLocal()
+    try:
+        db.execute(delete(JobLogProblem).where(JobLogProblem.job_id == job_id))
+        db.execute(delete(JobLogIndex).where(JobLogIndex.job_id == job_id))
+        if problems:
+            db.execute(JobLogProblem.__table__.insert(), problems)
+        index = JobLogIndex(job_id=job_id, lines=total, status_counts=status_counts, errors=counts["error"], warnings=counts["warning"], indexed_at=datetime.utcnow())
+        db.add(index)
+        db.commit()
+        return index_to_dict(index)
+    finally:
+        db.close()
+
+
+def index_to_dict(index: JobLogIndex) -> Dict[str, Any]:
+    return {
+        "lines": index.lines,
+        "status_counts": {STATUS_NAMES.get(letter, letter): count for letter, count in (index.status_counts or {}).items()},
+        "errors": index.errors,
+        "warnings": index.warnings,
+        "problems_truncated": (index.errors or 0) + (index.warnings or 0) > MAX_INDEXED_PROBLEMS
+    }
+
+
+def stored_index(job_id: str) -> Optional[Dict[str, Any]]:
+    """Index of a finished job, built on first use for jobs that finished before indexing existed."""
+    db = SessionLocal()
+    try:
+        index = db.get(JobLogIndex, job_id)
+        if index is not None:
+            return index_to_dict(index)
+        row_id = db.execute(select(BackupJob.id).where(BackupJob.job_id == job_id)).scalar()
+    finally:
+        db.close()
+    if row_id is None:
+        return None
+    return build_index(job_id, iter_stored_lines(row_id))
+
+
+def search_problems(job_id: str, severity: Optional[str] = None, pattern: Optional[Pattern] = None, query: Optional[str] = None,
+                    after_line: int = 0, limit: int = 200, statuses: Optional[set] = None, path: Optional[str] = None) -> Dict[str, Any]:
+    """Indexed error/warning lines of a finished job, without reading its output.
+
+    statuses and path keep the problems that are file status lines ("E etc/shadow") matching them.
+    """
+    filtered = pattern is not None or statuses is not None or path is not None
+    db = SessionLocal()
+    try:
+        statement = (
+            select(JobLogProblem.line_number, JobLogProblem.severity, JobLogProblem.line)
+            .where(JobLogProblem.job_id == job_id, JobLogProblem.line_number > after_line)
+            .order_by(JobLogProblem.line_number)
+        )
+        if severity:
+            statement = statement.where(JobLogProblem.severity == severity)
+        if query:
+            statement = statement.where(JobLogProblem.line.contains(query, autoescape=True))
+        if not filtered:
+            statement = statement.limit(limit + 1)
+        rows = db.execute(statement).all()
+    finally:
+        db.close()
+    matches = []
+    for row in rows:
+        status = line_status(row.line)
+        if statuses is not None and status not in statuses:
+            continue
+        if path is not None and not in_path(row.line, status, path):
+            continue
+        if pattern is not None and not pattern.search(row.line):
+            continue
+        matches.append({"line": row.line_number, "severity": row.severity, "status": STATUS_NAMES.get(status), "text": row.line})
+        if len(matches) > limit:
+            break
+    more = len(matches) > limit
+    matches = matches[:limit]
+    return {"matches": matches, "next_after_line": matches[-1]["line"] if more else None, "scanned_lines": len(rows)}
+
+
+def delete_index(db, job_id: str):
+    db.execute(delete(JobLogProblem).where(JobLogProblem.job_id == job_id))
+    db.execute(delete(JobLogIndex).where(JobLogIndex.job_id == job_id))
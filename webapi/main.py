@@ -2,32 +2,197 @@
 
 
 from fastapi import FastAPI, Request, Depends
-from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
+from sqlalchemy import desc, func, select
+from sqlalchemy.exc import IntegrityError
 import subprocess
 import os
+import signal
+import asyncio
+import zlib
+import urllib.parse
 import threading
 import time
 import uuid
+import itertools
+import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 import json
 
-from database import init_db, get_db, Repository, Archive, BackupJob, RepositoryStatistics, SessionLocal
+from database import init_db, get_db, engine, DATABASE_PATH, Repository, Archive, BackupJob, RepositoryStatistics, ArchiveDiff, ArchiveDiffEntry, BandwidthSample, SessionLocal
+from diffs import build_diff_command, run_diff, diff_to_dict
+from create_stats import ingest_create_stats, parse_create_stats
+from governor import JOB_TYPE_CLASSES, ResourceGovernor
+from bandwidth import DEFER_CHECK_INTERVAL, OFF_PEAK, SHAPED_JOB_TYPES, BandwidthSchedule, is_remote, rate_limit_args
+from check_scheduler import CHECK_MAX_DURATION, CHECK_WINDOW, CheckScheduler, build_partial_check_command, record_check
+from export import Export
+from extract_cache import ExtractCache
+from federation import Federation, collect_changes, decode_cursor
+from log_search import build_index, classify, delete_index, iter_stored_lines, parse_statuses, search_lines, search_problems, stored_index
+from singleflight import SingleFlight
+from retention import POLICY_KEYS, policy_from_config, simulate_prune, validate_policy
+from mounts import MountManager
+from checkpoints import JobCheckpointWriter
+from config_validation import ConfigValidator, load_config, normalize_legacy
+from config_registry import ConfigRegistry
+from job_store import ExecutorElection, JOB_QUEUE_POLL_INTERVAL, create_job_store
+from responses import JSONResponse
+from compression import CompressionMiddleware
+from static_files import IMMUTABLE_CACHE_CONTROL, IndexPage, PrecompressedStaticFiles
+import analytics
+import profiling
+from metrics import (
+    HTTP_REQUEST_DURATION, JOBS_QUEUED, JOBS_RUNNING, JOBS_IN_MEMORY, JOB_OUTPUT_LINES,
+    JOB_DURATION, JOB_FILES_PER_SECOND, JOB_BYTES_PER_SECOND, JOB_UPLOAD_BYTES_PER_SECOND, DB_FILE_SIZE,
+    instrument_engine, monitor_event_loop, record_command, render_metrics
+)
 
 app = FastAPI()
+# Compress large JSON/text responses (zstd or gzip, as the client accepts). Added first so it
+# is innermost and sees complete response bodies before the http middlewares re-stream them.
+app.add_middleware(CompressionMiddleware)
+instrument_engine(engine)
+if profiling.PROFILING_ENABLED:
+    profiling.instrument_engine(engine)
 
 # Initialize database on startup
 @app.on_event("startup")
 async def startup_event():
     init_db()
+    job_store.setup()
     print("✓ Database initialized")
+    
+    config_registry.subscribe(lambda event, name: print(f"Config {event}: {name}"))
+    config_registry.subscribe(lambda event, name: single_flight.forget(name))
+    config_registry.start()
+    print(f"✓ Watching {config_registry.config_dir} ({len(config_registry.list_configs())} configs)")
+    
+    # Keep a reference so the monitor task isn't garbage collected
+    app.state.loop_monitor = asyncio.create_task(monitor_event_loop())
+    
+    # One worker process runs borg jobs; the others queue their jobs for it and serve reads
+    executor.start()
 
-# Job tracking (in-memory for real-time updates, persisted to DB)
+def start_executor():
+    """Recover what the previous executor left behind and start the job machinery (elected worker only)."""
+    # Diff jobs don't survive a restart; let them be recomputed on next request
+    db = SessionLocal()
+    try:
+        db.query(ArchiveDiff).filter(ArchiveDiff.status == "running").update({"status": "failed", "error": "Interrupted by restart"})
+        db.commit()
+    finally:
+        db.close()
+    
+    # Jobs left pending/running by a crash or restart can no longer finish, unless still queued
+    queued = job_store.reset_live_jobs()
+    db = SessionLocal()
+    try:
+        interrupted = db.query(BackupJob).filter(
+            BackupJob.status.in_(["pending", "running"]),
+            BackupJob.job_id.not_in(queued)
+        ).update(
+            {"status": "failed", "error": "Interrupted by restart", "completed_at": datetime.now()},
+            synchronize_session=False
+        )
+        db.commit()
+        if interrupted:
+            print(f"✓ Marked {interrupted} interrupted jobs as failed")
+    finally:
+        db.close()
+    governor.setup()
+    checkpoint_writer.start()
+    job_store.start_publisher()
+    
+    # Recover FUSE mounts left over from before the restart
+    mount_manager.reconcile(active_job_ids())
+    mount_manager.start_reaper(active_job_ids)
+    extract_cache.recover(active_job_ids())
+    
+    threading.Thread(target=run_job_dispatcher, name="job-dispatcher", daemon=True).start()
+    check_scheduler.start()
+    federation.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    if executor.is_executor:
+        checkpoint_writer.flush()
+    executor.release()
+
+# Job tracking: jobs run by this process (in memory for real-time updates, checkpointed to DB),
+# shared with other worker processes through the job store
 jobs: Dict[str, Dict[str, Any]] = {}
+job_store = create_job_store(jobs)
+executor = ExecutorElection(job_store, on_elected=start_executor)
+checkpoint_writer = JobCheckpointWriter()
+config_registry = ConfigRegistry()
+config_validator = ConfigValidator(run=lambda cmd, **kwargs: run_command(cmd, **kwargs), include_dir=config_registry.config_dir)
+governor = ResourceGovernor()
+bandwidth_schedule = BandwidthSchedule()
+history_cache = analytics.HistoryCache()
+extract_cache = ExtractCache()
+federation = Federation()
+# Syncs and repository reads, shared by identical requests made while one is running
+single_flight = SingleFlight()
+READ_ONLY_BORGMATIC_COMMANDS = {"info", "list", "rinfo", "rlist", "repo-info", "repo-list"}
+check_scheduler = CheckScheduler(
+    targets=lambda: check_targets(),
+    start_check=lambda *args: start_partial_check(*args),
+    busy=lambda: repositories_busy()
+)
+
+# The request middlewares are plain ASGI rather than @app.middleware("http"): BaseHTTPMiddleware
+# ends a streaming body normally when the endpoint raises, so a failed restore would look complete
+class RequestMetricsMiddleware:
+    """Record request latency (until the response headers) per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+
+        async def send_observed(message):
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                HTTP_REQUEST_DURATION.observe(
+                    time.perf_counter() - start,
+                    method=scope["method"],
+                    route=route.path if route else "unmatched",
+                    status=message["status"]
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_observed)
+
+class ProfilingMiddleware:
+    """Log requests slower than DASHBORG_SLOW_REQUEST_MS with a DB/subprocess/serialization breakdown."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiling.PROFILING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        timings = profiling.start_request()
+
+        async def send_profiled(message):
+            if message["type"] == "http.response.start":
+                profiling.finish_request(scope["method"], scope["path"], message["status"], time.perf_counter() - start, timings)
+            await send(message)
+
+        await self.app(scope, receive, send_profiled)
+
+app.add_middleware(RequestMetricsMiddleware)
+app.add_middleware(ProfilingMiddleware)
 
 # Allow CORS for local dev
 app.add_middleware(
@@ -39,76 +204,62 @@ app.add_middleware(
 )
 
 # Serve static files (built frontend) at /static
-app.mount("/static", StaticFiles(directory="../webui/dist", html=True), name="static")
+app.mount("/static", PrecompressedStaticFiles(directory="../webui/dist", html=True), name="static")
 
 # Serve static assets (JS/CSS) from /assets
-app.mount("/assets", StaticFiles(directory="../webui/dist/assets", html=False), name="assets")
+# Hashed file names, so browsers may cache them forever
+app.mount(
+    "/assets",
+    PrecompressedStaticFiles(directory="../webui/dist/assets", html=False, cache_control=IMMUTABLE_CACHE_CONTROL),
+    name="assets"
+)
 
-# List config files in /etc/borgmatic
+# List config files in the config directory (served from the in-memory config registry)
 
 @app.get("/api/configs")
 def list_borgmatic_configs():
-    config_dir = "/etc/borgmatic"
-    if not os.path.exists(config_dir):
-        return JSONResponse([])
     try:
-        files = [
-            f for f in os.listdir(config_dir) 
-            if os.path.isfile(os.path.join(config_dir, f)) 
-            and not f.startswith('.') 
-            and not f.endswith('.swp')
-            and not f.endswith('~')
-        ]
-        return JSONResponse(files)
+        return JSONResponse(config_registry.list_configs())
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
 @app.get("/api/configs/{filename}")
 def get_config(filename: str):
-    config_dir = "/etc/borgmatic"
-    file_path = os.path.join(config_dir, filename)
-    if not os.path.exists(file_path):
+    content = config_registry.get_content(filename)
+    if content is None:
         return JSONResponse({"error": "File not found"}, status_code=404)
-    try:
-        with open(file_path, 'r') as f:
-            content = f.read()
-        return Response(content, media_type="text/yaml")
-    except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
+    return Response(content, media_type="text/yaml")
+
+@app.get("/api/configs/{filename}/repositories")
+def get_config_repositories(filename: str):
+    """Repositories a config points at, from the parsed config."""
+    if config_registry.get_content(filename) is None:
+        return JSONResponse({"error": "File not found"}, status_code=404)
+    return JSONResponse({"config": filename, "repositories": config_registry.repositories(filename)})
 
 @app.put("/api/configs/{filename}")
 async def save_config(filename: str, request: Request):
-    config_dir = "/etc/borgmatic"
+    config_dir = config_registry.config_dir
     file_path = os.path.join(config_dir, filename)
     try:
         content = await request.body()
         content = content.decode('utf-8')
         with open(file_path, 'w') as f:
             f.write(content)
+        # Don't wait for the watcher so the next read sees the new content
+        config_registry.refresh(filename)
         return JSONResponse({"message": "Saved"})
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
 @app.post("/api/validate-config")
-async def validate_config(request: Request):
+async def validate_config(request: Request, mode: str = "full"):
+    """Validate a config; mode=quick returns only in-process syntax and schema errors."""
     try:
         content = await request.body()
         content = content.decode('utf-8')
-        # Save to temp file
-        import tempfile
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as f:
-            f.write(content)
-            temp_path = f.name
-        try:
-            # Run borgmatic config validate
-            result = subprocess.run([
-                "borgmatic", "config", "validate", "--config", temp_path
-            ], capture_output=True, text=True, check=True)
-            return JSONResponse({"valid": True, "output": result.stdout})
-        except subprocess.CalledProcessError as e:
-            return JSONResponse({"valid": False, "error": e.stderr})
-        finally:
-            os.unlink(temp_path)
+        result = await asyncio.to_thread(config_validator.validate, content, mode != "quick")
+        return JSONResponse(result)
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
@@ -124,7 +275,7 @@ async def create_repository(request: Request):
         make_parent_dirs = data.get("make_parent_dirs", False)
         
         # Build command
-        cmd = ["borgmatic", "repo-create", "--config", f"/etc/borgmatic/{config_file}", "--verbosity", "1"]
+        cmd = ["borgmatic", "repo-create", "--config", config_registry.path(config_file), "--verbosity", "1"]
         
         if encryption_mode:
             cmd.extend(["--encryption", encryption_mode])
@@ -135,37 +286,72 @@ async def create_repository(request: Request):
         if make_parent_dirs:
             cmd.append("--make-parent-dirs")
         
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        result = await asyncio.to_thread(run_command, cmd, "repo-create", capture_output=True, text=True, check=True)
         return JSONResponse({"success": True, "output": result.stdout})
     except subprocess.CalledProcessError as e:
         return JSONResponse({"success": False, "error": e.stderr, "output": e.stdout}, status_code=500)
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
+def run_command(cmd: list, job_type: Optional[str] = None, **kwargs) -> subprocess.CompletedProcess:
+    """Run a borg/borgmatic command to completion, recording its duration and exit code.
+    
+    With a job_type it runs in that type's resource class, waiting for a free slot first.
+    """
+    limits = governor.acquire(job_type) if job_type else None
+    start = time.perf_counter()
+    try:
+        result = subprocess.run(governor.wrap(cmd, limits) if limits else cmd, **kwargs)
+    except subprocess.CalledProcessError as e:
+        record_command(cmd, time.perf_counter() - start, e.returncode)
+        raise
+    except Exception:
+        record_command(cmd, time.perf_counter() - start, None)
+        raise
+    finally:
+        profiling.record_time("subprocess", time.perf_counter() - start)
+        if limits:
+            governor.release(limits)
+    record_command(cmd, time.perf_counter() - start, result.returncode)
+    return result
+
 def run_job_in_background(job_id: str, cmd: list, job_type: str, config_file: str = None):
     """Run a command in background and track its status with real-time progress."""
-    import json
+    # Remote jobs wait for a bandwidth slot they fit in and run with its upload rate limit
+    shaping = shape_bandwidth(job_id, job_type, config_file)
+    if shaping is None:
+        return  # Deleted while deferred
+    cmd = cmd + rate_limit_args(shaping.get("upload_rate_limit"))
     
-    jobs[job_id]["status"] = "running"
-    jobs[job_id]["started_at"] = datetime.now().isoformat()
-    jobs[job_id]["stats"] = None
-    jobs[job_id]["output_lines"] = []
-    jobs[job_id]["progress_info"] = {
-        "current_file": None,
-        "files_processed": 0,
-        "last_update": None
-    }
+    # Stays pending until its resource class has a free slot
+    limits = {**governor.acquire(job_type), **shaping}
+    process_start = time.perf_counter()
     
     try:
+        if job_store.get(job_id) is None:
+            return  # Deleted while waiting for a slot
+        jobs[job_id]["resources"] = limits
+        jobs[job_id]["status"] = "running"
+        jobs[job_id]["started_at"] = datetime.now().isoformat()
+        jobs[job_id]["stats"] = None
+        jobs[job_id]["output_lines"] = []
+        jobs[job_id]["progress_info"] = {
+            "current_file": None,
+            "files_processed": 0,
+            "last_update": None
+        }
+        checkpoint_writer.update(job_id, status="running", started_at=datetime.fromisoformat(jobs[job_id]["started_at"]), resources=limits)
+        
         # Run process with combined output (stderr redirected to stdout)
         process = subprocess.Popen(
-            cmd,
+            governor.wrap(cmd, limits),
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,  # Combine stderr into stdout
             text=True,
             bufsize=1,
             universal_newlines=True
         )
+        jobs[job_id]["pid"] = process.pid
         
         all_lines = []
         files_processed = 0
@@ -187,86 +373,382 @@ def run_job_in_background(job_id: str, cmd: list, job_type: str, config_file: st
                     if len(line) > 2 and line[0] in ['A', 'M', 'U', '-'] and line[1] == ' ':
                         files_processed += 1
                         current_file = line[2:] if len(line) > 2 else ""
+                        now = datetime.now()
                         jobs[job_id]["progress_info"] = {
                             "current_file": current_file,
                             "files_processed": files_processed,
-                            "last_update": datetime.now().isoformat()
+                            "last_update": now.isoformat()
                         }
+                        checkpoint_writer.update(
+                            job_id,
+                            files_processed=files_processed,
+                            current_file=current_file,
+                            last_progress_update=now
+                        )
         
         # Wait for process to complete
         return_code = process.wait()
+        record_command(cmd, time.perf_counter() - process_start, return_code)
         
         jobs[job_id]["status"] = "completed" if return_code == 0 else "failed"
         jobs[job_id]["output"] = "\n".join(all_lines) if all_lines else "No output"
         jobs[job_id]["return_code"] = return_code
         
-        # If backup completed successfully, fetch statistics separately
+        # Take the new archive's stats from create's own --stats output instead of asking
+        # borg again, and record the archive right away (provisionally, until the next sync)
         if return_code == 0 and job_type == "backup-create" and config_file:
             try:
-                # Run borgmatic info to get the last archive stats with JSON
-                info_cmd = [
-                    "borgmatic", "info",
-                    "--config", f"/etc/borgmatic/{config_file}",
-                    "--archive", "latest",
-                    "--json"
-                ]
-                result = subprocess.run(info_cmd, capture_output=True, text=True, timeout=30)
-                if result.returncode == 0 and result.stdout:
-                    try:
-                        data = json.loads(result.stdout)
-                        if isinstance(data, list) and len(data) > 0:
-                            info_data = data[0]
-                            # Transform borgmatic info structure to match create --json structure
-                            # info returns: {"archives": [...], "repository": {...}, "encryption": {...}, "cache": {...}}
-                            # We need: {"archive": {...}, "repository": {...}, "encryption": {...}}
-                            if "archives" in info_data and len(info_data["archives"]) > 0:
-                                transformed = {
-                                    "archive": info_data["archives"][0],  # Get the latest archive
-                                    "repository": info_data.get("repository", {}),
-                                    "encryption": info_data.get("encryption", {}),
-                                    "cache": info_data.get("cache", {})
-                                }
-                                jobs[job_id]["stats"] = transformed
-                            else:
-                                jobs[job_id]["stats"] = info_data
-                    except json.JSONDecodeError:
-                        pass
+                results = parse_create_stats(all_lines)
+                if results:
+                    jobs[job_id]["stats"] = results[0] if len(results) == 1 else {**results[0], "repositories": results}
+                # A failed database write only loses the archive link, not the parsed stats
+                archive_ids = ingest_create_stats(results, config_registry.repositories(config_file))
+                if archive_ids:
+                    jobs[job_id]["archive_ids"] = archive_ids
+                    checkpoint_writer.update(job_id, archive_id=archive_ids[0])
             except Exception as e:
-                # Don't fail the job if stats fetch fails
+                # Don't fail the job if its stats can't be recorded
                 jobs[job_id]["stats_error"] = str(e)
         
     except Exception as e:
         jobs[job_id]["status"] = "failed"
         jobs[job_id]["error"] = str(e)
         jobs[job_id]["output"] = str(e)
+        if "return_code" not in jobs[job_id]:
+            record_command(cmd, time.perf_counter() - process_start, None)
+    finally:
+        governor.release(limits)
     
     jobs[job_id]["completed_at"] = datetime.now().isoformat()
     
-    # Persist job to database
+    succeeded = jobs[job_id]["status"] == "completed"
+    if succeeded and job_type == "backup-create" and shaping:
+        record_upload_throughput(jobs[job_id])
+    # Sub-jobs of a parallel backup leave diff precomputation to their parent
+    is_child = bool(jobs[job_id].get("parent_job_id"))
+    
+    # Persist final job state to database
+    finalize_job(job_id)
+    
+    if job_type == "extract":
+        extract_cache.complete(job_id, succeeded)
+    
+    # Precompute the diff between the new archive and its predecessor
+    if succeeded and job_type == "backup-create" and config_file and not is_child:
+        precompute_latest_diffs(config_file)
+
+def expected_duration(job_type: str, config_file: str) -> Optional[float]:
+    """Seconds the last successful job of this type and config took, if there was one."""
+    db = SessionLocal()
+    try:
+        last = db.execute(
+            select(BackupJob.started_at, BackupJob.completed_at)
+            .where(BackupJob.job_type == job_type, BackupJob.config_file == config_file, BackupJob.status == "completed")
+            .where(BackupJob.started_at.is_not(None), BackupJob.completed_at.is_not(None))
+            .order_by(desc(BackupJob.completed_at)).limit(1)
+        ).first()
+    finally:
+        db.close()
+    return (last.completed_at - last.started_at).total_seconds() if last else None
+
+def shape_bandwidth(job_id: str, job_type: str, config_file: str = None) -> Optional[Dict[str, Any]]:
+    """Wait until a remote job may start under the bandwidth windows; returns the window and rate limit applied.
+    
+    Returns {} for jobs that aren't shaped and None if the job was deleted while deferred.
+    """
+    if not bandwidth_schedule.windows or not config_file or not job_type.startswith(SHAPED_JOB_TYPES):
+        return {}
+    if not any(is_remote(repo["path"]) for repo in config_registry.repositories(config_file)):
+        return {}
+    expected = expected_duration(job_type, config_file)
+    deferred_until = None
+    while True:
+        decision = bandwidth_schedule.decide(datetime.now(), expected)
+        if decision["start"]:
+            break
+        job = jobs.get(job_id)
+        if job is None:
+            return None
+        if decision["deferred_until"] != deferred_until:
+            deferred_until = job["deferred_until"] = decision["deferred_until"]
+            print(f"Job {job_id} ({job_type}) deferred until {deferred_until} by bandwidth windows")
+        wait = (datetime.fromisoformat(deferred_until) - datetime.now()).total_seconds()
+        time.sleep(min(DEFER_CHECK_INTERVAL, max(1, wait)))
+    return {
+        "bandwidth_window": decision["window"],
+        "upload_rate_limit": decision["upload_rate_limit"],
+        "deferred_until": deferred_until,
+        "expected_seconds": expected
+    }
+
+def record_upload_throughput(job: Dict[str, Any]):
+    """Store the upload throughput a finished remote backup achieved in its bandwidth window."""
+    stats = job.get("stats") or {}
+    results = stats.get("repositories") or [stats]
+    uploaded = sum(((result.get("archive") or {}).get("stats") or {}).get("deduplicated_size") or 0 for result in results)
+    duration = (datetime.fromisoformat(job["completed_at"]) - datetime.fromisoformat(job["started_at"])).total_seconds()
+    if not uploaded or duration <= 0:
+        return
+    resources = job.get("resources") or {}
+    JOB_UPLOAD_BYTES_PER_SECOND.observe(uploaded / duration, window=resources.get("bandwidth_window") or OFF_PEAK)
+    db = SessionLocal()
+    try:
+        db.add(BandwidthSample(
+            job_id=job["id"],
+            config_file=job.get("config"),
+            window=resources.get("bandwidth_window") or OFF_PEAK,
+            upload_rate_limit=resources.get("upload_rate_limit"),
+            bytes_uploaded=uploaded,
+            duration_seconds=duration,
+            bytes_per_second=uploaded / duration
+        ))
+        db.commit()
+    except Exception as e:
+        print(f"Error recording upload throughput: {e}")
+    finally:
+        db.close()
+
+@app.get("/api/bandwidth")
+def get_bandwidth(db: Session = Depends(get_db)):
+    """Bandwidth windows in effect and the upload throughput achieved in each."""
+    try:
+        rows = db.execute(
+            select(
+                BandwidthSample.window,
+                func.count(BandwidthSample.id).label("jobs"),
+                func.avg(BandwidthSample.bytes_per_second).label("avg_bytes_per_second"),
+                func.max(BandwidthSample.bytes_per_second).label("max_bytes_per_second"),
+                func.max(BandwidthSample.upload_rate_limit).label("upload_rate_limit"),
+                func.max(BandwidthSample.recorded_at).label("last_recorded_at")
+            ).group_by(BandwidthSample.window)
+        ).all()
+        throughput = [
+            {
+                "window": row.window,
+                "jobs": row.jobs,
+                "avg_bytes_per_second": round(row.avg_bytes_per_second or 0),
+                "max_bytes_per_second": round(row.max_bytes_per_second or 0),
+                "upload_rate_limit": row.upload_rate_limit,
+                # Share of the limit actually used; low values mean the limit could be lowered
+                "limit_utilization": round(row.avg_bytes_per_second / (row.upload_rate_limit * 1024), 3) if row.upload_rate_limit else None,
+                "last_recorded_at": row.last_recorded_at.isoformat() if row.last_recorded_at else None
+            }
+            for row in rows
+        ]
+        return JSONResponse({**bandwidth_schedule.to_dict(datetime.now()), "throughput": throughput})
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+def _repository_summary(repository: str, child: Dict[str, Any]) -> Dict[str, Any]:
+    """Status, timing and archive stats of one sub-job of a parallel backup."""
+    duration = None
+    if child.get("started_at"):
+        end = datetime.fromisoformat(child["completed_at"]) if child.get("completed_at") else datetime.now()
+        duration = round((end - datetime.fromisoformat(child["started_at"])).total_seconds(), 1)
+    archive = (child.get("stats") or {}).get("archive") or {}
+    return {
+        "repository": repository,
+        "job_id": child["id"],
+        "status": child["status"],
+        "started_at": child.get("started_at"),
+        "completed_at": child.get("completed_at"),
+        "duration_seconds": duration,
+        "files_processed": child["progress_info"].get("files_processed", 0),
+        "return_code": child.get("return_code"),
+        "error": child.get("error"),
+        "archive": archive.get("name"),
+        "archive_stats": archive.get("stats")
+    }
+
+def run_parallel_backup(job_id: str, config_file: str, children: list, max_parallel: int):
+    """Back up each repository of a config as its own sub-job, at most max_parallel at a time.
+    
+    The parent job aggregates progress while the sub-jobs run and ends up with per-repository
+    status, timing and stats; one repository failing doesn't stop the others.
+    """
+    parent = jobs[job_id]
+    parent["status"] = "running"
+    parent["started_at"] = datetime.now().isoformat()
+    checkpoint_writer.update(job_id, status="running", started_at=datetime.fromisoformat(parent["started_at"]))
+    
+    child_jobs = {}
+    for child_id, repository, cmd in children:
+        child_jobs[repository] = register_job(
+            child_id, "backup-create", cmd, config_file, parent_job_id=job_id, repository=repository
+        )
+    
+    def aggregate():
+        summaries = [_repository_summary(repository, child) for repository, child in child_jobs.items()]
+        running = [child for child in child_jobs.values() if child["status"] == "running"]
+        current = running[0]["progress_info"].get("current_file") if running else None
+        files_processed = sum(summary["files_processed"] for summary in summaries)
+        now = datetime.now()
+        parent["stats"] = {"parallel": True, "repositories": summaries}
+        parent["progress_info"] = {
+            "current_file": f"{running[0]['repository']}: {current}" if current else None,
+            "files_processed": files_processed,
+            "last_update": now.isoformat()
+        }
+        checkpoint_writer.update(
+            job_id,
+            files_processed=files_processed,
+            current_file=parent["progress_info"]["current_file"],
+            last_progress_update=now,
+            stats=parent["stats"]
+        )
+        return summaries
+    
+    with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="parallel-backup") as pool:
+        futures = [
+            pool.submit(run_job_in_background, child_id, cmd, "backup-create", config_file)
+            for child_id, repository, cmd in children
+        ]
+        while not all(future.done() for future in futures):
+            aggregate()
+            time.sleep(1)
+    
+    summaries = aggregate()
+    failed = [summary for summary in summaries if summary["status"] != "completed"]
+    totals = {"original_size": 0, "compressed_size": 0, "deduplicated_size": 0, "nfiles": 0}
+    for summary in summaries:
+        for key in totals:
+            totals[key] += (summary["archive_stats"] or {}).get(key) or 0
+    parent["stats"] = {"parallel": True, "repositories": summaries, "totals": totals}
+    parent["status"] = "failed" if failed else "completed"
+    parent["return_code"] = max(
+        summary["return_code"] or (0 if summary["status"] == "completed" else 1) for summary in summaries
+    )
+    parent["output"] = "\n".join(
+        f"{summary['repository']}: {summary['status']} in {summary['duration_seconds']}s, "
+        f"{summary['files_processed']} files" + (f" ({summary['error']})" if summary["error"] else "")
+        for summary in summaries
+    )
+    if failed:
+        parent["error"] = f"{len(failed)} of {len(summaries)} repositories failed: " + ", ".join(s["repository"] for s in failed)
+    parent["completed_at"] = datetime.now().isoformat()
+    finalize_job(job_id)
+    
+    if len(failed) < len(summaries):
+        precompute_latest_diffs(config_file)
+
+def register_job(job_id: str, job_type: str, cmd: list, config_file: str = None, **extra) -> Dict[str, Any]:
+    """Create the in-memory entry for a new job and insert its database row; start it with dispatch_job."""
+    jobs[job_id] = {
+        "id": job_id,
+        "type": job_type,
+        "command": " ".join(cmd),
+        "status": "pending",
+        "created_at": datetime.now().isoformat(),
+        "config": config_file,
+        "stats": None,
+        "output_lines": [],
+        "progress_info": {
+            "current_file": None,
+            "files_processed": 0,
+            "last_update": None
+        },
+        **extra
+    }
+    
     try:
         db = SessionLocal()
-        db_job = BackupJob(
+        db.add(BackupJob(
             job_id=job_id,
             job_type=job_type,
             config_file=config_file,
             command=" ".join(cmd),
-            status=jobs[job_id]["status"],
+            status="pending",
             created_at=datetime.fromisoformat(jobs[job_id]["created_at"]),
-            started_at=datetime.fromisoformat(jobs[job_id]["started_at"]) if jobs[job_id].get("started_at") else None,
-            completed_at=datetime.fromisoformat(jobs[job_id]["completed_at"]) if jobs[job_id].get("completed_at") else None,
-            files_processed=jobs[job_id]["progress_info"].get("files_processed", 0),
-            current_file=jobs[job_id]["progress_info"].get("current_file"),
-            last_progress_update=datetime.fromisoformat(jobs[job_id]["progress_info"]["last_update"]) if jobs[job_id]["progress_info"].get("last_update") else None,
-            return_code=jobs[job_id].get("return_code"),
-            output=jobs[job_id].get("output", ""),
-            error=jobs[job_id].get("error"),
-            stats=jobs[job_id].get("stats")
-        )
-        db.add(db_job)
+            parent_job_id=extra.get("parent_job_id"),
+            repository=extra.get("repository")
+        ))
         db.commit()
         db.close()
     except Exception as e:
         print(f"Error persisting job to database: {e}")
+    
+    return jobs[job_id]
+
+def finalize_job(job_id: str):
+    """Write the final state of a job to the database and drop it from memory."""
+    job = jobs.get(job_id)
+    if job is None:
+        return  # Deleted while running
+    checkpoint_writer.update(
+        job_id,
+        status=job["status"],
+        completed_at=datetime.fromisoformat(job["completed_at"]) if job.get("completed_at") else None,
+        files_processed=job["progress_info"].get("files_processed", 0),
+        current_file=job["progress_info"].get("current_file"),
+        last_progress_update=datetime.fromisoformat(job["progress_info"]["last_update"]) if job["progress_info"].get("last_update") else None,
+        return_code=job.get("return_code"),
+        output=job.get("output", ""),
+        error=job.get("error"),
+        stats=job.get("stats")
+    )
+    checkpoint_writer.flush()
+    record_job_metrics(job)
+    
+    # Finished jobs are served from the database
+    job_store.remove(job_id)
+    
+    # The job may have changed the repositories: syncs and reads run again instead of reusing a result
+    single_flight.forget(job.get("config"))
+    
+    # Count statuses and index error/warning lines while the output is still in memory
+    try:
+        build_index(job_id, (job.get("output") or "").split("\n"))
+    except Exception as e:
+        print(f"Could not index output of job {job_id}: {e}")
+
+def job_runners() -> Dict[str, Any]:
+    """Functions that run jobs, by the name queued jobs refer to them with."""
+    return {
+        "run_job_in_background": run_job_in_background,
+        "run_diff_job": run_diff_job,
+        "run_parallel_backup": run_parallel_backup,
+        "run_partial_check": run_partial_check
+    }
+
+def dispatch_job(runner: str, job_id: str, *args):
+    """Start a registered job: right here on the executor, otherwise through the executor's queue."""
+    if executor.is_executor:
+        threading.Thread(target=job_runners()[runner], args=(job_id, *args), daemon=True).start()
+    else:
+        job_store.enqueue(jobs.pop(job_id), runner, [job_id, *args])
+
+def run_job_dispatcher():
+    """Start jobs queued by other worker processes (executor only)."""
+    while True:
+        time.sleep(JOB_QUEUE_POLL_INTERVAL)
+        if not executor.is_executor:
+            continue
+        try:
+            for job, runner, args in job_store.claim():
+                jobs[job["id"]] = job
+                threading.Thread(target=job_runners()[runner], args=args, daemon=True).start()
+        except Exception as e:
+            print(f"Error starting queued jobs: {e}")
+
+def record_job_metrics(job: Dict[str, Any]):
+    """Record duration and throughput of a finished job."""
+    if not job.get("started_at") or not job.get("completed_at"):
+        return
+    duration = (datetime.fromisoformat(job["completed_at"]) - datetime.fromisoformat(job["started_at"])).total_seconds()
+    JOB_DURATION.observe(duration, job_type=job["type"], status=job["status"])
+    if duration <= 0 or job["status"] != "completed":
+        return
+    
+    files_processed = job["progress_info"].get("files_processed", 0)
+    if files_processed:
+        JOB_FILES_PER_SECOND.observe(files_processed / duration, job_type=job["type"])
+    
+    original_size = ((job.get("stats") or {}).get("archive") or {}).get("stats", {}).get("original_size")
+    if original_size:
+        JOB_BYTES_PER_SECOND.observe(original_size / duration, job_type=job["type"])
+
+# Repositories backed up at once by a parallel backup, unless the request says otherwise
+BACKUP_PARALLELISM = int(os.getenv("DASHBORG_BACKUP_PARALLELISM", "2"))
 
 @app.post("/api/backup-create")
 async def create_backup(request: Request, db: Session = Depends(get_db)):
@@ -279,36 +761,39 @@ async def create_backup(request: Request, db: Session = Depends(get_db)):
         job_id = str(uuid.uuid4())
         
         # Build command - Using --list to show files being processed
-        # Note: --list and --json cannot be used together, so we fetch stats separately after completion
+        # Note: --list and --json cannot be used together, so stats are parsed from the --stats text
         cmd = [
             "borgmatic", "create", 
-            "--config", f"/etc/borgmatic/{config_file}",
+            "--config", config_registry.path(config_file),
             "--verbosity", "1",
             "--list",  # Show files being backed up for progress tracking
-            "--stats"  # Show text statistics (JSON stats fetched separately after completion)
+            "--stats"  # Show text statistics, ingested when the job completes
         ]
         
+        # Multi-repository configs can back up each repository as its own sub-job, in parallel
+        repositories = config_registry.repositories(config_file) if data.get("parallel") else []
+        if len(repositories) > 1:
+            max_parallel = max(1, int(data.get("max_parallel") or BACKUP_PARALLELISM))
+            children = []
+            for repo in repositories:
+                target = repo["label"] or repo["path"]
+                children.append([str(uuid.uuid4()), target, cmd + ["--repository", target]])
+            register_job(
+                job_id, "backup-create", cmd, config_file,
+                parallel=True, max_parallel=max_parallel, child_job_ids=[child[0] for child in children]
+            )
+            dispatch_job("run_parallel_backup", job_id, config_file, children, max_parallel)
+            return JSONResponse({
+                "job_id": job_id,
+                "child_job_ids": [child[0] for child in children],
+                "message": f"Parallel backup of {len(children)} repositories started"
+            })
+        
         # Initialize job
-        jobs[job_id] = {
-            "id": job_id,
-            "type": "backup-create",
-            "command": " ".join(cmd),
-            "status": "pending",
-            "created_at": datetime.now().isoformat(),
-            "config": config_file,
-            "stats": None,
-            "output_lines": [],
-            "progress_info": {
-                "current_file": None,
-                "files_processed": 0,
-                "last_update": None
-            }
-        }
+        register_job(job_id, "backup-create", cmd, config_file)
         
         # Run in background thread, passing config_file for stats fetching
-        thread = threading.Thread(target=run_job_in_background, args=(job_id, cmd, "backup-create", config_file))
-        thread.daemon = True
-        thread.start()
+        dispatch_job("run_job_in_background", job_id, cmd, "backup-create", config_file)
         
         return JSONResponse({"job_id": job_id, "message": "Backup job started"})
     except Exception as e:
@@ -328,7 +813,7 @@ async def prune_archives(request: Request):
         # Build command
         cmd = [
             "borgmatic", "prune",
-            "--config", f"/etc/borgmatic/{config_file}",
+            "--config", config_registry.path(config_file),
             "--verbosity", "1",
             "--stats"
         ]
@@ -337,38 +822,122 @@ async def prune_archives(request: Request):
             cmd.append("--dry-run")
         
         # Initialize job
-        jobs[job_id] = {
-            "id": job_id,
-            "type": "prune" if not dry_run else "prune-dry-run",
-            "command": " ".join(cmd),
-            "status": "pending",
-            "created_at": datetime.now().isoformat(),
-            "config": config_file,
-            "stats": None,
-            "output_lines": [],
-            "progress_info": {
-                "current_file": None,
-                "files_processed": 0,
-                "last_update": None
-            }
-        }
+        register_job(job_id, "prune" if not dry_run else "prune-dry-run", cmd, config_file)
         
         # Run in background
-        thread = threading.Thread(target=run_job_in_background, args=(job_id, cmd, "prune"))
-        thread.daemon = True
-        thread.start()
+        dispatch_job("run_job_in_background", job_id, cmd, "prune")
         
         return JSONResponse({"job_id": job_id, "message": f"Prune job started ({'dry-run' if dry_run else 'live'})"})
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
+def simulate_retention_policies(repositories: List[str], policies: List[Dict[str, Any]], now: datetime, details: bool) -> List[Dict[str, Any]]:
+    """Run each policy over the synced archives of each repository (label or location)."""
+    db = SessionLocal()
+    try:
+        query = db.query(Repository)
+        if repositories:
+            query = query.filter((Repository.label.in_(repositories)) | (Repository.location.in_(repositories)))
+        results = []
+        for repo in query.order_by(Repository.label):
+            rows = db.execute(
+                select(Archive.name, Archive.start, Archive.deduplicated_size).where(Archive.repository_id == repo.id)
+            ).all()
+            names = [row.name for row in rows]
+            starts = [row.start for row in rows]
+            repo_result = {"repository": repo.label, "location": repo.location, "archives": len(rows), "policies": []}
+            for policy in policies:
+                kept_because, pruned = simulate_prune(names, starts, policy["policy"], now)
+                policy_result = {
+                    "name": policy["name"],
+                    "policy": policy["policy"],
+                    "keep_count": len(kept_because),
+                    "prune_count": len(pruned),
+                    # Deduplicated size counts the chunks only that archive references, so this is
+                    # a lower bound: chunks shared among pruned archives alone are freed as well
+                    "reclaimed_bytes_estimate": sum(rows[index].deduplicated_size or 0 for index in pruned)
+                }
+                if details:
+                    policy_result["keep"] = [
+                        {"name": names[index], "start": starts[index].isoformat(), "rule": rule, "number": number}
+                        for index, (rule, number) in sorted(kept_because.items(), key=lambda item: starts[item[0]], reverse=True)
+                    ]
+                    policy_result["prune"] = [
+                        {"name": names[index], "start": starts[index].isoformat(), "deduplicated_size": rows[index].deduplicated_size}
+                        for index in pruned
+                    ]
+                repo_result["policies"].append(policy_result)
+            results.append(repo_result)
+        return results
+    finally:
+        db.close()
+
+@app.post("/api/retention/simulate")
+async def simulate_retention(request: Request):
+    """Preview which synced archives retention policies would keep or prune, without contacting the repository."""
+    try:
+        data = await request.json()
+        config_file = data.get("config")
+        policies = [
+            {"name": policy.get("name") or f"policy {number}", "policy": {k: v for k, v in policy.items() if k != "name"}}
+            for number, policy in enumerate(data.get("policies") or [], start=1)
+        ]
+        
+        # The config's own retention settings come first, as the baseline to compare against
+        repositories = data.get("repositories") or ([data["repository"]] if data.get("repository") else [])
+        if config_file:
+            content = config_registry.get_content(config_file)
+            if content is None:
+                return JSONResponse({"error": "Config file not found"}, status_code=404)
+            config = normalize_legacy(load_config(content, config_registry.config_dir) or {})
+            current = policy_from_config(config)
+            if any(key in current for key in POLICY_KEYS):
+                policies.insert(0, {"name": "current", "policy": current})
+            if not repositories:
+                for repo in config_registry.repositories(config_file):
+                    repositories += [name for name in (repo["label"], repo["path"]) if name]
+        
+        if not policies:
+            return JSONResponse({"error": "No retention policy given"}, status_code=400)
+        for policy in policies:
+            try:
+                validate_policy(policy["policy"])
+            except ValueError as e:
+                return JSONResponse({"error": f"{policy['name']}: {e}"}, status_code=400)
+        
+        try:
+            now = datetime.fromisoformat(data["now"]) if data.get("now") else datetime.now()
+        except (TypeError, ValueError):
+            return JSONResponse({"error": f"Invalid now {data['now']!r}, expected an ISO 8601 time"}, status_code=400)
+        if now.tzinfo is not None:
+            now = now.astimezone().replace(tzinfo=None)  # Archive times are local, like borg's periods
+        results = await asyncio.to_thread(
+            simulate_retention_policies, repositories, policies, now, data.get("details", True)
+        )
+        return JSONResponse({"now": now.isoformat(), "repositories": results})
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
 @app.post("/api/check")
 async def check_repository(request: Request):
     """Check repository consistency and integrity."""
     try:
         data = await request.json()
         config_file = data.get("config", "config.yaml")
-        check_type = data.get("check_type", "repository")  # repository, archives, data, extract
+        check_type = data.get("check_type", "repository")  # repository, archives, data, extract, partial
+        
+        # Time-boxed check of one repository, resuming where the previous one stopped
+        if check_type == "partial":
+            repositories = [
+                (config_file, repo["label"] or repo["path"], repo["path"])
+                for repo in config_registry.repositories(config_file)
+                if data.get("repository") in (None, repo["label"], repo["path"])
+            ]
+            target = check_scheduler.next_target(repositories)
+            if target is None:
+                return JSONResponse({"error": "No matching repository in config"}, status_code=404)
+            job_id = start_partial_check(*target, int(data.get("max_duration") or CHECK_MAX_DURATION))
+            return JSONResponse({"job_id": job_id, "repository": target[1], "message": "Partial check started"})
         
         # Generate job ID
         job_id = str(uuid.uuid4())
@@ -376,66 +945,100 @@ async def check_repository(request: Request):
         # Build command
         cmd = [
             "borgmatic", "check",
-            "--config", f"/etc/borgmatic/{config_file}",
+            "--config", config_registry.path(config_file),
             "--verbosity", "1"
         ]
         
-        # Add check options based on type
-        if check_type == "repository":
-            cmd.append("--repository-only")
-        elif check_type == "archives":
-            cmd.append("--archives-only")
-        elif check_type == "data":
-            cmd.extend(["--verify-data"])
-        # "extract" uses default check behavior
+        # Add check options based on type; --force runs it even if the configured frequency says it isn't due
+        if check_type in ("repository", "archives", "data", "extract"):
+            cmd.extend(["--only", check_type, "--force"])
         
         # Initialize job
-        jobs[job_id] = {
-            "id": job_id,
-            "type": f"check-{check_type}",
-            "command": " ".join(cmd),
-            "status": "pending",
-            "created_at": datetime.now().isoformat(),
-            "config": config_file,
-            "stats": None,
-            "output_lines": [],
-            "progress_info": {
-                "current_file": None,
-                "files_processed": 0,
-                "last_update": None
-            }
-        }
+        register_job(job_id, f"check-{check_type}", cmd, config_file)
         
         # Run in background
-        thread = threading.Thread(target=run_job_in_background, args=(job_id, cmd, f"check-{check_type}"))
-        thread.daemon = True
-        thread.start()
+        dispatch_job("run_job_in_background", job_id, cmd, f"check-{check_type}", config_file)
         
         return JSONResponse({"job_id": job_id, "message": f"Check job started ({check_type})"})
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
+def check_targets() -> List[tuple]:
+    """(config, --repository value, path) of every configured repository, each listed once."""
+    targets = {}
+    for config_file in config_registry.list_configs():
+        for repo in config_registry.repositories(config_file):
+            targets.setdefault(repo["path"], (config_file, repo["label"] or repo["path"], repo["path"]))
+    return list(targets.values())
+
+def repositories_busy() -> bool:
+    """Whether a job that takes repository locks (backup, prune, check) is pending or running."""
+    return any(
+        job.get("type", "").startswith(("backup-create", "prune", "check"))
+        for job in job_store.active() if job.get("status") in ("pending", "running")
+    )
+
+def start_partial_check(config_file: str, repository: str, location: str, max_duration: int) -> str:
+    """Start a time-boxed check of one repository; returns the job ID."""
+    job_id = str(uuid.uuid4())
+    cmd = build_partial_check_command(config_registry.path(config_file), repository, max_duration)
+    register_job(job_id, "check-partial", cmd, config_file, repository=repository, max_duration=max_duration)
+    dispatch_job("run_partial_check", job_id, cmd, config_file, repository, location)
+    return job_id
+
+def run_partial_check(job_id: str, cmd: list, config_file: str, repository: str, location: str):
+    """Run a partial check job and record how far it got."""
+    job = jobs[job_id]
+    run_job_in_background(job_id, cmd, "check-partial", config_file)
+    try:
+        record_check(location, config_file, repository, job)
+    except Exception as e:
+        print(f"Error recording check progress: {e}")
+
+@app.get("/api/check/coverage")
+def get_check_coverage():
+    """Per-repository verification coverage of the time-boxed checks."""
+    try:
+        return JSONResponse({
+            "window": CHECK_WINDOW or None,
+            "max_duration": check_scheduler.max_duration,
+            "repositories": check_scheduler.coverage()
+        })
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
 # Track mounted archives
-mounted_archives: Dict[str, Dict[str, Any]] = {}
+mount_manager = MountManager(job_store, pid_lookup=lambda job_id: (job_store.get(job_id) or {}).get("pid") if job_id else None)
+
+def active_job_ids() -> set:
+    """IDs of jobs that are still pending or running, on any worker."""
+    return {job["id"] for job in job_store.active() if job.get("status") in ("pending", "running")}
 
 @app.post("/api/mount")
 async def mount_archive(request: Request):
-    """Mount an archive as a filesystem."""
+    """Mount an archive as a filesystem, reusing an existing mount if there is one."""
     try:
         data = await request.json()
         config_file = data.get("config", "config.yaml")
         archive_name = data.get("archive")
-        mount_point = data.get("mount_point", f"/mounts/archives/{archive_name}")
+        mount_point = data.get("mount_point", f"{mount_manager.mount_root}/{archive_name}")
         
         if not archive_name:
             return JSONResponse({"error": "Archive name is required"}, status_code=400)
         
-        # Check if already mounted
-        if archive_name in mounted_archives:
+        # Reuse existing mount (dropping ones whose mount process has died)
+        mount_manager.reconcile(active_job_ids())
+        existing = mount_manager.get(archive_name)
+        if existing:
             return JSONResponse({
-                "error": "Archive already mounted",
-                "mount_point": mounted_archives[archive_name]["mount_point"]
-            }, status_code=400)
+                "job_id": existing["job_id"],
+                "mount_point": existing["mount_point"],
+                "reused": True,
+                "message": f"Archive already mounted at {existing['mount_point']}"
+            })
+        
+        # Stay under the mount cap by unmounting least recently browsed archives
+        evicted = mount_manager.make_room()
         
         # Create mount point if it doesn't exist
         os.makedirs(mount_point, exist_ok=True)
@@ -446,42 +1049,26 @@ async def mount_archive(request: Request):
         # Build command
         cmd = [
             "borgmatic", "mount",
-            "--config", f"/etc/borgmatic/{config_file}",
+            "--config", config_registry.path(config_file),
             "--archive", archive_name,
             "--mount-point", mount_point,
             "--foreground"  # Keep in foreground for process tracking
         ]
         
         # Initialize job
-        jobs[job_id] = {
-            "id": job_id,
-            "type": "mount",
-            "command": " ".join(cmd),
-            "status": "pending",
-            "created_at": datetime.now().isoformat(),
-            "config": config_file,
-            "archive": archive_name,
-            "mount_point": mount_point,
-            "output_lines": [],
-            "progress_info": {}
-        }
+        register_job(job_id, "mount", cmd, config_file, archive=archive_name, mount_point=mount_point)
         
         # Track mounted archive
-        mounted_archives[archive_name] = {
-            "archive": archive_name,
-            "mount_point": mount_point,
-            "job_id": job_id,
-            "mounted_at": datetime.now().isoformat()
-        }
+        mount_manager.register(archive_name, config_file, mount_point, job_id)
         
         # Run in background
-        thread = threading.Thread(target=run_job_in_background, args=(job_id, cmd, "mount"))
-        thread.daemon = True
-        thread.start()
+        dispatch_job("run_job_in_background", job_id, cmd, "mount")
         
         return JSONResponse({
             "job_id": job_id,
             "mount_point": mount_point,
+            "reused": False,
+            "evicted": evicted,
             "message": f"Archive mounting at {mount_point}"
         })
     except Exception as e:
@@ -494,26 +1081,14 @@ async def umount_archive(request: Request):
         data = await request.json()
         archive_name = data.get("archive")
         
-        if not archive_name or archive_name not in mounted_archives:
+        mount_info = mount_manager.get(archive_name) if archive_name else None
+        if not mount_info:
             return JSONResponse({"error": "Archive not mounted"}, status_code=400)
         
-        mount_info = mounted_archives[archive_name]
         mount_point = mount_info["mount_point"]
-        
-        # Unmount using fusermount
-        result = subprocess.run(["fusermount", "-u", mount_point], capture_output=True, text=True)
-        
-        if result.returncode != 0:
-            return JSONResponse({"error": f"Failed to unmount: {result.stderr}"}, status_code=500)
-        
-        # Remove from tracking
-        del mounted_archives[archive_name]
-        
-        # Try to remove mount point directory
-        try:
-            os.rmdir(mount_point)
-        except:
-            pass  # Ignore errors
+        ok, error = mount_manager.unmount(archive_name)
+        if not ok:
+            return JSONResponse({"error": f"Failed to unmount: {error}"}, status_code=500)
         
         return JSONResponse({"message": f"Archive unmounted from {mount_point}"})
     except Exception as e:
@@ -521,8 +1096,12 @@ async def umount_archive(request: Request):
 
 @app.get("/api/mounted")
 def list_mounted_archives():
-    """List currently mounted archives."""
-    return JSONResponse({"mounted": list(mounted_archives.values())})
+    """List currently mounted archives with idle time and resource usage."""
+    return JSONResponse({
+        "mounted": mount_manager.list_mounts(),
+        "max_mounts": mount_manager.max_mounts,
+        "idle_timeout": mount_manager.idle_timeout
+    })
 
 @app.get("/api/browse")
 def browse_files(path: str = "/mounts"):
@@ -532,6 +1111,9 @@ def browse_files(path: str = "/mounts"):
         if not path.startswith("/mounts"):
             return JSONResponse({"error": "Access denied"}, status_code=403)
         
+        mount_manager.touch_path(path)
+        extract_cache.touch_path(path)
+        
         # Check if path exists
         if not os.path.exists(path):
             return JSONResponse({"error": "Path not found"}, status_code=404)
@@ -578,6 +1160,9 @@ def download_file(path: str):
         if not path.startswith("/mounts"):
             return JSONResponse({"error": "Access denied"}, status_code=403)
         
+        mount_manager.touch_path(path)
+        extract_cache.touch_path(path)
+        
         # Check if file exists
         if not os.path.exists(path):
             return JSONResponse({"error": "File not found"}, status_code=404)
@@ -596,6 +1181,133 @@ def download_file(path: str):
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
+# Chunk size for streamed restores; the pipe to borg is only drained as fast as the client reads
+RESTORE_CHUNK_SIZE = 64 * 1024
+
+async def _terminate_process_group(process: asyncio.subprocess.Process):
+    """Stop borgmatic and its borg child so the repository lock is released."""
+    if process.returncode is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        await asyncio.wait_for(process.wait(), timeout=10)
+    except asyncio.TimeoutError:
+        os.killpg(process.pid, signal.SIGKILL)
+        await process.wait()
+    except ProcessLookupError:
+        pass
+
+@app.get("/api/restore/stream")
+async def stream_restore(
+    request: Request,
+    archive: str,
+    path: str = "",
+    config: str = "config.yaml",
+    repository: Optional[str] = None,
+    mode: str = "file",
+    compression: str = "none"
+):
+    """Stream a single file (borg extract --stdout) or a subtree (export-tar) straight to the client."""
+    try:
+        if mode not in ("file", "tar"):
+            return JSONResponse({"error": "mode must be 'file' or 'tar'"}, status_code=400)
+        if compression not in ("none", "gzip"):
+            return JSONResponse({"error": "compression must be 'none' or 'gzip'"}, status_code=400)
+        if mode == "file" and not path:
+            return JSONResponse({"error": "path is required for file mode"}, status_code=400)
+        
+        path = path.lstrip("/")
+        repository_args = ["--repository", repository] if repository else []
+        
+        # Build command - borgmatic logs only errors (to stderr) so stdout carries just the data
+        if mode == "file":
+            cmd = [
+                "borgmatic", "borg",
+                "--config", config_registry.path(config),
+                "--verbosity", "-1",
+                *repository_args,
+                "extract", "--stdout", f"::{archive}", path
+            ]
+            filename = os.path.basename(path.rstrip("/")) or archive
+            media_type = "application/octet-stream"
+        else:
+            cmd = [
+                "borgmatic", "export-tar",
+                "--config", config_registry.path(config),
+                "--verbosity", "-1",
+                *repository_args,
+                "--archive", archive,
+                "--destination", "-"
+            ]
+            if path:
+                cmd.extend(["--path", path])
+            filename = f"{archive}.tar"
+            media_type = "application/x-tar"
+        
+        compressor = None
+        if compression == "gzip":
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+            filename += ".gz"
+            media_type = "application/gzip"
+        
+        # Waits for a slot of the interactive class like other restores; released once the stream ends
+        limits = await governor.acquire_async("restore")
+        streaming = False
+        try:
+            # Own process group so borg itself is stopped along with borgmatic
+            process_start = time.perf_counter()
+            process = await asyncio.create_subprocess_exec(
+                *governor.wrap(cmd, limits),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True
+            )
+            stderr_task = asyncio.create_task(process.stderr.read())
+            
+            # Read ahead one chunk so failures before any data can still return a proper error
+            first_chunk = await process.stdout.read(RESTORE_CHUNK_SIZE)
+            if not first_chunk:
+                return_code = await process.wait()
+                if return_code != 0:
+                    record_command(cmd, time.perf_counter() - process_start, return_code)
+                    stderr = (await stderr_task).decode("utf-8", errors="replace")
+                    return JSONResponse({"error": stderr or f"Restore failed with exit code {return_code}"}, status_code=500)
+            streaming = True
+        finally:
+            if not streaming:
+                governor.release(limits)
+        
+        async def stream_body():
+            try:
+                chunk = first_chunk
+                while chunk:
+                    yield compressor.compress(chunk) if compressor else chunk
+                    chunk = await process.stdout.read(RESTORE_CHUNK_SIZE)
+                return_code = await process.wait()
+                if return_code != 0:
+                    # The 200 is already sent: raising drops the connection before the final chunk
+                    # (and gzip trailer), so the client sees a failed download instead of a short file
+                    stderr = (await stderr_task).decode("utf-8", errors="replace").strip()
+                    print(f"Streamed restore of {archive}:{path} failed with exit code {return_code}, aborting the response: {stderr}")
+                    raise RuntimeError(f"Restore of {archive}:{path} failed with exit code {return_code}")
+                if compressor:
+                    yield compressor.flush()
+            finally:
+                # Client disconnected or stream was cancelled: stop borg
+                await _terminate_process_group(process)
+                stderr_task.cancel()
+                record_command(cmd, time.perf_counter() - process_start, process.returncode)
+                governor.release(limits)
+        
+        quoted_filename = urllib.parse.quote(filename)
+        return StreamingResponse(
+            stream_body(),
+            media_type=media_type,
+            headers={"Content-Disposition": f"attachment; filename*=utf-8''{quoted_filename}"}
+        )
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
 @app.post("/api/extract")
 async def extract_archive(request: Request):
     """Extract files from an archive."""
@@ -603,22 +1315,37 @@ async def extract_archive(request: Request):
         data = await request.json()
         config_file = data.get("config", "config.yaml")
         archive_name = data.get("archive")
-        destination = data.get("destination", "/mounts/extracts")
+        destination = data.get("destination")  # Default: the extract cache
         paths = data.get("paths", [])  # Specific paths to extract, empty = all
         
         if not archive_name:
             return JSONResponse({"error": "Archive name is required"}, status_code=400)
         
-        # Create destination if it doesn't exist
-        os.makedirs(destination, exist_ok=True)
-        
         # Generate job ID
         job_id = str(uuid.uuid4())
         
+        if destination:
+            # Create destination if it doesn't exist
+            os.makedirs(destination, exist_ok=True)
+        else:
+            # Serve the request from an earlier extraction of the same paths, or of a superset
+            entry = extract_cache.lookup(config_file, archive_name, paths)
+            if entry is None:
+                entry = extract_cache.reserve(config_file, archive_name, paths, job_id)
+            if entry["job_id"] != job_id:
+                return JSONResponse({
+                    "job_id": entry["job_id"],
+                    "destination": entry["directory"],
+                    "cached": True,
+                    "status": "completed" if entry["status"] == "ready" else "running",
+                    "message": f"Already extracted to {entry['directory']}" if entry["status"] == "ready" else f"Being extracted to {entry['directory']}"
+                })
+            destination = entry["directory"]
+        
         # Build command
         cmd = [
             "borgmatic", "extract",
-            "--config", f"/etc/borgmatic/{config_file}",
+            "--config", config_registry.path(config_file),
             "--archive", archive_name,
             "--destination", destination,
             "--progress"
@@ -630,106 +1357,59 @@ async def extract_archive(request: Request):
             cmd.extend(paths)
         
         # Initialize job
-        jobs[job_id] = {
-            "id": job_id,
-            "type": "extract",
-            "command": " ".join(cmd),
-            "status": "pending",
-            "created_at": datetime.now().isoformat(),
-            "config": config_file,
-            "archive": archive_name,
-            "destination": destination,
-            "paths": paths,
-            "output_lines": [],
-            "progress_info": {
-                "current_file": None,
-                "files_processed": 0,
-                "last_update": None
-            }
-        }
+        register_job(job_id, "extract", cmd, config_file, archive=archive_name, destination=destination, paths=paths)
         
         # Run in background
-        thread = threading.Thread(target=run_job_in_background, args=(job_id, cmd, "extract"))
-        thread.daemon = True
-        thread.start()
+        dispatch_job("run_job_in_background", job_id, cmd, "extract", config_file)
         
         return JSONResponse({
             "job_id": job_id,
             "destination": destination,
+            "cached": False,
+            "status": "pending",
             "message": f"Extraction started to {destination}"
         })
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
-@app.get("/api/jobs")
-def list_jobs(db: Session = Depends(get_db), limit: int = 50, offset: int = 0):
-    """List all jobs from database and merge with in-memory active jobs."""
+@app.get("/api/extract/cache")
+def get_extract_cache():
+    """Cached extractions with their size and last use, and the cache's quota and usage."""
     try:
-        # Get jobs from database
-        db_jobs = db.query(BackupJob)\
-            .order_by(desc(BackupJob.created_at))\
-            .offset(offset)\
-            .limit(limit)\
-            .all()
-        
-        # Convert database jobs to dict format
-        job_list = []
-        for db_job in db_jobs:
-            job_dict = {
-                "id": db_job.job_id,
-                "type": db_job.job_type,
-                "command": db_job.command,
-                "config": db_job.config_file,
-                "status": db_job.status,
-                "created_at": db_job.created_at.isoformat() if db_job.created_at else None,
-                "started_at": db_job.started_at.isoformat() if db_job.started_at else None,
-                "completed_at": db_job.completed_at.isoformat() if db_job.completed_at else None,
-                "return_code": db_job.return_code,
-                "output": db_job.output,
-                "error": db_job.error,
-                "stats": db_job.stats,
-                "progress_info": {
-                    "files_processed": db_job.files_processed or 0,
-                    "current_file": db_job.current_file,
-                    "last_update": None
-                }
-            }
-            job_list.append(job_dict)
-        
-        # Merge with in-memory jobs (for active/pending jobs not yet persisted)
-        in_memory_ids = set()
-        for job_id, job_data in jobs.items():
-            in_memory_ids.add(job_id)
-            # Check if this job is already in database list
-            if not any(j["id"] == job_id for j in job_list):
-                job_list.append(job_data)
-        
-        # Update database jobs with in-memory data if they're still active
-        for i, job in enumerate(job_list):
-            if job["id"] in jobs:
-                # Override with latest in-memory data for active jobs
-                job_list[i] = jobs[job["id"]]
-        
-        # Sort by created_at, newest first
-        job_list.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-        
-        return JSONResponse(job_list)
+        return JSONResponse(extract_cache.status())
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
-@app.get("/api/jobs/{job_id}")
-def get_job(job_id: str, db: Session = Depends(get_db)):
-    """Get a specific job status."""
-    # First check in-memory jobs for active jobs
-    if job_id in jobs:
-        return JSONResponse(jobs[job_id])
-    
-    # Otherwise check database for historical jobs
-    db_job = db.query(BackupJob).filter(BackupJob.job_id == job_id).first()
-    if not db_job:
-        return JSONResponse({"error": "Job not found"}, status_code=404)
-    
-    return JSONResponse({
+@app.delete("/api/extract/cache")
+def clear_extract_cache():
+    """Remove all completed cached extractions."""
+    try:
+        return JSONResponse({"evicted": extract_cache.evict()})
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@app.delete("/api/extract/cache/{entry_id}")
+def evict_extract_cache_entry(entry_id: int):
+    """Remove one cached extraction."""
+    try:
+        if not extract_cache.evict(entry_id):
+            return JSONResponse({"error": "Cached extraction not found"}, status_code=404)
+        return JSONResponse({"evicted": 1})
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+# Columns needed to serialize a job; selecting them skips ORM object construction
+JOB_COLUMNS = (
+    BackupJob.job_id, BackupJob.job_type, BackupJob.command, BackupJob.config_file, BackupJob.status,
+    BackupJob.created_at, BackupJob.started_at, BackupJob.completed_at, BackupJob.return_code,
+    BackupJob.output, BackupJob.error, BackupJob.stats, BackupJob.files_processed,
+    BackupJob.current_file, BackupJob.last_progress_update, BackupJob.parent_job_id, BackupJob.repository,
+    BackupJob.resources
+)
+
+def job_to_dict(db_job) -> Dict[str, Any]:
+    """Serialize a BackupJob row (ORM object or JOB_COLUMNS tuple) in the same shape as in-memory jobs."""
+    return {
         "id": db_job.job_id,
         "type": db_job.job_type,
         "command": db_job.command,
@@ -746,25 +1426,119 @@ def get_job(job_id: str, db: Session = Depends(get_db)):
             "files_processed": db_job.files_processed or 0,
             "current_file": db_job.current_file,
             "last_update": db_job.last_progress_update.isoformat() if db_job.last_progress_update else None
-        }
-    })
+        },
+        "parent_job_id": db_job.parent_job_id,
+        "repository": db_job.repository,
+        "resources": db_job.resources
+    }
+
+@app.get("/api/jobs")
+def list_jobs(db: Session = Depends(get_db), limit: int = 50, offset: int = 0):
+    """List jobs from the database, with live progress for jobs still running."""
+    try:
+        # Every job has a row from the moment it is created
+        db_jobs = db.execute(
+            select(*JOB_COLUMNS).order_by(desc(BackupJob.created_at)).offset(offset).limit(limit)
+        ).all()
+        
+        # Active jobs are served from live state for up-to-the-second progress
+        live = job_store.get_many(db_job.job_id for db_job in db_jobs)
+        job_list = [live.get(db_job.job_id) or job_to_dict(db_job) for db_job in db_jobs]
+        
+        return JSONResponse(job_list)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str, db: Session = Depends(get_db)):
+    """Get a specific job status."""
+    # First check live state for active jobs
+    live_job = job_store.get(job_id)
+    if live_job is not None:
+        return JSONResponse(live_job)
+    
+    # Otherwise check database for historical jobs
+    db_job = db.execute(select(*JOB_COLUMNS).where(BackupJob.job_id == job_id)).first()
+    if not db_job:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    
+    return JSONResponse(job_to_dict(db_job))
+
+@app.get("/api/jobs/{job_id}/log")
+def search_job_log(
+    job_id: str,
+    q: Optional[str] = None,
+    regex: Optional[str] = None,
+    status: Optional[str] = None,
+    path: Optional[str] = None,
+    problems: bool = False,
+    severity: Optional[str] = None,
+    after_line: int = 0,
+    limit: int = 200
+):
+    """Search a job's output without sending all of it.
+    
+    q: substring, regex: regular expression, status: borg --list letters or names ("A,M", "added,error"),
+    path: archive path or directory ("etc" matches etc and etc/hosts, not etcetera),
+    problems: only error/warning lines (of severity, if given; status and path still apply).
+    Pages with after_line = the previous page's next_after_line.
+    """
+    try:
+        statuses = parse_statuses(status)
+        pattern = re.compile(regex) if regex else None
+    except (ValueError, re.error) as e:
+        return JSONResponse({"error": f"Invalid filter: {e}"}, status_code=400)
+    path = path.strip("/") if path else None
+    limit = max(1, min(limit, 1000))
+    
+    try:
+        live_job = job_store.get(job_id)
+        if live_job is not None:
+            # Other workers only see the tail of a running job's output
+            lines = live_job.get("output_lines") or []
+            first = live_job.get("output_line_count", len(lines)) - len(lines) + 1
+            numbered = itertools.islice(enumerate(lines, first), max(after_line - first + 1, 0), None)
+            if problems:
+                numbered = ((number, line) for number, line in numbered if classify(line) in ((severity,) if severity else ("error", "warning")))
+            result = search_lines(numbered, pattern, q, statuses, path, limit)
+            return JSONResponse({"job_id": job_id, "live": True, "first_line": first, **result})
+        
+        db = SessionLocal()
+        try:
+            row_id = db.execute(select(BackupJob.id).where(BackupJob.job_id == job_id)).scalar()
+        finally:
+            db.close()
+        if row_id is None:
+            return JSONResponse({"error": "Job not found"}, status_code=404)
+        
+        summary = stored_index(job_id)
+        if problems:
+            result = search_problems(job_id, severity, pattern, q, after_line, limit, statuses, path)
+        else:
+            numbered = itertools.islice(enumerate(iter_stored_lines(row_id), 1), after_line, None)
+            result = search_lines(numbered, pattern, q, statuses, path, limit)
+        return JSONResponse({"job_id": job_id, "live": False, "summary": summary, **result})
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
 
 @app.delete("/api/jobs/{job_id}")
 def delete_job(job_id: str, db: Session = Depends(get_db)):
     """Delete a job from history (both in-memory and database)."""
     try:
-        # Delete from in-memory jobs
-        if job_id in jobs:
-            del jobs[job_id]
+        # Delete from live state
+        was_live = job_store.get(job_id) is not None
+        job_store.remove(job_id)
+        checkpoint_writer.discard(job_id)
         
         # Delete from database
         db_job = db.query(BackupJob).filter(BackupJob.job_id == job_id).first()
         if db_job:
             db.delete(db_job)
+            delete_index(db, job_id)
             db.commit()
             return JSONResponse({"message": "Job deleted from database"})
         
-        if job_id not in jobs and not db_job:
+        if not was_live and not db_job:
             return JSONResponse({"error": "Job not found"}, status_code=404)
         
         return JSONResponse({"message": "Job deleted"})
@@ -773,12 +1547,19 @@ def delete_job(job_id: str, db: Session = Depends(get_db)):
         return JSONResponse({"error": str(e)}, status_code=500)
 
 @app.get("/api/borgmatic/{command}")
-def run_borgmatic_command(command: str):
-    """Run a borgmatic command (e.g., info, list, prune, etc.) and return output."""
+def run_borgmatic_command(command: str, fresh_within: Optional[float] = None):
+    """Run a borgmatic command (e.g., info, list, prune, etc.) and return output.
+    
+    Read-only commands running concurrently share one run; fresh_within (seconds) reuses a recent one.
+    """
+    run = lambda: run_command([
+        "borgmatic", command, "--verbosity", "1"
+    ], capture_output=True, text=True, check=True)
     try:
-        result = subprocess.run([
-            "borgmatic", command, "--verbosity", "1"
-        ], capture_output=True, text=True, check=True)
+        if command in READ_ONLY_BORGMATIC_COMMANDS:
+            result, flight = single_flight.do(("borgmatic-" + command, None), run, fresh_within)
+            return JSONResponse({"output": result.stdout, "single_flight": flight})
+        result = run()
         return JSONResponse({"output": result.stdout})
     except subprocess.CalledProcessError as e:
         return JSONResponse({"error": e.stderr}, status_code=500)
@@ -788,19 +1569,20 @@ def run_borgmatic_command(command: str):
 # STATS & DATA COLLECTION ENDPOINTS
 # ============================================================================
 
-@app.post("/api/sync-repositories")
-async def sync_repositories(request: Request, db: Session = Depends(get_db)):
-    """Sync repository information from borgmatic/borg to database."""
+def fresh_within_arg(value) -> Optional[float]:
+    """Seconds a shared result may be old to be reused, from a request; None to always run."""
+    return float(value) if value else None
+
+def sync_repository_info(config_file: str) -> Dict[str, Any]:
+    """Store repository info and cache statistics of a config from borgmatic info."""
+    db = SessionLocal()
     try:
-        data = await request.json()
-        config_file = data.get("config", "config.yaml")
-        
         # Get repository info using borgmatic info --json
-        cmd = ["borgmatic", "info", "--config", f"/etc/borgmatic/{config_file}", "--json"]
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        cmd = ["borgmatic", "info", "--config", config_registry.path(config_file), "--json"]
+        result = run_command(cmd, capture_output=True, text=True, timeout=30)
         
         if result.returncode != 0:
-            return JSONResponse({"error": result.stderr}, status_code=500)
+            raise RuntimeError(result.stderr)
         
         info_data = json.loads(result.stdout)
         synced_repos = []
@@ -810,13 +1592,21 @@ async def sync_repositories(request: Request, db: Session = Depends(get_db)):
                 repo_data = repo_info["repository"]
                 encryption_data = repo_info.get("encryption", {})
                 
-                # Check if repository exists
+                # Check if repository exists; rows recorded from a backup or an archive sync
+                # have no repo_id yet, so fall back to the location, then the label
                 repo = db.query(Repository).filter(
                     Repository.repo_id == repo_data.get("id")
                 ).first()
+                if repo is None:
+                    repo = db.query(Repository).filter(
+                        Repository.repo_id.is_(None), Repository.location == repo_data.get("location")
+                    ).first() or db.query(Repository).filter(
+                        Repository.repo_id.is_(None), Repository.label == repo_data.get("label", "unknown")
+                    ).first()
                 
                 if repo:
                     # Update existing
+                    repo.repo_id = repo_data.get("id")
                     repo.location = repo_data.get("location")
                     repo.encryption_mode = encryption_data.get("mode")
                     repo.last_modified = datetime.fromisoformat(repo_data.get("last_modified").replace("Z", "+00:00")) if repo_data.get("last_modified") else None
@@ -858,27 +1648,43 @@ async def sync_repositories(request: Request, db: Session = Depends(get_db)):
                 })
         
         db.commit()
-        return JSONResponse({"synced_repositories": synced_repos, "count": len(synced_repos)})
-        
-    except Exception as e:
+        return {"synced_repositories": synced_repos, "count": len(synced_repos)}
+    except Exception:
         db.rollback()
-        return JSONResponse({"error": str(e)}, status_code=500)
+        raise
+    finally:
+        db.close()
 
 
-@app.post("/api/sync-archives")
-async def sync_archives(request: Request, db: Session = Depends(get_db)):
-    """Sync all archives from all repositories to database using two-step approach."""
+@app.post("/api/sync-repositories")
+async def sync_repositories(request: Request):
+    """Sync repository information from borgmatic/borg to database.
+    
+    Concurrent syncs of the same config share one run; fresh_within (seconds) reuses a recent one.
+    """
     try:
         data = await request.json()
         config_file = data.get("config", "config.yaml")
-        
+        result, flight = await asyncio.to_thread(
+            single_flight.do, ("sync-repositories", config_file),
+            lambda: sync_repository_info(config_file), fresh_within_arg(data.get("fresh_within"))
+        )
+        return JSONResponse({**result, "single_flight": flight})
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+def sync_archive_list(config_file: str) -> Dict[str, Any]:
+    """Store the archives of a config not synced yet, with their stats from borgmatic info."""
+    db = SessionLocal()
+    try:
         # Step 1: Use borgmatic list with --match-archives "*" to get ALL archive names
         # This bypasses archive_name_format filter
-        list_cmd = ["borgmatic", "list", "--config", f"/etc/borgmatic/{config_file}", "--json", "--match-archives", "*"]
-        list_result = subprocess.run(list_cmd, capture_output=True, text=True, timeout=60)
+        list_cmd = ["borgmatic", "list", "--config", config_registry.path(config_file), "--json", "--match-archives", "*"]
+        list_result = run_command(list_cmd, capture_output=True, text=True, timeout=60)
         
         if list_result.returncode != 0:
-            return JSONResponse({"error": list_result.stderr}, status_code=500)
+            raise RuntimeError(list_result.stderr)
         
         list_data = json.loads(list_result.stdout)
         synced_archives = []
@@ -906,14 +1712,16 @@ async def sync_archives(request: Request, db: Session = Depends(get_db)):
                     Archive.archive_id == archive_basic.get("id")
                 ).first()
                 
-                if existing_archive:
+                if existing_archive and not existing_archive.provisional:
                     continue  # Skip if already synced
                 
                 # Fetch detailed info for this specific archive
-                info_cmd = ["borgmatic", "info", "--config", f"/etc/borgmatic/{config_file}", "--json", "--archive", archive_name]
-                info_result = subprocess.run(info_cmd, capture_output=True, text=True, timeout=30)
+                info_cmd = ["borgmatic", "info", "--config", config_registry.path(config_file), "--json", "--archive", archive_name]
+                info_result = run_command(info_cmd, capture_output=True, text=True, timeout=30)
                 
                 if info_result.returncode != 0:
+                    if existing_archive:
+                        continue  # Keep the stats recorded from the backup until info works
                     # If info fails, create archive with basic data only
                     start_time = None
                     if archive_basic.get("start"):
@@ -966,11 +1774,8 @@ async def sync_archives(request: Request, db: Session = Depends(get_db)):
                         except:
                             pass
                     
-                    # Create new archive
-                    archive = Archive(
-                        repository_id=repo.id,
+                    fields = dict(
                         name=archive_data.get("name"),
-                        archive_id=archive_data.get("id"),
                         start=start_time,
                         end=end_time,
                         duration=archive_data.get("duration"),
@@ -983,14 +1788,40 @@ async def sync_archives(request: Request, db: Session = Depends(get_db)):
                         comment=archive_data.get("comment"),
                         command_line=archive_data.get("command_line")
                     )
-                    db.add(archive)
+                    if existing_archive:
+                        # Replace the rounded stats recorded from the backup's --stats output
+                        for name, value in fields.items():
+                            setattr(existing_archive, name, value)
+                        existing_archive.provisional = False
+                    else:
+                        # Create new archive
+                        db.add(Archive(repository_id=repo.id, archive_id=archive_data.get("id"), **fields))
                     synced_archives.append(archive_data.get("name"))
         
         db.commit()
-        return JSONResponse({"synced_archives": len(synced_archives), "archives": synced_archives[:10]})
-        
-    except Exception as e:
+        return {"synced_archives": len(synced_archives), "archives": synced_archives[:10]}
+    except Exception:
         db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+@app.post("/api/sync-archives")
+async def sync_archives(request: Request):
+    """Sync all archives from all repositories to database using two-step approach.
+    
+    Concurrent syncs of the same config share one run; fresh_within (seconds) reuses a recent one.
+    """
+    try:
+        data = await request.json()
+        config_file = data.get("config", "config.yaml")
+        result, flight = await asyncio.to_thread(
+            single_flight.do, ("sync-archives", config_file),
+            lambda: sync_archive_list(config_file), fresh_within_arg(data.get("fresh_within"))
+        )
+        return JSONResponse({**result, "single_flight": flight})
+    except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
 
@@ -1043,12 +1874,161 @@ def get_dashboard_stats(db: Session = Depends(get_db)):
                     "date": a.start.isoformat() if a.start else None
                 }
                 for a in archive_sizes
-            ]
+            ],
+            "check_coverage": check_scheduler.coverage()
+        })
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@app.get("/api/stats/anomalies")
+def get_backup_anomalies(
+    db: Session = Depends(get_db),
+    days: int = 30,
+    repository: Optional[str] = None,
+    window: int = analytics.ANALYTICS_WINDOW
+):
+    """Backup performance trends per repository and the archives of the last `days` (0: all) that regressed.
+
+    Baselines are only computed for archives in the period, so days=0 costs most: about 0.6 s
+    for a million archives with the default window, once the history is cached.
+    """
+    if analytics.np is None:
+        return JSONResponse({"error": "Backup analytics require numpy (pip install numpy)"}, status_code=501)
+    if not 1 <= window <= analytics.MAX_WINDOW:
+        return JSONResponse({"error": f"window must be between 1 and {analytics.MAX_WINDOW} archives"}, status_code=400)
+    if days < 0:
+        return JSONResponse({"error": "days must be 0 (all history) or more"}, status_code=400)
+    try:
+        repositories = {r.id: r for r in db.query(Repository).all() if not repository or r.label == repository}
+        since = datetime.now().timestamp() - days * 86400 if days else None
+
+        results = []
+        for repository_id, archives in history_cache.get(engine).items():
+            if repository_id not in repositories:
+                continue
+            results.append({
+                "repository": repositories[repository_id].label,
+                "trends": analytics.summarize_trends(archives, window),
+                "anomalies": analytics.detect_anomalies(archives, window, since)
+            })
+
+        # Names and times only for the flagged archives
+        flagged = [anomaly for result in results for anomaly in result["anomalies"]]
+        if flagged:
+            ids = {anomaly["archive_id"] for anomaly in flagged}
+            names = {row.id: row for row in db.execute(select(Archive.id, Archive.name, Archive.start).where(Archive.id.in_(ids)))}
+            for anomaly in flagged:
+                row = names[anomaly["archive_id"]]
+                anomaly["archive"] = row.name
+                anomaly["start"] = row.start.isoformat() if row.start else None
+
+        return JSONResponse({
+            "window": window,
+            "days": days,
+            "slowdown_factor": analytics.SLOWDOWN_FACTOR,
+            "change_factor": analytics.CHANGE_FACTOR,
+            "total_anomalies": len(flagged),
+            "repositories": results
         })
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
 
 
+@app.get("/api/export/{table}")
+def export_table(
+    table: str,
+    format: str = "csv",
+    since: Optional[str] = None,
+    since_id: int = 0,
+    columns: Optional[str] = None
+):
+    """Stream a whole table (archives, repository_statistics, backup_jobs) as CSV, NDJSON or Parquet.
+
+    since (ISO timestamp) and since_id export only newer rows; X-Export-Last-Id is the since_id for the next export.
+    """
+    try:
+        export = Export(table, format, since, since_id, columns)
+    except ValueError as e:  # ExportError or a malformed since
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+    return StreamingResponse(
+        export.stream(),
+        media_type=export.media_type,
+        headers={
+            "Content-Disposition": f"attachment; filename={export.filename}",
+            "X-Export-Last-Id": str(export.last_id)
+        }
+    )
+
+
+@app.get("/api/federation/changes")
+def get_federation_changes(db: Session = Depends(get_db), cursor: Optional[str] = None, limit: int = 5000):
+    """Change feed for federating instances: repositories, archives, statistics and job summaries after cursor."""
+    try:
+        position = decode_cursor(cursor)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    try:
+        return JSONResponse(collect_changes(db, position, max(1, min(limit, 50000))))
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@app.get("/api/federation/peers")
+def get_federation_peers():
+    """Pull state of each federated peer."""
+    try:
+        return JSONResponse({"peers": federation.peer_statuses(), "interval": federation.interval})
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@app.post("/api/federation/pull")
+async def pull_federation_peers(request: Request):
+    """Pull one peer (or all of them) now, regardless of schedule and backoff."""
+    try:
+        data = await request.json() if await request.body() else {}
+        names = [name for name, _ in federation.peers]
+        if data.get("peer"):
+            if data["peer"] not in names:
+                return JSONResponse({"error": "Unknown peer"}, status_code=404)
+            names = [data["peer"]]
+        return JSONResponse({"peers": await asyncio.to_thread(federation.pull_all, names)})
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@app.get("/api/federation/dashboard")
+def get_federation_dashboard():
+    """Aggregated view over this instance and all peers, served from the local database."""
+    try:
+        return JSONResponse(federation.dashboard())
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+# Columns needed to serialize an archive listing; selecting them skips ORM object construction
+ARCHIVE_COLUMNS = (
+    Archive.id, Archive.name, Repository.label, Archive.start, Archive.duration,
+    Archive.original_size, Archive.compressed_size, Archive.deduplicated_size,
+    Archive.nfiles, Archive.hostname
+)
+
+def archive_to_dict(row) -> Dict[str, Any]:
+    """Serialize an ARCHIVE_COLUMNS tuple as an /api/archives entry."""
+    archive_id, name, label, start, duration, original_size, compressed_size, deduplicated_size, nfiles, hostname = row
+    return {
+        "id": archive_id,
+        "name": name,
+        "repository": label,
+        "start": start.isoformat() if start else None,
+        "duration": duration,
+        "original_size": original_size,
+        "compressed_size": compressed_size,
+        "deduplicated_size": deduplicated_size,
+        "nfiles": nfiles,
+        "hostname": hostname
+    }
+
 @app.get("/api/archives")
 def get_archives(
     db: Session = Depends(get_db),
@@ -1059,41 +2039,34 @@ def get_archives(
 ):
     """Get paginated list of archives with filtering."""
     try:
-        query = db.query(Archive).join(Repository)
+        filters = []
         
         # Filter by repository
         if repository:
-            query = query.filter(Repository.label == repository)
+            filters.append(Repository.label == repository)
         
         # Search by name
         if search:
-            query = query.filter(Archive.name.contains(search))
+            filters.append(Archive.name.contains(search))
         
         # Get total count
-        total = query.count()
-        
-        # Get paginated results
-        archives = query.order_by(desc(Archive.start)).offset(offset).limit(limit).all()
+        total = db.execute(select(func.count(Archive.id)).join(Repository).where(*filters)).scalar()
+        
+        # Get paginated results as plain column tuples
+        rows = db.execute(
+            select(*ARCHIVE_COLUMNS)
+            .join(Repository)
+            .where(*filters)
+            .order_by(desc(Archive.start))
+            .offset(offset)
+            .limit(limit)
+        ).all()
         
         return JSONResponse({
             "total": total,
             "limit": limit,
             "offset": offset,
-            "archives": [
-                {
-                    "id": a.id,
-                    "name": a.name,
-                    "repository": a.repository.label,
-                    "start": a.start.isoformat() if a.start else None,
-                    "duration": a.duration,
-                    "original_size": a.original_size,
-                    "compressed_size": a.compressed_size,
-                    "deduplicated_size": a.deduplicated_size,
-                    "nfiles": a.nfiles,
-                    "hostname": a.hostname
-                }
-                for a in archives
-            ]
+            "archives": [archive_to_dict(row) for row in rows]
         })
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=500)
@@ -1112,7 +2085,8 @@ def get_repositories(db: Session = Depends(get_db)):
                     "location": r.location,
                     "encryption_mode": r.encryption_mode,
                     "last_modified": r.last_modified.isoformat() if r.last_modified else None,
-                    "archive_count": len(r.archives)
+                    "archive_count": len(r.archives),
+                    "configs": config_registry.configs_for_repository(r.location) or config_registry.configs_for_repository(r.label)
                 }
                 for r in repos
             ]
@@ -1121,10 +2095,257 @@ def get_repositories(db: Session = Depends(get_db)):
         return JSONResponse({"error": str(e)}, status_code=500)
 
 
+# ============================================================================
+# ARCHIVE COMPARISON ENDPOINTS
+# ============================================================================
+
+def run_diff_job(job_id: str, diff_id: int, cmd: list, config_file: str):
+    """Run a borg diff job in background, streaming entries into the diff cache."""
+    limits = governor.acquire("diff")
+    jobs[job_id]["resources"] = limits
+    jobs[job_id]["status"] = "running"
+    jobs[job_id]["started_at"] = datetime.now().isoformat()
+    checkpoint_writer.update(job_id, status="running", started_at=datetime.fromisoformat(jobs[job_id]["started_at"]), resources=limits)
+    
+    def on_progress(entry_count: int, current_path: str):
+        now = datetime.now()
+        jobs[job_id]["progress_info"] = {
+            "current_file": current_path,
+            "files_processed": entry_count,
+            "last_update": now.isoformat()
+        }
+        checkpoint_writer.update(job_id, files_processed=entry_count, current_file=current_path, last_progress_update=now)
+    
+    process_start = time.perf_counter()
+    try:
+        result = run_diff(diff_id, governor.wrap(cmd, limits), on_progress)
+    finally:
+        governor.release(limits)
+    record_command(cmd, time.perf_counter() - process_start, result["return_code"])
+    
+    jobs[job_id]["status"] = result["status"]
+    jobs[job_id]["return_code"] = result["return_code"]
+    jobs[job_id]["error"] = result["error"]
+    jobs[job_id]["stats"] = {"diff_id": diff_id, "entry_count": result["entry_count"], "summary": result["summary"]}
+    jobs[job_id]["output"] = f"{result['entry_count']} changed paths" if result["status"] == "completed" else (result["error"] or "No output")
+    jobs[job_id]["progress_info"]["files_processed"] = result["entry_count"]
+    jobs[job_id]["completed_at"] = datetime.now().isoformat()
+    
+    finalize_job(job_id)
+
+def start_archive_diff(db: Session, config_file: str, archive1: str, archive2: str, repository: str = "", wait: bool = False):
+    """Return the cached diff for an archive pair, starting a diff job if there is none.
+    
+    Returns (diff, started) where started is True if a new borg diff job was launched.
+    """
+    pair_filter = (
+        ArchiveDiff.config_file == config_file,
+        ArchiveDiff.repository == repository,
+        ArchiveDiff.archive1 == archive1,
+        ArchiveDiff.archive2 == archive2
+    )
+    diff = db.query(ArchiveDiff).filter(*pair_filter).first()
+    if diff and diff.status in ("completed", "running"):
+        return diff, False
+    
+    if not diff:
+        diff = ArchiveDiff(
+            config_file=config_file,
+            repository=repository,
+            archive1=archive1,
+            archive2=archive2
+        )
+        db.add(diff)
+    
+    job_id = str(uuid.uuid4())
+    diff.status = "running"
+    diff.job_id = job_id
+    diff.error = None
+    diff.completed_at = None
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another request created the same pair concurrently
+        db.rollback()
+        return db.query(ArchiveDiff).filter(*pair_filter).first(), False
+    
+    cmd = build_diff_command(config_registry.path(config_file), archive1, archive2, repository)
+    register_job(job_id, "diff", cmd, config_file, archive1=archive1, archive2=archive2)
+    
+    if wait:
+        run_diff_job(job_id, diff.id, cmd, config_file)
+        db.refresh(diff)
+    else:
+        dispatch_job("run_diff_job", job_id, diff.id, cmd, config_file)
+    
+    return diff, True
+
+def precompute_latest_diffs(config_file: str):
+    """Diff the two most recent archives of each repository so the latest changes are ready to view."""
+    try:
+        list_cmd = ["borgmatic", "list", "--config", config_registry.path(config_file), "--json", "--match-archives", "*", "--last", "2"]
+        result, _ = single_flight.do(
+            ("list-latest", config_file), lambda: run_command(list_cmd, capture_output=True, text=True, timeout=60)
+        )
+        if result.returncode != 0:
+            print(f"Skipping diff precompute for {config_file}: {result.stderr.strip()}")
+            return
+        
+        list_data = json.loads(result.stdout)
+        db = SessionLocal()
+        try:
+            for repo_data in list_data:
+                archives = sorted(repo_data.get("archives", []), key=lambda a: a.get("start") or "")
+                if len(archives) < 2:
+                    continue
+                
+                # Only address repositories explicitly when the config has several
+                repository = ""
+                if len(list_data) > 1:
+                    repo_info = repo_data.get("repository", {})
+                    repository = repo_info.get("label") or repo_info.get("location") or ""
+                
+                start_archive_diff(db, config_file, archives[-2]["name"], archives[-1]["name"], repository, wait=True)
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"Error precomputing archive diff: {e}")
+
+@app.post("/api/archives/diff")
+async def diff_archives(request: Request, db: Session = Depends(get_db)):
+    """Compare two archives with borg diff. Results are cached per archive pair."""
+    try:
+        data = await request.json()
+        config_file = data.get("config", "config.yaml")
+        archive1 = data.get("archive1")
+        archive2 = data.get("archive2")
+        repository = data.get("repository") or ""
+        
+        if not archive1 or not archive2:
+            return JSONResponse({"error": "archive1 and archive2 are required"}, status_code=400)
+        
+        diff, started = start_archive_diff(db, config_file, archive1, archive2, repository)
+        response = diff_to_dict(diff)
+        response["cached"] = diff.status == "completed"
+        response["message"] = "Diff job started" if started else f"Diff {diff.status}"
+        return JSONResponse(response)
+    except Exception as e:
+        db.rollback()
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+@app.get("/api/archives/diff/{diff_id}")
+def get_archive_diff(
+    diff_id: int,
+    db: Session = Depends(get_db),
+    limit: int = 100,
+    offset: int = 0,
+    change_type: Optional[str] = None,
+    path_prefix: Optional[str] = None
+):
+    """Get paginated entries of an archive diff, filtered by change type and path prefix."""
+    try:
+        diff = db.query(ArchiveDiff).filter(ArchiveDiff.id == diff_id).first()
+        if not diff:
+            return JSONResponse({"error": "Diff not found"}, status_code=404)
+        
+        query = db.query(ArchiveDiffEntry).filter(ArchiveDiffEntry.diff_id == diff_id)
+        
+        # Filter by change type (comma-separated list, e.g. "added,modified")
+        if change_type:
+            query = query.filter(ArchiveDiffEntry.change_type.in_(change_type.split(",")))
+        
+        # Filter by path prefix
+        if path_prefix:
+            query = query.filter(ArchiveDiffEntry.path.startswith(path_prefix.lstrip("/"), autoescape=True))
+        
+        total = query.count()
+        entries = query.order_by(ArchiveDiffEntry.path).offset(offset).limit(limit).all()
+        
+        response = diff_to_dict(diff)
+        response.update({
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "entries": [
+                {
+                    "path": e.path,
+                    "change_type": e.change_type,
+                    "size_added": e.size_added,
+                    "size_removed": e.size_removed,
+                    "changes": e.changes
+                }
+                for e in entries
+            ]
+        })
+        return JSONResponse(response)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Expose metrics in the Prometheus text format."""
+    active_jobs = job_store.active()
+    JOBS_QUEUED.set(sum(1 for j in active_jobs if j.get("status") == "pending"))
+    JOBS_RUNNING.set(sum(1 for j in active_jobs if j.get("status") == "running"))
+    local_jobs = list(jobs.values())
+    JOBS_IN_MEMORY.set(len(local_jobs))
+    JOB_OUTPUT_LINES.set(sum(len(j.get("output_lines") or []) for j in local_jobs))
+    DB_FILE_SIZE.set(sum(
+        os.path.getsize(path) for path in (DATABASE_PATH, f"{DATABASE_PATH}-wal") if os.path.exists(path)
+    ))
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+# ============================================================================
+# PROFILING ENDPOINTS (enabled with DASHBORG_PROFILING=1)
+# ============================================================================
+
+@app.get("/api/admin/profiling")
+def get_profiling_report():
+    """Get recent slow requests and slow SQL statements."""
+    if not profiling.PROFILING_ENABLED:
+        return JSONResponse({"enabled": False, "error": "Profiling is disabled (set DASHBORG_PROFILING=1)"}, status_code=403)
+    return JSONResponse({
+        "enabled": True,
+        "slow_request_ms": profiling.SLOW_REQUEST_MS,
+        "slow_query_ms": profiling.SLOW_QUERY_MS,
+        "slow_requests": list(profiling.slow_requests),
+        "slow_queries": list(profiling.slow_queries)
+    })
+
+@app.get("/api/admin/resources")
+def get_resource_classes():
+    """Resource classes for borg processes: limits, concurrency caps and jobs waiting for a slot."""
+    status = governor.status()
+    return JSONResponse({
+        "classes": {name: {**settings, **status[name]} for name, settings in governor.classes.items()},
+        "job_types": {prefix: name for prefix, name in JOB_TYPE_CLASSES}
+    })
+
+@app.get("/api/admin/single-flight")
+def get_single_flight_status():
+    """Sync and borg read calls in flight, and how many calls joined a run or reused a fresh result."""
+    return JSONResponse(single_flight.status())
+
+@app.get("/api/admin/profile")
+def capture_profile(seconds: float = 10, interval_ms: float = 5):
+    """Sample all thread stacks for N seconds and return a flamegraph-compatible collapsed stack file."""
+    if not profiling.PROFILING_ENABLED:
+        return JSONResponse({"error": "Profiling is disabled (set DASHBORG_PROFILING=1)"}, status_code=403)
+    if seconds <= 0 or interval_ms <= 0:
+        return JSONResponse({"error": "seconds and interval_ms must be positive"}, status_code=400)
+    
+    folded = profiling.sample_stacks(seconds, interval_ms / 1000)
+    filename = f"dashborg-profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded"
+    return Response(folded, media_type="text/plain", headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+
 # SPA fallback: serve index.html for all non-API, non-static, non-assets routes
+index_page = IndexPage(os.path.join(os.path.dirname(__file__), "../webui/dist/index.html"))
+
 @app.get("/{full_path:path}")
-def spa_fallback(full_path: str):
+def spa_fallback(full_path: str, request: Request):
     if full_path.startswith("api/") or full_path.startswith("static/") or full_path.startswith("assets/"):
         return JSONResponse({"error": "Not found"}, status_code=404)
-    index_path = os.path.join(os.path.dirname(__file__), "../webui/dist/index.html")
-    return FileResponse(index_path)
+    return index_page.response(request.headers)
@@ -0,0 +1,237 @@
+"""
+Prometheus-format metrics for DashBorg
+"""
+import asyncio
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+# Default histogram buckets (seconds)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+# How often the event loop lag monitor wakes up (seconds)
+EVENT_LOOP_CHECK_INTERVAL = 0.1
+
+# borg subcommands recognised when borgmatic's "borg" passthrough action is used
+BORG_SUBCOMMANDS = {"create", "prune", "check", "info", "list", "mount", "extract", "diff", "export-tar", "compact"}
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric(ABC):
+    """Base class for a labelled metric family."""
+
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Exposition lines of every labelled series of this metric."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in self._values.items()]
+
+
+class Gauge(Metric):
+    metric_type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in self._values.items()]
+
+
+class Histogram(Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._sums[key] = self._sums.get(key, 0) + value
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, counts in self._counts.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(self._sums[key])}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+REGISTRY: List[Metric] = []
+
+
+def render_metrics() -> str:
+    """Render all registered metrics in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+# API
+HTTP_REQUEST_DURATION = Histogram(
+    "dashborg_http_request_duration_seconds", "HTTP request latency by route",
+    ["method", "route", "status"]
+)
+
+HTTP_COMPRESSION_BYTES = Counter(
+    "dashborg_http_compression_bytes_total", "Response bytes before (in) and after (out) compression",
+    ["encoding", "stage"]
+)
+EVENT_LOOP_LAG = Histogram(
+    "dashborg_event_loop_lag_seconds", "How late the event loop ran a timer scheduled every 100 ms",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+EVENT_LOOP_BLOCKED = Counter(
+    "dashborg_event_loop_blocked_seconds_total", "Total time the event loop was blocked past the monitor's schedule"
+)
+
+# borg / borgmatic subprocesses
+BORG_COMMAND_DURATION = Histogram(
+    "dashborg_borg_command_duration_seconds", "Duration of borg/borgmatic subprocesses by command",
+    ["command"]
+)
+BORG_COMMAND_EXITS = Counter(
+    "dashborg_borg_command_exits_total", "borg/borgmatic subprocess exits by command and exit code",
+    ["command", "exit_code"]
+)
+SINGLE_FLIGHT_CALLS = Counter(
+    "dashborg_single_flight_calls_total", "Sync and borg read calls by whether they ran, joined a run in flight or reused a fresh result",
+    ["operation", "outcome"]
+)
+
+# Jobs
+JOBS_QUEUED = Gauge("dashborg_jobs_queued", "Jobs created but not yet running")
+JOBS_RUNNING = Gauge("dashborg_jobs_running", "Jobs currently running")
+JOBS_IN_MEMORY = Gauge("dashborg_jobs_in_memory", "Entries in the in-memory jobs dict")
+JOB_OUTPUT_LINES = Gauge("dashborg_job_output_lines_buffered", "Output lines buffered in memory across all jobs")
+JOB_DURATION = Histogram("dashborg_job_duration_seconds", "Job duration by type and final status", ["job_type", "status"])
+JOB_FILES_PER_SECOND = Histogram(
+    "dashborg_job_files_per_second", "Files processed per second by finished jobs", ["job_type"],
+    buckets=(1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+)
+JOB_BYTES_PER_SECOND = Histogram(
+    "dashborg_job_bytes_per_second", "Original bytes processed per second by finished backup jobs", ["job_type"],
+    buckets=(1e5, 1e6, 1e7, 5e7, 1e8, 2.5e8, 5e8, 1e9, 5e9)
+)
+JOB_UPLOAD_BYTES_PER_SECOND = Histogram(
+    "dashborg_job_upload_bytes_per_second", "Deduplicated bytes uploaded per second by remote backup jobs", ["window"],
+    buckets=(1e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7, 1e8, 5e8)
+)
+
+# Database
+DB_QUERY_DURATION = Histogram("dashborg_db_query_duration_seconds", "SQLite statement latency by statement type", ["operation"])
+DB_FILE_SIZE = Gauge("dashborg_db_file_size_bytes", "Size of the SQLite database file including WAL")
+
+
+def command_label(cmd: Sequence[str]) -> str:
+    """Short command name for metric labels, e.g. "create" for borgmatic create ..."""
+    if not cmd:
+        return "unknown"
+    if len(cmd) < 2 or cmd[0] != "borgmatic":
+        return cmd[0].rsplit("/", 1)[-1]
+    if cmd[1] == "borg":
+        for part in cmd[2:]:
+            if part in BORG_SUBCOMMANDS:
+                return part
+    return cmd[1]
+
+
+def record_command(cmd: Sequence[str], duration: float, exit_code: Optional[int]):
+    """Record duration and exit code of a finished subprocess."""
+    label = command_label(cmd)
+    BORG_COMMAND_DURATION.observe(duration, command=label)
+    BORG_COMMAND_EXITS.inc(command=label, exit_code="none" if exit_code is None else exit_code)
+
+
+async def monitor_event_loop(interval: float = EVENT_LOOP_CHECK_INTERVAL):
+    """Measure event loop blocking: any delay in waking up from a timed sleep is time the loop was busy."""
+    loop = asyncio.get_running_loop()
+    while True:
+        scheduled = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - scheduled, 0)
+        EVENT_LOOP_LAG.observe(lag)
+        EVENT_LOOP_BLOCKED.inc(lag)
+
+
+def instrument_engine(engine):
+    """Time every statement executed through the SQLAlchemy engine."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["query_start_time"].pop()
+        operation = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else "unknown"
+        DB_QUERY_DURATION.observe(time.perf_counter() - start, operation=operation)
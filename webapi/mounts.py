@@ -0,0 +1,246 @@
+"""
+Archive mount lifecycle management for DashBorg
+"""
+import os
+import signal
+import subprocess
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+# Mount settings
+MOUNT_ROOT = os.getenv("DASHBORG_MOUNT_ROOT", "/mounts/archives")
+MAX_MOUNTS = int(os.getenv("DASHBORG_MAX_MOUNTS", "4"))
+MOUNT_IDLE_TIMEOUT = int(os.getenv("DASHBORG_MOUNT_IDLE_TIMEOUT", "900"))  # seconds
+MOUNT_REAP_INTERVAL = int(os.getenv("DASHBORG_MOUNT_REAP_INTERVAL", "30"))  # seconds
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _unescape_mountinfo(value: str) -> str:
+    """Decode the octal escapes (e.g. \\040 for space) used in /proc/self/mountinfo."""
+    return value.encode("utf-8").decode("unicode_escape").encode("latin-1").decode("utf-8")
+
+
+def read_fuse_mounts(mountinfo_path: str = "/proc/self/mountinfo") -> Dict[str, str]:
+    """Return {mount_point: fstype} for all FUSE mounts of this mount namespace."""
+    mounts = {}
+    try:
+        with open(mountinfo_path, "r") as f:
+            for line in f:
+                # Format: id parent major:minor root mount_point options [optional...] - fstype source super_options
+                fields = line.split()
+                if "-" not in fields:
+                    continue
+                separator = fields.index("-")
+                fstype = fields[separator + 1] if len(fields) > separator + 1 else ""
+                if fstype == "fuse" or fstype.startswith("fuse."):
+                    mounts[_unescape_mountinfo(fields[4])] = fstype
+    except OSError:
+        pass
+    return mounts
+
+
+def process_tree_usage(pid: int) -> Optional[Dict[str, Any]]:
+    """Sum RSS and CPU time over a process and all of its descendants (borgmatic -> borg)."""
+    parents: Dict[int, int] = {}
+    stats: Dict[int, Tuple[int, int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Fields after the parenthesised command name; ppid is the 2nd, utime/stime 12th/13th, rss 22nd
+        fields = stat[stat.rindex(")") + 2:].split()
+        parents[int(entry)] = int(fields[1])
+        stats[int(entry)] = (int(fields[11]) + int(fields[12]), int(fields[21]))
+
+    if pid not in stats:
+        return None
+
+    tree = [pid]
+    index = 0
+    while index < len(tree):
+        tree.extend(child for child, parent in parents.items() if parent == tree[index])
+        index += 1
+
+    return {
+        "pids": tree,
+        "rss_bytes": sum(stats[p][1] for p in tree) * PAGE_SIZE,
+        "cpu_seconds": round(sum(stats[p][0] for p in tree) / CLOCK_TICKS, 2),
+    }
+
+
+class MountManager:
+    """Tracks archive mounts, reuses them, caps their number and unmounts idle ones.
+
+    Mount records live in the job store so every worker process sees the same mounts.
+    """
+
+    def __init__(
+        self,
+        store,
+        pid_lookup: Callable[[Optional[str]], Optional[int]],
+        mount_root: str = MOUNT_ROOT,
+        max_mounts: int = MAX_MOUNTS,
+        idle_timeout: int = MOUNT_IDLE_TIMEOUT
+    ):
+        self.store = store  # job_store.JobStore holding the mount records
+        self.pid_lookup = pid_lookup  # job_id -> pid of its mount process
+        self.mount_root = mount_root.rstrip("/")
+        self.max_mounts = max_mounts
+        self.idle_timeout = idle_timeout
+        self._lock = threading.RLock()
+
+    def get(self, archive: str) -> Optional[Dict[str, Any]]:
+        """Return the mount of an archive and mark it as used."""
+        with self._lock:
+            mount = self.store.get_mount(archive)
+            if mount:
+                mount["last_access"] = time.time()
+                self.store.update_mount(archive, last_access=mount["last_access"])
+            return mount
+
+    def register(self, archive: str, config_file: str, mount_point: str, job_id: str) -> Dict[str, Any]:
+        """Record a newly started mount."""
+        with self._lock:
+            mount = {
+                "archive": archive,
+                "config": config_file,
+                "mount_point": mount_point,
+                "job_id": job_id,
+                "mounted_at": datetime.now().isoformat(),
+                "last_access": time.time(),
+                "adopted": False
+            }
+            self.store.put_mount(archive, mount)
+            return mount
+
+    def touch_path(self, path: str):
+        """Mark the mount containing a browsed or downloaded path as recently used."""
+        with self._lock:
+            for archive, mount in self.store.mounts().items():
+                mount_point = mount["mount_point"].rstrip("/")
+                if path == mount_point or path.startswith(mount_point + "/"):
+                    self.store.update_mount(archive, last_access=time.time())
+
+    def make_room(self) -> List[str]:
+        """Unmount least recently used archives until a new mount fits under the cap."""
+        evicted = []
+        with self._lock:
+            candidates = sorted(self.store.mounts().values(), key=lambda m: m["last_access"])
+            remaining = len(candidates)
+            for mount in candidates:
+                if remaining < self.max_mounts:
+                    break
+                ok, error = self.unmount(mount["archive"])
+                if ok:
+                    evicted.append(mount["archive"])
+                    remaining -= 1
+                else:
+                    print(f"Could not evict mount {mount['archive']}: {error}")
+        return evicted
+
+    def unmount(self, archive: str) -> Tuple[bool, Optional[str]]:
+        """Unmount an archive and forget it. Returns (success, error)."""
+        with self._lock:
+            mount = self.store.get_mount(archive)
+            if not mount:
+                return False, "Archive not mounted"
+            mount_point = mount["mount_point"]
+
+            if mount_point in read_fuse_mounts():
+                result = subprocess.run(["fusermount", "-u", mount_point], capture_output=True, text=True)
+                if result.returncode != 0:
+                    return False, result.stderr.strip()
+            else:
+                # Mount never came up (or is still starting): stop its process instead
+                pid = self.pid_lookup(mount["job_id"])
+                if pid:
+                    try:
+                        os.kill(pid, signal.SIGTERM)
+                    except ProcessLookupError:
+                        pass
+
+            self.store.remove_mount(archive)
+
+        # Try to remove mount point directory
+        try:
+            os.rmdir(mount_point)
+        except OSError:
+            pass
+        return True, None
+
+    def reap_idle(self) -> List[str]:
+        """Unmount archives that nobody browsed within the idle timeout."""
+        if self.idle_timeout <= 0:
+            return []
+        cutoff = time.time() - self.idle_timeout
+        with self._lock:
+            idle = [m["archive"] for m in self.store.mounts().values() if m["last_access"] < cutoff]
+        return [archive for archive in idle if self.unmount(archive)[0]]
+
+    def reconcile(self, active_job_ids: Set[str]):
+        """Sync tracked mounts with the kernel's mount table.
+
+        FUSE mounts under the mount root that we don't know about (e.g. left over from
+        before a restart) are adopted so they can be browsed, evicted and unmounted.
+        Tracked mounts whose mount process ended and that are no longer mounted are dropped.
+        """
+        fuse_mounts = read_fuse_mounts()
+        with self._lock:
+            mounts = self.store.mounts()
+            known_points = {m["mount_point"] for m in mounts.values()}
+            for mount_point in fuse_mounts:
+                if mount_point.startswith(self.mount_root + "/") and mount_point not in known_points:
+                    archive = os.path.basename(mount_point)
+                    self.store.put_mount(archive, {
+                        "archive": archive,
+                        "config": None,
+                        "mount_point": mount_point,
+                        "job_id": None,
+                        "mounted_at": None,
+                        "last_access": time.time(),
+                        "adopted": True
+                    })
+                    print(f"✓ Adopted existing mount {mount_point}")
+
+            for archive, mount in mounts.items():
+                if mount["mount_point"] not in fuse_mounts and mount["job_id"] not in active_job_ids:
+                    self.store.remove_mount(archive)
+
+    def list_mounts(self) -> List[Dict[str, Any]]:
+        """List mounts with idle time and resource usage of their mount process."""
+        now = time.time()
+        result = []
+        for mount in self.store.mounts().values():
+            pid = self.pid_lookup(mount["job_id"])
+            mount["idle_seconds"] = round(now - mount.pop("last_access"), 1)
+            mount["pid"] = pid
+            mount["resources"] = process_tree_usage(pid) if pid else None
+            result.append(mount)
+        return result
+
+    def __len__(self) -> int:
+        return len(self.store.mounts())
+
+    def start_reaper(self, active_job_ids: Callable[[], Set[str]], interval: int = MOUNT_REAP_INTERVAL):
+        """Periodically reconcile with the mount table and unmount idle archives."""
+        def reaper_loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reconcile(active_job_ids())
+                    for archive in self.reap_idle():
+                        print(f"Unmounted idle archive {archive}")
+                except Exception as e:
+                    print(f"Error in mount reaper: {e}")
+
+        thread = threading.Thread(target=reaper_loop, daemon=True)
+        thread.start()
+        return thread
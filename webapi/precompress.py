@@ -0,0 +1,58 @@
+"""
+Build step: write gzip (and brotli, if available) variants of the web UI bundle
+
+Usage: python precompress.py ../webui/dist
+"""
+import gzip
+import os
+import sys
+
+try:
+    import brotli
+except ImportError:  # gzip variants only
+    brotli = None
+
+# Only text formats benefit; images and fonts are already compressed
+COMPRESSIBLE_EXTENSIONS = {".html", ".js", ".mjs", ".css", ".json", ".svg", ".map", ".txt", ".xml", ".wasm"}
+MIN_SIZE = 1024  # bytes; smaller files fit in a packet either way
+
+
+def precompress_file(path: str) -> list:
+    """Write path.gz (and path.br) next to path if they make it smaller. Returns the variants written."""
+    with open(path, "rb") as f:
+        data = f.read()
+    written = []
+    variants = [(".gz", lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", lambda d: brotli.compress(d, quality=11)))
+    for suffix, compress in variants:
+        compressed = compress(data)
+        if len(compressed) >= len(data):
+            continue
+        with open(path + suffix, "wb") as f:
+            f.write(compressed)
+        written.append((path + suffix, len(data), len(compressed)))
+    return written
+
+
+def precompress_tree(root: str) -> list:
+    written = []
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            if os.path.splitext(filename)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            if os.path.getsize(path) < MIN_SIZE:
+                continue
+            written.extend(precompress_file(path))
+    return written
+
+
+if __name__ == "__main__":
+    root = sys.argv[1] if len(sys.argv) > 1 else "../webui/dist"
+    written = precompress_tree(root)
+    for path, original, compressed in written:
+        print(f"{os.path.relpath(path, root)}: {original} -> {compressed} bytes")
+    if brotli is None:
+        print("brotli not installed; wrote gzip variants only")
+    print(f"✓ Precompressed {len(written)} variants in {root}")
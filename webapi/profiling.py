@@ -0,0 +1,126 @@
+"""
+Opt-in profiling hooks for DashBorg: slow request log, slow SQL log and stack sampler
+"""
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+from sqlalchemy import event
+
+# Profiling settings
+PROFILING_ENABLED = os.getenv("DASHBORG_PROFILING", "false").lower() in ("1", "true", "yes")
+SLOW_REQUEST_MS = float(os.getenv("DASHBORG_SLOW_REQUEST_MS", "500"))
+SLOW_QUERY_MS = float(os.getenv("DASHBORG_SLOW_QUERY_MS", "100"))
+MAX_PROFILE_SECONDS = 60
+
+# Time breakdown of the request being handled ({"db": s, "subprocess": s, "serialize": s, "queries": n})
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("dashborg_request_timings", default=None)
+
+slow_requests: Deque[Dict[str, Any]] = deque(maxlen=100)
+slow_queries: Deque[Dict[str, Any]] = deque(maxlen=100)
+
+
+def start_request() -> Dict[str, float]:
+    """Begin collecting a time breakdown for the current request."""
+    timings = {"db": 0.0, "subprocess": 0.0, "serialize": 0.0, "queries": 0}
+    _request_timings.set(timings)
+    return timings
+
+
+def record_time(category: str, seconds: float):
+    """Add time spent in a category (db, subprocess, serialize) to the current request."""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[category] += seconds
+
+
+def finish_request(method: str, path: str, status: int, total: float, timings: Dict[str, float]):
+    """Log the request if it exceeded the slow request threshold."""
+    total_ms = total * 1000
+    if total_ms < SLOW_REQUEST_MS:
+        return
+    breakdown = {
+        "db_ms": round(timings["db"] * 1000, 1),
+        "subprocess_ms": round(timings["subprocess"] * 1000, 1),
+        "serialize_ms": round(timings["serialize"] * 1000, 1),
+    }
+    breakdown["other_ms"] = round(max(total_ms - sum(breakdown.values()), 0), 1)
+    slow_requests.append({
+        "at": datetime.now().isoformat(),
+        "method": method,
+        "path": path,
+        "status": status,
+        "total_ms": round(total_ms, 1),
+        "queries": int(timings["queries"]),
+        **breakdown
+    })
+    print(
+        f"Slow request: {method} {path} {total_ms:.1f} ms "
+        f"(db {breakdown['db_ms']} ms in {int(timings['queries'])} queries, "
+        f"subprocess {breakdown['subprocess_ms']} ms, serialize {breakdown['serialize_ms']} ms, "
+        f"other {breakdown['other_ms']} ms)"
+    )
+
+
+def instrument_engine(engine):
+    """Attribute SQL time to requests and record slow statements with their query plan."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profile_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["profile_start_time"].pop()
+        record_time("db", duration)
+        record_time("queries", 1)
+
+        if duration * 1000 < SLOW_QUERY_MS:
+            return
+        plan = None
+        if not executemany and statement.lstrip().upper().startswith("SELECT"):
+            try:
+                explain = cursor.connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+                plan = [row[-1] for row in explain.fetchall()]
+            except Exception as e:
+                plan = [f"EXPLAIN failed: {e}"]
+        slow_queries.append({
+            "at": datetime.now().isoformat(),
+            "duration_ms": round(duration * 1000, 1),
+            "statement": statement,
+            "query_plan": plan
+        })
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> str:
+    """Sample the stacks of all threads and return them in collapsed (flamegraph) format.
+
+    Each output line is "thread;outer_function;...;inner_function count", as read by
+    flamegraph.pl, speedscope and similar tools.
+    """
+    seconds = min(seconds, MAX_PROFILE_SECONDS)
+    own_thread = threading.get_ident()
+    counts: Dict[str, int] = {}
+    deadline = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        thread_names = {t.ident: t.name for t in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            stack: List[str] = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            stack.append(thread_names.get(thread_id, str(thread_id)).replace(" ", "_"))
+            key = ";".join(reversed(stack))
+            counts[key] = counts.get(key, 0) + 1
+        time.sleep(interval)
+
+    return "\n".join(f"{stack} {count}" for stack, count in sorted(counts.items())) + "\n"
@@ -0,0 +1,34 @@
+"""
+Response classes for DashBorg
+"""
+import json
+import time
+
+from fastapi.responses import JSONResponse as BaseJSONResponse
+
+from profiling import record_time
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib encoder
+    orjson = None
+
+# Same output as the stdlib path: compact, UTF-8, integer dict keys turned into strings
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS if orjson is not None else 0
+
+
+def dumps(content) -> bytes:
+    """Encode content as compact JSON bytes with the fastest available encoder."""
+    if orjson is not None:
+        return orjson.dumps(content, option=ORJSON_OPTIONS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+class JSONResponse(BaseJSONResponse):
+    """JSONResponse using orjson when installed, reporting its serialization time to the request profiler."""
+
+    def render(self, content) -> bytes:
+        start = time.perf_counter()
+        body = dumps(content)
+        record_time("serialize", time.perf_counter() - start)
+        return body
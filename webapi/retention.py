@@ -0,0 +1,134 @@
+"""
+Retention policy simulation with borg prune's keep rules, run against synced archives
+"""
+import fnmatch
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# borg applies the rules in this order; an archive kept by one rule doesn't count for later ones
+RULES = ("secondly", "minutely", "hourly", "daily", "weekly", "monthly", "yearly")
+
+# Period an archive falls into for each rule (same buckets as borg's strftime patterns)
+PERIODS = {
+    "secondly": lambda t: (t.year, t.month, t.day, t.hour, t.minute, t.second),
+    "minutely": lambda t: (t.year, t.month, t.day, t.hour, t.minute),
+    "hourly": lambda t: (t.year, t.month, t.day, t.hour),
+    "daily": lambda t: (t.year, t.month, t.day),
+    "weekly": lambda t: t.isocalendar()[:2],  # %G-%V
+    "monthly": lambda t: (t.year, t.month),
+    "yearly": lambda t: (t.year,),
+}
+
+# keep_within suffixes, in hours (borg counts a month as 31 days and a year as 365)
+WITHIN_UNITS = {"S": 1 / 3600, "M": 1 / 60, "H": 1, "d": 24, "w": 24 * 7, "m": 24 * 31, "y": 24 * 365}
+
+CHECKPOINT = re.compile(r"\.checkpoint(\.\d+)?\Z")
+
+POLICY_KEYS = ("keep_within",) + tuple(f"keep_{rule}" for rule in RULES)
+
+
+def parse_within(value: str) -> timedelta:
+    """Parse a keep_within interval ("36H", "7d", "2w", "6m", "1y")."""
+    value = str(value).strip()
+    if len(value) < 2 or value[-1] not in WITHIN_UNITS or not value[:-1].isdigit() or int(value[:-1]) <= 0:
+        raise ValueError(f"Invalid keep_within interval: {value!r}")
+    return timedelta(hours=int(value[:-1]) * WITHIN_UNITS[value[-1]])
+
+
+def archive_matcher(pattern: Optional[str]):
+    """Predicate on archive names for a match_archives pattern (shell glob, "sh:" or "re:")."""
+    if not pattern or pattern in ("*", "sh:*"):
+        return lambda name: True
+    if pattern.startswith("re:"):
+        regex = re.compile(pattern[3:])
+        return lambda name: regex.search(name) is not None
+    glob = pattern[3:] if pattern.startswith("sh:") else pattern
+    return lambda name: fnmatch.fnmatchcase(name, glob)
+
+
+def policy_from_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Retention options of a (normalized) borgmatic config."""
+    policy = {key: config[key] for key in POLICY_KEYS if config.get(key) is not None}
+    if config.get("match_archives"):
+        policy["match_archives"] = config["match_archives"]
+    elif config.get("prefix"):  # borgmatic < 1.8
+        policy["match_archives"] = f"{config['prefix']}*"
+    return policy
+
+
+def validate_policy(policy: Dict[str, Any]):
+    """Raise ValueError for policies borg prune would reject."""
+    if not any(policy.get(key) is not None for key in POLICY_KEYS):
+        raise ValueError(f"At least one of {', '.join(POLICY_KEYS)} is required")
+    for rule in RULES:
+        count = policy.get(f"keep_{rule}")
+        if count is not None and (not isinstance(count, int) or isinstance(count, bool) or count < -1):
+            raise ValueError(f"keep_{rule} must be an integer >= -1")
+    if policy.get("keep_within") is not None:
+        parse_within(policy["keep_within"])
+
+
+def prune_split(archives: Sequence[Tuple[int, datetime]], rule: str, count: int, kept_because: Dict[int, Tuple[str, int]]) -> List[int]:
+    """Keep the newest archive of each of the latest count periods (borg's prune_split).
+
+    archives are (index, timestamp) pairs sorted newest first; count -1 means unlimited.
+    If there are fewer periods than count, the oldest archive is kept too ("[oldest]").
+    """
+    keep = []
+    if count == 0:
+        return keep
+    period_of = PERIODS[rule]
+    last = None
+    index = None
+    for index, timestamp in archives:
+        period = period_of(timestamp)
+        if period != last:
+            last = period
+            if index not in kept_because:
+                keep.append(index)
+                kept_because[index] = (rule, len(keep))
+                if len(keep) == count:
+                    break
+    if index is not None and len(keep) < count and index not in kept_because:
+        keep.append(index)
+        kept_because[index] = (f"{rule}[oldest]", len(keep))
+    return keep
+
+
+def simulate_prune(names: Sequence[str], starts: Sequence[datetime], policy: Dict[str, Any], now: Optional[datetime] = None) -> Tuple[Dict[int, Tuple[str, int]], List[int]]:
+    """Apply a retention policy like borg prune does.
+
+    names and starts describe the repository's archives (any order; starts in local time, as
+    synced). Returns the indexes kept with the (rule, number) that kept them, and the indexes
+    that would be pruned. Archives not matching the policy's match_archives are left alone.
+    """
+    matches = archive_matcher(policy.get("match_archives"))
+    candidates = sorted(
+        (index for index in range(len(names)) if matches(names[index]) and starts[index] is not None),
+        key=lambda index: starts[index],
+        reverse=True
+    )
+
+    # The latest checkpoint survives unless a complete archive was made after it
+    checkpoints = [index for index in candidates if CHECKPOINT.search(names[index])]
+    kept_because: Dict[int, Tuple[str, int]] = {}
+    if checkpoints and candidates[0] == checkpoints[0]:
+        kept_because[checkpoints[0]] = ("checkpoint", 1)
+    checkpoint_set = set(checkpoints)
+    archives = [(index, starts[index]) for index in candidates if index not in checkpoint_set]
+
+    if policy.get("keep_within") is not None:
+        target = (now or datetime.now()) - parse_within(policy["keep_within"])
+        kept = 0
+        for index, timestamp in archives:
+            if timestamp > target:
+                kept += 1
+                kept_because[index] = ("within", kept)
+    for rule in RULES:
+        count = policy.get(f"keep_{rule}")
+        if count is not None:
+            prune_split(archives, rule, count, kept_because)
+
+    pruned = [index for index in candidates if index not in kept_because]
+    return kept_because, pruned
@@ -0,0 +1,115 @@
+"""
+Single-flight execution: concurrent identical calls share one run and its result
+
+Calls are keyed by (operation, config). A call made while an identical one is running waits for
+that run instead of starting borg again, so it doesn't contend for the repository lock or insert
+the same rows twice. Deduplication is per process.
+"""
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from metrics import SINGLE_FLIGHT_CALLS
+
+# Single-flight settings
+SINGLE_FLIGHT_MAX_AGE = float(os.getenv("DASHBORG_SINGLE_FLIGHT_MAX_AGE", "300"))  # seconds a result can be reused with fresh_within
+
+
+class _Call:
+    """One run of a keyed function, with the callers waiting for it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.started = time.monotonic()
+        self.waiters = 0
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; identical calls made meanwhile get its result (or exception).
+
+    Successful results are kept for SINGLE_FLIGHT_MAX_AGE so callers passing fresh_within can
+    reuse one that finished recently enough. forget() drops them when a repository changes.
+    """
+
+    def __init__(self, max_age: float = SINGLE_FLIGHT_MAX_AGE):
+        self.max_age = max_age
+        self._calls: Dict[Hashable, _Call] = {}
+        self._recent: Dict[Hashable, Tuple[float, Any]] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Tuple[Hashable, ...], fn: Callable[[], Any], fresh_within: Optional[float] = None) -> Tuple[Any, Dict[str, Any]]:
+        """Result of fn() for key and how it was obtained.
+
+        The second value tells whether this call ran fn ("run"), joined a run already in flight
+        ("joined") or reused a result at most fresh_within seconds old ("fresh"), and how many
+        calls were coalesced into the run.
+        """
+        operation = key[0]
+        now = time.monotonic()
+        with self._lock:
+            if fresh_within:
+                recent = self._recent.get(key)
+                if recent is not None and now - recent[0] <= min(fresh_within, self.max_age):
+                    self._count(operation, "fresh")
+                    return recent[1], {"source": "fresh", "age_seconds": round(now - recent[0], 3), "coalesced": 0}
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+            self._count(operation, "run" if leader else "joined")
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, {"source": "joined", "waited_seconds": round(time.monotonic() - now, 3), "coalesced": call.waiters}
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]  # Later calls start a new run
+                if call.error is None:
+                    self._recent[key] = (time.monotonic(), call.result)
+            call.done.set()
+        return call.result, {"source": "run", "duration_seconds": round(time.monotonic() - call.started, 3), "coalesced": call.waiters}
+
+    def _count(self, operation: str, outcome: str):
+        counts = self._counts.setdefault(operation, {"run": 0, "joined": 0, "fresh": 0})
+        counts[outcome] += 1
+        SINGLE_FLIGHT_CALLS.inc(operation=operation, outcome=outcome)
+
+    def forget(self, config_file: Optional[str] = None):
+        """Drop kept results for a config (and those of calls not bound to one), or all of them."""
+        with self._lock:
+            for key in list(self._recent):
+                if config_file is None or len(key) < 2 or key[1] in (config_file, None):
+                    del self._recent[key]
+
+    def status(self) -> Dict[str, Any]:
+        """Calls in flight with their waiters, and per-operation counts since this process started."""
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, (finished, _) in self._recent.items() if now - finished > self.max_age]:
+                del self._recent[key]
+            return {
+                "in_flight": [
+                    {"operation": key[0], "key": list(key[1:]), "running_seconds": round(now - call.started, 3), "waiters": call.waiters}
+                    for key, call in self._calls.items()
+                ],
+                "kept_results": len(self._recent),
+                "max_age_seconds": self.max_age,
+                "operations": {
+                    operation: {**counts, "coalesced": counts["joined"] + counts["fresh"]}
+                    for operation, counts in self._counts.items()
+                }
+            }
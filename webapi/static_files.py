@@ -0,0 +1,109 @@
+"""
+Static web UI serving: precompressed variants, long-lived caching of hashed assets, in-memory index.html
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Dict, Optional, Tuple
+
+from fastapi.responses import Response
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse
+
+try:
+    import brotli
+except ImportError:  # index.html is then offered gzipped only
+    brotli = None
+
+# Preferred order when the client accepts several encodings
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# Vite puts a content hash in every file name under /assets, so they never change
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+def accepted_encodings(accept_encoding: str) -> set:
+    """Encodings from an Accept-Encoding header, leaving out those with q=0."""
+    encodings = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if name and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves file.br / file.gz written by precompress.py when the client accepts them."""
+
+    def __init__(self, *args, cache_control: str = REVALIDATE_CACHE_CONTROL, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = cache_control
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        response = None
+        has_variants = False
+        for encoding, suffix in ENCODINGS:
+            try:
+                variant_stat = os.stat(f"{full_path}{suffix}")
+            except OSError:
+                continue
+            has_variants = True
+            if encoding in accepted and response is None:
+                response = FileResponse(
+                    f"{full_path}{suffix}",
+                    status_code=status_code,
+                    stat_result=variant_stat,
+                    # Type of the original file, not of the .gz/.br
+                    media_type=mimetypes.guess_type(str(full_path))[0] or "application/octet-stream",
+                    headers={"Content-Encoding": encoding}
+                )
+        if response is None:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        if has_variants:
+            response.headers["Vary"] = "Accept-Encoding"
+        response.headers["Cache-Control"] = self.cache_control
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+class IndexPage:
+    """index.html held in memory (with compressed variants), served with an ETag for cheap revalidation."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._variants: Optional[Dict[str, Tuple[bytes, str]]] = None
+
+    def _load(self) -> Dict[str, Tuple[bytes, str]]:
+        with open(self.path, "rb") as f:
+            body = f.read()
+        etag = hashlib.sha256(body).hexdigest()[:32]
+        variants = {
+            "identity": (body, f'"{etag}"'),
+            "gzip": (gzip.compress(body, compresslevel=9, mtime=0), f'"{etag}-gzip"'),
+        }
+        if brotli is not None:
+            variants["br"] = (brotli.compress(body, quality=11), f'"{etag}-br"')
+        return variants
+
+    def response(self, request_headers: Headers) -> Response:
+        if self._variants is None:
+            self._variants = self._load()
+        accepted = accepted_encodings(request_headers.get("accept-encoding", ""))
+        encoding = next((name for name, _ in ENCODINGS if name in accepted and name in self._variants), "identity")
+        body, etag = self._variants[encoding]
+
+        headers = {"ETag": etag, "Cache-Control": REVALIDATE_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]):
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type="text/html", headers=headers)
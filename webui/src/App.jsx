@@ -1021,6 +1021,39 @@ export default function App() {
                         </div>
                       </div>
                     )}
+
+                    {/* Check Coverage Section */}
+                    {dashboardStats && dashboardStats.check_coverage && dashboardStats.check_coverage.length > 0 && (
+                      <div className="mb-8">
+                        <h3 className="text-xl font-semibold text-white mb-4">Consistency Checks</h3>
+                        <div className="grid grid-cols-1 md:grid-cols-2 gap-4">
+                          {dashboardStats.check_coverage.map(check => (
+                            <div key={check.location} className="bg-gray-700 p-4 rounded-lg">
+                              <div className="flex items-start justify-between mb-2">
+                                <div className="text-white font-semibold">{check.repository}</div>
+                                <span className="text-xs bg-gray-600 px-2 py-1 rounded text-gray-300">
+                                  {check.full_passes} full passes
+                                </span>
+                              </div>
+                              <div className="w-full bg-gray-600 rounded h-2 mb-2">
+                                <div
+                                  className={`h-2 rounded ${check.last_status === "failed" ? "bg-red-500" : "bg-green-500"}`}
+                                  style={{ width: `${Math.min(check.percent_verified || 0, 100)}%` }}
+                                />
+                              </div>
+                              <div className="text-xs text-gray-400">
+                                {(check.percent_verified || 0).toFixed(1)}% of current pass verified
+                              </div>
+                              <div className="text-xs text-gray-400 mt-1">
+                                Last full pass: {check.hours_since_full_pass !== null
+                                  ? `${check.hours_since_full_pass < 48 ? `${check.hours_since_full_pass.toFixed(0)} hours` : `${(check.hours_since_full_pass / 24).toFixed(0)} days`} ago`
+                                  : "never"}
+                              </div>
+                            </div>
+                          ))}
+                        </div>
+                      </div>
+                    )}
                   </>
                 )}
               </div>